@@ -4,6 +4,26 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
 from linuxnano.message_box import MessageBox
 import copy
+import numpy as np
+
+
+class AnalogStateClassifier():
+    '''Every analog channel's state thresholds in one array, padded with +inf, so a block of values
+       is classified in one pass.  A value's state is the number of thresholds it is >= to.
+    '''
+    def __init__(self, models):
+        thresholds = [model.thresholds() for model in models]
+        width = max([len(row) for row in thresholds] + [1])
+
+        self._thresholds = np.full((len(models), width), np.inf)
+        for channel, row in enumerate(thresholds):
+            self._thresholds[channel, :len(row)] = row
+
+    def classify(self, values):
+        '''values is channels or samples x channels, returns the state indexes in the same shape'''
+        values = np.asarray(values, dtype=np.float64)
+        return np.count_nonzero(values[..., np.newaxis] >= self._thresholds, axis=-1)
+
 
 
 class AnalogStateTableModel(QtCore.QAbstractTableModel):
@@ -227,6 +247,13 @@ class AnalogStateTableModel(QtCore.QAbstractTableModel):
     def numberOfStates(self):
         return self._number_of_states
 
+    def thresholds(self):
+        '''The sorted greater_than values of states 1 and up'''
+        return np.array([row[self.greaterThanColumn()] for row in self._data[1:]], dtype=np.float64)
+
+    def stateFromValue(self, value):
+        return int(np.searchsorted(self.thresholds(), value, side='right'))
+
     def setNumberOfStates(self, num_states):
 
         if not num_states in [1,2,3,4]:
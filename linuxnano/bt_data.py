@@ -6,11 +6,14 @@ from linuxnano.message_box import MessageBox
 import json
 
 class Node:
+    _schemas = {} #{class: [(name, property)]}, the properties saved to and loaded from JSON
+
     def __init__(self, parent=None):
         super().__init__()
 
         self._parent = parent
         self._children = []
+        self._row = 0 #Position in the parent's children, kept by the parent
 
         self._x_pos = 80
         self._y_pos = 0
@@ -19,12 +22,12 @@ class Node:
             parent.addChild(self)
 
     def loadAttrs(self, data):
+        key, value = None, None
         try:
-            #Get all the attributes of the node
-            attrs = iter(self.attrs().items())
-            for key, value in attrs:
+            for key, prop in self.schema():
                 if key in data:
-                    setattr(self, key, data[key])
+                    value = data[key]
+                    setattr(self, key, value)
 
         except Exception as e:
             MessageBox("Error setting attribute", e, key, value)
@@ -33,9 +36,8 @@ class Node:
         data = {"type_info": o.typeInfo(),
                 "children" : o.children()}
 
-        attrs = iter(o.attrs().items())
-        for key, value in attrs:
-            data[key] = value
+        for key, prop in o.schema():
+            data[key] = prop.fget(o)
 
         return data
 
@@ -43,15 +45,21 @@ class Node:
         data = json.dumps(self, default=self.convertToDict,  sort_keys=True, indent=4)
         return data
 
-    def attrs(self):
-        kv = {}
+    @classmethod
+    def schema(cls):
+        '''Every property of the class in save order, found once per class and reused'''
+        if cls not in Node._schemas:
+            props = {}
+            for klass in cls.__mro__:
+                for k, v in sorted(klass.__dict__.items()):
+                    if isinstance(v, property) and k not in props:
+                        props[k] = v
+            Node._schemas[cls] = list(props.items())
 
-        my_classes = self.__class__.__mro__
-        for cls in my_classes:
-            for k, v in sorted(iter(cls.__dict__.items())):
-                if isinstance(v, property):
-                    kv[k] = v.fget(self)
-        return kv
+        return Node._schemas[cls]
+
+    def attrs(self):
+        return {key: prop.fget(self) for key, prop in self.schema()}
 
     def typeInfo(self):
         return 'root'
@@ -66,6 +74,7 @@ class Node:
         return self._children[row]
 
     def addChild(self, child):
+        child._row = len(self._children)
         self._children.append(child)
         child._parent = self
 
@@ -75,6 +84,7 @@ class Node:
 
         self._children.insert(position, child)
         child._parent = self
+        self.renumberChildren(position)
         return True
 
     def children(self):
@@ -89,12 +99,21 @@ class Node:
 
         child = self._children.pop(position)
         child._parent = None
+        self.renumberChildren(position)
 
         return True
 
+    def renumberChildren(self, start=0):
+        '''Each child caches its row, the children from start on moved'''
+        for row in range(start, len(self._children)):
+            self._children[row]._row = row
+
     def row(self):
         if self._parent is not None:
-            return self._parent._children.index(self)
+            siblings = self._parent._children
+            if self._row >= len(siblings) or siblings[self._row] is not self:
+                self._parent.renumberChildren()
+            return self._row
 
     def data(self, column):
         if   column is 0: return self.typeInfo()
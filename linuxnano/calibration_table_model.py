@@ -8,7 +8,110 @@ import linuxnano.strings
 import copy
 import numpy as np
 import itertools
-from scipy.interpolate import interp1d
+from scipy.interpolate import CubicSpline
+
+
+
+class CalibrationTransform():
+    '''A calibration table compiled for converting whole arrays at once
+        - 'linear'       : Piecewise linear between the points
+        - 'cubic_spline' : Cubic spline through the points, the inverse solves the spline for each value
+
+       Values outside the table are held at its end points in both directions.
+    '''
+    def __init__(self, hal_values, gui_values, scale_type='linear'):
+        self._hal = np.asarray(hal_values, dtype=np.float64)
+        self._gui = np.asarray(gui_values, dtype=np.float64)
+        self._scale_type = scale_type
+
+        #GUI values can be decreasing, the inverse needs them increasing
+        order = np.argsort(self._gui)
+        self._inverse_gui = self._gui[order]
+        self._inverse_hal = self._hal[order]
+
+        if scale_type == 'cubic_spline':
+            self._spline = CubicSpline(self._hal, self._gui)
+
+    def scaleType(self):
+        return self._scale_type
+
+    def halValues(self):
+        return self._hal
+
+    def guiValues(self):
+        return self._gui
+
+    def __call__(self, raw):
+        '''HAL values to GUI values'''
+        raw = np.clip(np.asarray(raw, dtype=np.float64), self._hal[0], self._hal[-1])
+        if self._scale_type == 'cubic_spline':
+            return self._spline(raw)
+        return np.interp(raw, self._hal, self._gui)
+
+    def inverse(self, values):
+        '''GUI values to HAL values, for outputs'''
+        values = np.clip(np.asarray(values, dtype=np.float64), self._inverse_gui[0], self._inverse_gui[-1])
+        linear = np.interp(values, self._inverse_gui, self._inverse_hal)
+
+        if self._scale_type == 'cubic_spline':
+            #Outputs are set a value at a time so solving is fine, the linear value is kept if there's no root
+            flat = linear.reshape(-1)
+            for i, value in enumerate(values.reshape(-1)):
+                roots = self._spline.solve(value, extrapolate=False)
+                if len(roots):
+                    flat[i] = roots[np.argmin(np.abs(roots - flat[i]))]
+            return flat.reshape(linear.shape)
+
+        return linear
+
+
+
+class CalibrationBank():
+    '''Many calibration tables stacked end to end so a samples x channels block of HAL values converts to
+       GUI values in one pass.  Values outside a table are held at its end points.
+       Cubic spline channels are evaluated by their own transform after the linear pass.
+    '''
+    def __init__(self, models, scale_types=None):
+        scale_types = scale_types if scale_types is not None else ['linear']*len(models)
+        self._transforms = [model.transform(scale_type) for model, scale_type in zip(models, scale_types)]
+        self._spline_channels = [(channel, transform) for channel, transform in enumerate(self._transforms) if transform.scaleType() != 'linear']
+
+        #Every table's points back to back with channel c's HAL values scaled into [c, c+0.5].  The keys rise
+        #across all the tables, so one np.interp over them converts every channel
+        hal_values = [np.asarray(transform.halValues(), dtype=np.float64) for transform in self._transforms]
+        self._low = np.array([hal[0] for hal in hal_values])
+        self._scale = np.array([0.5/(hal[-1] - hal[0]) if hal[-1] > hal[0] else 0.0 for hal in hal_values])
+        self._offset = np.arange(len(self._transforms), dtype=np.float64)
+        self._keys = np.concatenate([self._keyOf(hal, channel) for channel, hal in enumerate(hal_values)] + [np.zeros(0)])
+        self._gui = np.concatenate([np.asarray(transform.guiValues(), dtype=np.float64) for transform in self._transforms] + [np.zeros(0)])
+
+        #Exact end keys, values past a table's ends must hold its end points and not lean toward the next table
+        ends = np.cumsum([len(hal) for hal in hal_values], dtype=np.int64) - 1
+        self._keys[ends] = np.where(self._scale > 0.0, self._offset + 0.5, self._offset)
+
+    def _keyOf(self, hal, channel):
+        return self._offset[channel] + np.minimum(np.maximum((hal - self._low[channel])*self._scale[channel], 0.0), 0.5)
+
+    def __len__(self):
+        return len(self._transforms)
+
+    def halToGui(self, raw):
+        '''raw is samples x channels, returns the GUI values in the same shape'''
+        raw = np.asarray(raw, dtype=np.float64)
+        if len(self._keys) == 0:
+            return np.zeros(raw.shape)
+
+        #Transposed so np.interp goes channel by channel, each search starts where the last one ended
+        gui = np.interp(self._keyOf(raw, slice(None)).T, self._keys, self._gui).T
+
+        for channel, transform in self._spline_channels:
+            gui[..., channel] = transform(raw[..., channel])
+
+        return gui
+
+    def guiToHal(self, channel, value):
+        '''Inverse for a single output value'''
+        return float(self._transforms[channel].inverse(value))
 
 
 
@@ -32,11 +135,36 @@ class CalibrationTableModel(QtCore.QAbstractTableModel):
         self._data  = [[0.0, 0.0],
                        [10.0, 1000]]
 
+        #Compiled transforms by scale type, any edit drops them
+        self._transforms = {}
+        self.dataChanged.connect(self.clearTransforms)
+        self.modelReset.connect(self.clearTransforms)
+        self.rowsInserted.connect(self.clearTransforms)
+        self.rowsRemoved.connect(self.clearTransforms)
+
+
 
+    def clearTransforms(self, *args):
+        self._transforms = {}
+
+    def transform(self, scale_type='linear'):
+        '''Returns the cached CalibrationTransform for this table, 'linear' or 'cubic_spline' '''
+        transform = self._transforms.get(scale_type)
+        if transform is None:
+            transform = CalibrationTransform(self.halValues(), self.guiValues(), scale_type)
+            self._transforms[scale_type] = transform
+
+        return transform
 
     def halValueColumn(self):
         return 0
 
+    def halValues(self):
+        return np.array([row[0] for row in self._data], dtype=np.float64)
+
+    def guiValues(self):
+        return np.array([row[1] for row in self._data], dtype=np.float64)
+
     def guiValueColumn (self):
         return 1
 
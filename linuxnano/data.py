@@ -28,10 +28,13 @@ import copy
 import itertools
 import numpy as np
 
-from queue import Queue, Empty
+from queue import Empty
+from threading import Lock
 
 def clamp(n, smallest, largest): return max(smallest, min(n, largest))
 
+NAME_FILTER = re.compile(r'[^a-zA-Z0-9_-]') #Characters stripped from node names
+
 
 def str2bool(v):
   return v.lower() in ("yes", "true", "t", "1")
@@ -63,6 +66,8 @@ def enum(enumerated):
 
 
 class Node(object):
+    _schemas = {} #{class: [(name, property)]}, the properties saved to and loaded from XML
+
     def __init__(self, parent=None):
         super().__init__()
 
@@ -70,23 +75,36 @@ class Node(object):
         self._description = ''
         self._children = []
         self._parent = parent
+        self._row = 0 #Position in the parent's children, kept by the parent
+        self._child_names = {}   #{name: child} for unique sibling names
 
         if parent is not None:
             parent.addChild(self)
 
 
-    def attrs(self):
-        myClasses = self.__class__.__mro__
+    @classmethod
+    def schema(cls):
+        '''Every property of the class in save order, found once per class and reused'''
+        if cls not in Node._schemas:
+            props = {}
+            for klass in cls.__mro__:
+                for k, v in sorted(klass.__dict__.items()):
+                    if isinstance(v, property) and k not in props:
+                        props[k] = v
+            Node._schemas[cls] = list(props.items())
 
-        kv = {}
+        return Node._schemas[cls]
 
-        for cls in myClasses:
-            for k, v in sorted(iter(cls.__dict__.items())):
-                if isinstance(v, property):
-                    #print "Property:", k.rstrip("_"), "\n\tValue:", v.fget(self)
-                    kv[k] = v.fget(self)
+    def attrs(self):
+        return {key: prop.fget(self) for key, prop in self.schema()}
 
-        return kv
+    def xmlAttrs(self):
+        '''Yields (key, value) of each attribute ready for setAttribute, lists are saved as their str'''
+        for key, prop in self.schema():
+            value = prop.fget(self)
+            if isinstance(value, list):
+                value = str(value)
+            yield key, value
 
 
     def asXml(self):
@@ -96,10 +114,7 @@ class Node(object):
         node = doc.createElement(self.typeInfo())
         doc.appendChild(node)
 
-        attrs = self.attrs().items()
-        for key, value in attrs:
-            if isinstance(value, list):
-                value = str(value)
+        for key, value in self.xmlAttrs():
             node.setAttribute(key, value)
 
         for i in self._children:
@@ -112,12 +127,7 @@ class Node(object):
         node = doc.createElement(self.typeInfo())
         parent.appendChild(node)
 
-        attrs = self.attrs().items()
-
-        for key, value in attrs:
-            if isinstance(value, list):
-                value = str(value)
-
+        for key, value in self.xmlAttrs():
             node.setAttribute(key, value)
 
         for i in self._children:
@@ -125,11 +135,10 @@ class Node(object):
 
 
     def loadAttribFromXML(self, xml_tree):
+        '''Only the attributes in the XML are set, the setters parse the strings'''
+        key, value = None, None
         try:
-            #Get all the attributes of the node
-            attrs = iter(self.attrs().items())
-
-            for key, value in attrs:
+            for key, prop in self.schema():
                 if key in xml_tree.attrib:
                     value = xml_tree.attrib[key]
                     setattr(self, key, value)
@@ -146,6 +155,7 @@ class Node(object):
         return self._children[row]
 
     def addChild(self, child):
+        child._row = len(self._children)
         self._children.append(child)
         child._parent = self
         child.name = child.name
@@ -156,6 +166,7 @@ class Node(object):
 
         self._children.insert(position, child)
         child._parent = self
+        self.renumberChildren(position)
         child.name = child.name
         return True
 
@@ -172,15 +183,40 @@ class Node(object):
 
         child = self._children.pop(position)
         child._parent = None
+        self.renumberChildren(position)
+        self.releaseChildName(child, child._name)
 
         return True
 
     def parent(self):
         return self._parent
 
+    def uniqueChildName(self, child, value):
+        '''Returns value with _new added until no other child has it, names child already has are free'''
+        while self._child_names.get(value, child) is not child:
+            value += '_new'
+        return value
+
+    def renameChild(self, child, old_name, new_name):
+        if old_name != new_name:
+            self.releaseChildName(child, old_name)
+        self._child_names[new_name] = child
+
+    def releaseChildName(self, child, name):
+        if self._child_names.get(name) is child:
+            del self._child_names[name]
+
+    def renumberChildren(self, start=0):
+        '''Each child caches its row, the children from start on moved'''
+        for row in range(start, len(self._children)):
+            self._children[row]._row = row
+
     def row(self):
         if self._parent is not None:
-            return self._parent._children.index(self)
+            siblings = self._parent._children
+            if self._row >= len(siblings) or siblings[self._row] is not self:
+                self._parent.renumberChildren()
+            return self._row
 
     def data(self, column):
         if   column is 0: return self.name
@@ -200,22 +236,14 @@ class Node(object):
         def fset(self,value):
 
             '''Sibling names must be unique, only allowing alpha numeric, _ and - for now'''
-            value = str(value)
-            value = re.sub(r'[^a-zA-Z0-9_-]', '',value)
+            value = NAME_FILTER.sub('', str(value))
 
             if self.parent() == None:
                 self._name = value
 
             else:
-                sibling_names = []
-
-                for child in self.parent().children():
-                    if child != self:
-                        sibling_names.append(child.name)
-
-                while value in sibling_names:
-                    value = value + "_new"
-
+                value = self.parent().uniqueChildName(self, value)
+                self.parent().renameChild(self, self._name, value)
                 self._name = value
 
 
@@ -303,6 +331,7 @@ class DeviceNode(Node):
         self._device_state_table_model = DeviceStateTableModel()
         self._status = ''
         self._state = 0
+        self._state_weights = [] #[(hal_node, radix weight)], rebuilt by halNodeChanged
 
     def typeInfo(self):
         return strings.DEVICE_NODE
@@ -323,18 +352,18 @@ class DeviceNode(Node):
         return self._device_state_table_model
 
     def stateFromChildren(self):
-        #returns the current state of the device
-        #first reads all child nodes then lookups state in DeviceStateTable
+        #returns the current state of the device, the row of the DeviceStateTable
         state = 0
-        bit_weight = 1
-
-        for child in self._children:
-            if child.typeInfo() in [strings.D_IN_NODE, strings.D_OUT_NODE, strings.A_IN_NODE, strings.A_OUT_NODE]:
-                state += bit_weight * child.state()
-                bit_weight *=  len(child.states)
+        for child, weight in self._state_weights:
+            state += weight * child.state()
 
         return state
 
+    def stateWeights(self):
+        '''[(hal_node, weight)], the state is the sum of each HAL node's state times its weight.  A node's
+           weight is the product of the number of states of the HAL nodes before it'''
+        return self._state_weights
+
     def iconLayer(self):
         #this returns the current icon layer
         return self.deviceStateTableModel().iconLayerFromState(self._state)
@@ -345,10 +374,14 @@ class DeviceNode(Node):
 
     def halNodeChanged(self):
         states = []
+        self._state_weights = []
+        bit_weight = 1
 
         for child in self._children:
             if child.typeInfo() in [strings.D_IN_NODE, strings.D_OUT_NODE, strings.A_IN_NODE, strings.A_OUT_NODE]:
                 states.append((child.name, child.states))
+                self._state_weights.append((child, bit_weight))
+                bit_weight *= len(child.states)
 
         model = self.deviceStateTableModel()
         model.setNodeStates(states)
@@ -589,6 +622,46 @@ class DeviceIconNode(Node):
 
 
 
+class OutputCommands():
+    '''One channel for the manual output commands of a tool's HalNodes, keyed by node so only the newest
+       command to an output within a tick is kept.  An idle tick's take() is just an empty check.  Each
+       ToolModel owns one and hands it to its HAL nodes.
+    '''
+    def __init__(self):
+        self._pending = {}
+        self._lock = Lock()
+
+    def put(self, node, value):
+        with self._lock:
+            self._pending[node] = value
+
+    def pop(self, node):
+        with self._lock:
+            return self._pending.pop(node)
+
+    def take(self):
+        '''Returns and clears {node: value} for every node with a command waiting'''
+        if not self._pending:
+            return {}
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def __len__(self):
+        return len(self._pending)
+
+
+
+class NodeSettings(QtCore.QObject):
+    '''Signals that a HAL node setting used only when reading HAL changed, such as debounce, hysteresis, reduction
+       or scale type.  These don't change the device's truth table, so the device state table is left alone and
+       only the HalReader's routes are rebuilt.  Each ToolModel owns one and hands it to its HAL nodes.
+    '''
+    changed = QtCore.pyqtSignal(object) #The node
+
+
+
 class HalNode(Node):
     '''Common to all IO nodes
         All IO Nodes have:
@@ -597,6 +670,9 @@ class HalNode(Node):
 
             - state_table_model : This table does the conversion between state (True/False) and the 'value' string
             - state_table_data : This property is used to load and save state table model
+
+            - debounce      : A new value/state has to be seen this long before the model takes it, 0 is off
+            - debounce_unit : 'samples' or 'ms'
     '''
     hal_pins = ['None']
     def __init__(self, parent=None):
@@ -606,8 +682,11 @@ class HalNode(Node):
         self._sampler_pins = []
         self._streamer_pins = []
         self._hal_sampler_pin_id = None #HalNode.hal_sampler_pin_count
+        self._debounce = 0
+        self._debounce_unit = strings.DEBOUNCE_UNITS.names[0]
+        self._node_settings = None   #The NodeSettings of the ToolModel this node is in
+        self._output_commands = None #The OutputCommands of the ToolModel this node is in, its own when it's in none
         #HalNode.hal_sampler_pin_count += 1
-        self._manual_queue = Queue()
 
 
     def typeInfo(self):
@@ -623,6 +702,24 @@ class HalNode(Node):
         self.stateTableModel().setAllowedHalPins(self.__class__.hal_pins)
         self.parent().halNodeChanged()
 
+    def nodeSettings(self):
+        return self._node_settings
+
+    def setNodeSettings(self, value):
+        self._node_settings = value
+
+    def outputCommands(self):
+        if self._output_commands is None:
+            self._output_commands = OutputCommands()
+        return self._output_commands
+
+    def setOutputCommands(self, value):
+        self._output_commands = value
+
+    def settingsChanged(self):
+        if self._node_settings is not None:
+            self._node_settings.changed.emit(self)
+
     def data(self, column):
         r = super().data(column)
         if column is 10: r = self.stateTableModel()
@@ -649,21 +746,15 @@ class HalNode(Node):
 
         def fset(self,value):
             '''Sibling names must be unique, only allowing alpha numeric, _ and - for now'''
-            value = str(value)
-            value = re.sub(r'[^a-zA-Z0-9_-]', '',value)
-
-            sibling_names = []
+            value = NAME_FILTER.sub('', str(value))
 
             try:
-                for child in self.parent().children():
-                    if child != self:
-                        sibling_names.append(child.name)
-
-                while value in sibling_names:
-                    value = value + "_new"
+                value = self.parent().uniqueChildName(self, value)
+                self.parent().renameChild(self, self._name, value)
 
-                self._name = value
-                self.parent().halNodeChanged()
+                if value != self._name:
+                    self._name = value
+                    self.parent().halNodeChanged()
 
 
             except Exception as e:
@@ -705,11 +796,41 @@ class HalNode(Node):
         self._streamer_pins = value
 
 
+    def debounce():
+        def fget(self): return self._debounce
+        def fset(self, value):
+            value = max(0, int(value))
+            if value != self._debounce:
+                self._debounce = value
+                self.settingsChanged()
+        return locals()
+    debounce = property(**debounce())
+
+    def debounceUnit():
+        def fget(self): return self._debounce_unit
+        def fset(self, value):
+            if value in strings.DEBOUNCE_UNITS.names and value != self._debounce_unit:
+                self._debounce_unit = value
+                self.settingsChanged()
+        return locals()
+    debounceUnit = property(**debounceUnit())
+
+    def debounceSamples(self, sample_period):
+        '''Number of samples in a row a new value needs, sample_period is the sampler's period in seconds'''
+        if self._debounce_unit == 'ms':
+            return int(math.ceil(self._debounce/1000.0/sample_period))
+        return self._debounce
+
+
     def manualQueueGet(self):
-        return self._manual_queue.get_nowait()
+        '''Takes this node's waiting command, raises queue.Empty if there isn't one'''
+        try:
+            return self.outputCommands().pop(self)
+        except KeyError:
+            raise Empty
 
     def manualQueuePut(self, value):
-        self._manual_queue.put_nowait(value)
+        self.outputCommands().put(self, value)
 
 
 
@@ -891,15 +1012,25 @@ class AnalogInputNode(HalNode):
             - calibration_table_model : Calibration of analog signal to HAL numbers
             - calibration_table_data : This property is used to load and save cal data
 
+            - hal_pin : The float/s32 hal pin sampled for this input
+
             - units
             - display_digits
             - display_scientific : If true use scientific notation
             - scale_type : Linear or cubic spline for signal calibration
+            - hysteresis : Width of the band around each state threshold, in GUI units
+            - reduction  : How the samples in a tick become the value, last, mean, median, min, max or ema
+            - ema_alpha  : Weight of each new sample for the ema reduction
     '''
+    hal_pins = ['None']
     def __init__(self, parent=None):
         super().__init__(parent)
         self._name = 'Analog_Input_Node'
+        self._hal_pin = 'None'
+        self._state = 0
         self._state_table_model = AnalogStateTableModel()
+        self._state_table_model.dataChanged.connect(self.stateTableChanged)
+        self._state_table_model.modelReset.connect(self.stateTableChanged)
 
         self._calibration_table_model = CalibrationTableModel()
         self._calibration_table_model.dataChanged.connect(self.calibrationTableChanged)
@@ -910,6 +1041,9 @@ class AnalogInputNode(HalNode):
         self._display_digits     = strings.A_IN_DISPLAY_DIGITS_DEFAULT
         self._display_scientific = False
         self._scale_type         = strings.ANALOG_SCALE_TYPES.names[0]  #Linear or cubic_spline
+        self._hysteresis         = 0.0
+        self._reduction          = strings.ANALOG_REDUCTION_TYPES.names[0]
+        self._ema_alpha          = 0.5
         self._value = 3.40
 
     def typeInfo(self):
@@ -924,6 +1058,14 @@ class AnalogInputNode(HalNode):
     def numberOfStates(self):
         return self._state_table_model.rowCount()
 
+    def state(self):
+        '''Index of the state table row the value is in, set by the HalReader each tick'''
+        return self._state
+
+    def stateTableChanged(self):
+        if self.parent() is not None:
+            self.parent().halNodeChanged()
+
     def calibrationTableModel(self):
         return self._calibration_table_model
 
@@ -936,6 +1078,7 @@ class AnalogInputNode(HalNode):
         elif column is 24: r = self.displayScientific
         elif column is 25: r = strings.ANALOG_SCALE_TYPES.names.index(self.scaleType) #FIXME
         elif column is 30: r = self._value
+        elif column is 31: r = self._state
 
         return r
 
@@ -949,6 +1092,7 @@ class AnalogInputNode(HalNode):
         elif column is 24: self.displayScientific = value
         elif column is 25: self.scaleType         = strings.ANALOG_SCALE_TYPES.names[value] #FIXME
         elif column is 30: self._value            = value
+        elif column is 31: self._state            = value
 
 
     def units():
@@ -977,17 +1121,80 @@ class AnalogInputNode(HalNode):
     def scaleType():
         def fget(self): return self._scale_type
         def fset(self, value):
-            if value in strings.ANALOG_SCALE_TYPES.names:
+            if value in strings.ANALOG_SCALE_TYPES.names and value != self._scale_type:
                 self._scale_type = value
+                self.settingsChanged()
         return locals()
     scaleType = property(**scaleType())
 
+    def hysteresis():
+        def fget(self): return self._hysteresis
+        def fset(self, value):
+            value = max(0.0, float(value))
+            if value != self._hysteresis:
+                self._hysteresis = value
+                self.settingsChanged()
+        return locals()
+    hysteresis = property(**hysteresis())
+
+    def reduction():
+        def fget(self): return self._reduction
+        def fset(self, value):
+            if value in strings.ANALOG_REDUCTION_TYPES.names and value != self._reduction:
+                self._reduction = value
+                self.settingsChanged()
+        return locals()
+    reduction = property(**reduction())
+
+    def emaAlpha():
+        def fget(self): return self._ema_alpha
+        def fset(self, value):
+            value = clamp(float(value), 0.001, 1.0)
+            if value != self._ema_alpha:
+                self._ema_alpha = value
+                self.settingsChanged()
+        return locals()
+    emaAlpha = property(**emaAlpha())
+
+    def calibration(self):
+        '''The calibration table compiled for this node's scale type'''
+        return self._calibration_table_model.transform(self._scale_type)
+
+    def halPin():
+        def fget(self): return self._hal_pin
+        def fset(self, value):
+            value = str(value) if value else 'None'
+            if value != self._hal_pin:
+                self._hal_pin = value
+                self.settingsChanged()
+        return locals()
+    halPin = property(**halPin())
+
+    def signals(self):
+        return [self.parent().parent().name + '.' + self.parent().name + '.' + self.name]
+
+    def value(self):
+        return self._value
+
     def calibrationTableChanged(self):
         try:
             self.parent().halNodeChanged()
         except Exception as e:
             MessageBox("Failed when changing calibration table", e)
 
+    def stateTableData():
+        def fget(self):
+            return self.stateTableModel().dataArray()
+
+        def fset(self, value):
+            try:
+                self.stateTableModel().setDataArray(ast.literal_eval(value))
+            except Exception as e:
+                MessageBox("Malformed analog state table data", e, value)
+
+        return locals()
+    stateTableData = property(**stateTableData())
+
     def calibrationTableData():
         def fget(self):
             return self.calibrationTableModel().dataArray()
@@ -1017,11 +1224,14 @@ class AnalogOutputNode(AnalogInputNode):
             - calibration_table_model : Calibration of analog signal to HAL numbers
             - calibration_table_data : This property is used to load and save cal data
 
+            - hal_pin : The float/s32 hal pin streamed for this output
+
             - units
             - display_digits
             - display_scientific : If true use scientific notation
             - scale_type : Linear or cubic spline for signal calibration
     '''
+    hal_pins = ['None']
     def __init__(self, parent=None):
         super().__init__(parent)
         self._name = 'Analog_Output_Node'
@@ -3,20 +3,120 @@
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 import itertools
+import sys
+import numpy as np
 
 import linuxnano.strings
 from linuxnano.message_box import MessageBox
 
 
 
+class CompiledDeviceStates():
+    '''Read only view of a DeviceStateTableModel for the runtime, one array per column indexed by state.
+       Strings are interned once and stored as ids into strings().  Built from the default row and the
+       table's configured rows as layers [(state indexes, row)], later layers win
+    '''
+    def __init__(self, count, default_row, layers):
+        self._strings = []
+        self._ids = {}
+
+        self.status_ids          = self.stringColumn(count, default_row, layers, 0)
+        self.icon_layer_ids      = self.stringColumn(count, default_row, layers, 1)
+        self.is_warning          = self.column(count, default_row, layers, 2, bool)
+        self.warning_timeouts    = self.column(count, default_row, layers, 3, np.float64)
+        self.warning_message_ids = self.stringColumn(count, default_row, layers, 4)
+        self.is_alarm            = self.column(count, default_row, layers, 5, bool)
+        self.alarm_timeouts      = self.column(count, default_row, layers, 6, np.float64)
+        self.alarm_message_ids   = self.stringColumn(count, default_row, layers, 7)
+        self.triggers_action     = self.column(count, default_row, layers, 8, bool)
+        self.action_timeouts     = self.column(count, default_row, layers, 9, np.float64)
+        self.log_entrance        = self.column(count, default_row, layers, 11, bool)
+
+    def stringId(self, value):
+        value = sys.intern(str(value))
+        if value not in self._ids:
+            self._ids[value] = len(self._strings)
+            self._strings.append(value)
+        return self._ids[value]
+
+    def column(self, count, default_row, layers, col, dtype):
+        convert = lambda value: value if value is not None else 0
+        array = np.full(count, convert(default_row[col]), dtype=dtype)
+        for states, row in layers:
+            array[states] = convert(row[col])
+        return array
+
+    def stringColumn(self, count, default_row, layers, col):
+        array = np.full(count, self.stringId(default_row[col]), dtype=np.int64)
+        for states, row in layers:
+            array[states] = self.stringId(row[col])
+        return array
+
+    def strings(self):
+        return self._strings
+
+    def status(self, state):
+        return self._strings[self.status_ids[state]]
+
+    def iconLayer(self, state):
+        return self._strings[self.icon_layer_ids[state]]
+
+
+
+class SparseDeviceStates():
+    '''Read only view like CompiledDeviceStates for tables too big to hold an array per column, memory tracks the
+       configured rows instead of every combination of states.  Rows set by index are looked up in a dict and
+       patterns are matched with the truth table strides, each state's row is kept once it's been looked up.
+    '''
+    def __init__(self, truth_states, strides, default_row, patterns, rows):
+        self._default_row = default_row
+        self._rows = rows
+        self._looked_up = {} #{state: data row} for the states the runtime has asked for
+
+        #Each pattern as the (stride, number of states, state) it needs of every column that isn't a wildcard
+        self._patterns = []
+        for pattern, row in reversed(patterns):
+            digits = [(stride, len(states), states.index(name)) for name, states, stride in zip(pattern, truth_states, strides) if name != DeviceStateTableModel.wildcard]
+            self._patterns.append((digits, row))
+
+    def row(self, state):
+        '''The data row of state, from its index, the last matching pattern or the default'''
+        row = self._looked_up.get(state)
+        if row is None:
+            row = self._rows.get(state)
+            if row is None:
+                row = self._default_row
+                for digits, pattern_row in self._patterns:
+                    if all((state // stride) % count == digit for stride, count, digit in digits):
+                        row = pattern_row
+                        break
+            self._looked_up[state] = row
+        return row
+
+    def status(self, state):
+        return str(self.row(state)[0])
+
+    def iconLayer(self, state):
+        return str(self.row(state)[1])
+
+
+
 class DeviceStateTableModel(QtCore.QAbstractTableModel):
     '''This is owned by the device node.  When setup first calls setNodeStates, passing a 2d array where each row
        has the name of the HalNode followed by it's possible states.  This is used to form a truth table of all
        possible states.
 
+       The truth table is never built, a row's states are worked out from its index.  Only the rows that
+       differ from the default row are stored, either by state index or as a pattern of state names with
+       '*' for don't care, i.e. [['is_open', '*', 'close'], 'fault', ...].  Rows set by index win over
+       patterns and later patterns win over earlier ones.
+
        setNodeStates is called anytime one of the devices HalNode is added/removed/changed
        dataArray is used to load/save the information in the table
     '''
+    wildcard = '*'
+    dense_limit = 1024 #Tables with more rows than this compile to SparseDeviceStates
+
     def __init__(self, parent = None):
         super().__init__(parent)
 
@@ -36,38 +136,96 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
         self._default_data_row = ['unknown status', 'layer_n', False, 0, '', False, 0, '', False, 0, None, True]
 
         self._headers = self._default_headers
-        self._data = [self._default_data_row]
-
         self._data_array_headers = ['state', 'status', 'icon_layer', 'is_warning', 'warning_timeout', 'warning_message', 'is_alarm', 'alarm_timeout', 'alarm_message', 'triggers_action', 'action_timeout', 'action', 'log_entrance']
-        self._truth_table = [['off'],
-                             ['on']]
-
-
-    def statusColumn(self):         return len(self._truth_table[0])
-    def iconLayerColumn(self):      return len(self._truth_table[0]) + 1
-    def isWarningColumn(self):      return len(self._truth_table[0]) + 2
-    def warningTimeoutColumn(self): return len(self._truth_table[0]) + 3
-    def warningMessageColumn(self): return len(self._truth_table[0]) + 4
-    def isAlarmColumn(self):        return len(self._truth_table[0]) + 5
-    def alarmTimeoutColumn(self):   return len(self._truth_table[0]) + 6
-    def alarmMessageColumn(self):   return len(self._truth_table[0]) + 7
-    def triggersActionColumn(self): return len(self._truth_table[0]) + 8
-    def actionTimeoutColumn(self):  return len(self._truth_table[0]) + 9
-    def actionColumn(self):         return len(self._truth_table[0]) + 10
-    def logEntranceColumn(self):    return len(self._truth_table[0]) + 11
+
+        self._truth_states = [] #Each truth table column's states, the first column changes slowest
+        self._strides = []      #How many rows each truth table column's state lasts
+        self._row_count = 1
+        self._rows = {}         #{state: data row} rows set by index
+        self._patterns = []     #[(pattern, data row)] rows set by pattern
+
+        self._compiled = None
+        self.dataChanged.connect(self.clearCompiled)
+        self.modelReset.connect(self.clearCompiled)
+
+
+    def statusColumn(self):         return len(self._truth_states)
+    def iconLayerColumn(self):      return len(self._truth_states) + 1
+    def isWarningColumn(self):      return len(self._truth_states) + 2
+    def warningTimeoutColumn(self): return len(self._truth_states) + 3
+    def warningMessageColumn(self): return len(self._truth_states) + 4
+    def isAlarmColumn(self):        return len(self._truth_states) + 5
+    def alarmTimeoutColumn(self):   return len(self._truth_states) + 6
+    def alarmMessageColumn(self):   return len(self._truth_states) + 7
+    def triggersActionColumn(self): return len(self._truth_states) + 8
+    def actionTimeoutColumn(self):  return len(self._truth_states) + 9
+    def actionColumn(self):         return len(self._truth_states) + 10
+    def logEntranceColumn(self):    return len(self._truth_states) + 11
 
     def rowCount(self, parent=None):
-        return len(self._data)
+        return self._row_count
 
     def columnCount(self, parent=None):
-        return len(self._data[0])
+        return len(self._truth_states) + len(self._default_data_row)
+
 
+    def clearCompiled(self, *args):
+        self._compiled = None
+
+    def compiled(self):
+        '''Returns the cached CompiledDeviceStates for this table, rebuilt after the table changes.  Above
+           dense_limit rows it's a SparseDeviceStates so the runtime never holds every combination of states
+        '''
+        if self._compiled is None and self._row_count > self.dense_limit:
+            self._compiled = SparseDeviceStates(self._truth_states, self._strides, self._default_data_row, self._patterns, dict(self._rows))
+
+        elif self._compiled is None:
+            layers  = [(self.statesMatching(pattern), row) for pattern, row in self._patterns]
+            layers += self._rowLayers()
+            self._compiled = CompiledDeviceStates(self._row_count, self._default_data_row, layers)
+        return self._compiled
+
+    def _rowLayers(self):
+        #Groups the rows set by index that share the same data so they're assigned together
+        groups = {}
+        for state, row in self._rows.items():
+            groups.setdefault(repr(row), (row, []))[1].append(state)
+        return [(np.array(states, dtype=np.int64), row) for row, states in groups.values()]
 
     def iconLayerFromState(self, state):
-        return self._data[state][self.iconLayerColumn()]
+        return self.compiled().iconLayer(state)
 
     def statusFromState(self, state):
-        return self._data[state][self.statusColumn()]
+        return self.compiled().status(state)
+
+
+    def truthStates(self, state):
+        '''The truth table row for state, the name of each column's state'''
+        return [states[(state // stride) % len(states)] for states, stride in zip(self._truth_states, self._strides)]
+
+    def statesMatching(self, pattern):
+        '''Every state index matching a pattern of state names and wildcards, in order'''
+        matches = np.zeros(1, dtype=np.int64)
+        for states, stride, name in zip(self._truth_states, self._strides, pattern):
+            digits = np.arange(len(states)) if name == self.wildcard else np.array([states.index(name)])
+            matches = (matches[:, np.newaxis] + digits*stride).reshape(-1)
+        return matches
+
+    def patternMatches(self, pattern, state):
+        return all(name == self.wildcard or name == truth for name, truth in zip(pattern, self.truthStates(state)))
+
+    def fallbackRow(self, state):
+        '''The data row state gets if it isn't set by index, from the last matching pattern or the default'''
+        for pattern, row in reversed(self._patterns):
+            if self.patternMatches(pattern, state):
+                return row
+        return self._default_data_row
+
+    def dataRow(self, state):
+        '''The status, icon layer, ... columns of a state'''
+        row = self._rows.get(state)
+        return row if row is not None else self.fallbackRow(state)
+
 
     #TODO I think this being called too often during load
     def setNodeStates(self, list_of_states):
@@ -87,20 +245,18 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
             if not all(isinstance(item, str) for item in row):
                 raise TypeError(err)
 
-        tbl = []
-        for e in itertools.product(*states):
-            tbl.append(list(e))
-
-        self._truth_table = tbl
-
         #Anytime the truth table is changed we need to update the data layout and the headers
         self.beginResetModel()
 
-        new_data = self._truth_table[:]
-        for i, row in enumerate(new_data):
-            new_data[i] = new_data[i] + self._default_data_row[:]
+        self._truth_states = [row[:] for row in states]
+        self._strides = []
+        self._row_count = 1
+        for row in reversed(self._truth_states):
+            self._strides.insert(0, self._row_count)
+            self._row_count *= len(row)
 
-        self._data = new_data
+        self._rows = {}
+        self._patterns = []
         self._headers = headers + self._default_headers
 
         self.endResetModel()
@@ -108,7 +264,8 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
         return True
 
     def truthTable(self):
-        return self._truth_table
+        '''Builds the whole truth table, this is every combination of the HalNodes' states'''
+        return [list(e) for e in itertools.product(*self._truth_states)]
 
 
     def setDeviceStates(self, data):
@@ -116,18 +273,16 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
             in format [ ['state', 'status'      , 'icon_layer', 'is_warning', 'warning_timeout', 'warning_message', 'is_alarm', 'alarm_timeout', 'alarm_message',
                         [   0   , 'my status 1' , 'layer_0'   ,        False,               0.0,                '',      False,             0.0,              '',
                         [   1   , 'my status 2' , 'layer_1'   ,         True,               5.0,      'my warning',       True,            10.0,    'some alarm',
-                        [   2   , 'my status 3' , 'layer_2'   ,        False,               0.0,                '',      False,             0.0,              '',
-                        [   3   , 'my status 4' , 'layer_3'   ,        False,               0.0,                '',      False,             0.0,              '',
+                        [['*', 'open'], 'my status 3' , 'layer_2',  False,               0.0,                '',      False,             0.0,              '',
 
 
                                     'triggers_action', 'action_timeout', 'action', 'log_entrance'],
                                                 False,              0.0,     None,           True],
                                                  True,             10.0,     None,           True],
                                                 False,              0.0,     None,           True],
-                                                False,              0.0,     None,           True],
-
-
 
+            state is the row's index or a pattern with one state name or '*' for each truth table column.
+            States that aren't listed get the default row, older files list every state
         '''
 
 
@@ -138,15 +293,20 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
             raise ValueError('Invalid header row, must be: ' + self._data_array_headers)
 
         data_main = data[1:]
-        if len(data_main) != len(self._truth_table):
-            raise ValueError('Number of rows must be same as number of states')
 
-        #State column is in order, 0,1,2,.. n
-        first_col = [row[0] for row in data_main]
-        if first_col != list(range(0, len(self._truth_table))):
+        #States are indexes in order, 0, 1, 2, .. n, or patterns of the truth table columns
+        indexes = [row[0] for row in data_main if not isinstance(row[0], list)]
+        if indexes != sorted(set(indexes)) or not all(isinstance(state, int) and 0 <= state < self._row_count for state in indexes):
             raise ValueError('State column must be in format 0, 1, 2, ...n')
 
         for row in data_main:
+            if isinstance(row[0], list):
+                if len(row[0]) != len(self._truth_states):
+                    raise ValueError('State pattern must have a state or * for each node')
+                for name, states in zip(row[0], self._truth_states):
+                    if name != self.wildcard and name not in states:
+                        raise ValueError('State pattern has an unknown state: ' + str(name))
+
             if not isinstance(row[1], str): raise TypeError('status column must be of type str')
             if not isinstance(row[2], str): raise TypeError('icon_layer column must be of type str')
 
@@ -166,10 +326,11 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
 
         self.beginResetModel()
 
-        new_data = self._truth_table[:]
-        for i, row in enumerate(data_main):
-            new_data[i] = new_data[i] + row[1:]
-        self._data = new_data
+        self._patterns = [(tuple(row[0]), row[1:]) for row in data_main if isinstance(row[0], list)]
+        self._rows = {}
+        for row in data_main:
+            if not isinstance(row[0], list) and row[1:] != self.fallbackRow(row[0]):
+                self._rows[row[0]] = row[1:]
 
         self.endResetModel()
 
@@ -177,23 +338,15 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
 
 
     def deviceStates(self):
+        '''The configured rows for saving, patterns first then the rows set by index'''
         data = []
         data.append(self._data_array_headers[:])
 
-        for i, row in enumerate(self._data):
-            data.append([ i,
-                         self._data[i][self.statusColumn()],
-                         self._data[i][self.iconLayerColumn()],
-                         self._data[i][self.isWarningColumn()],
-                         self._data[i][self.warningTimeoutColumn()],
-                         self._data[i][self.warningMessageColumn()],
-                         self._data[i][self.isAlarmColumn()],
-                         self._data[i][self.alarmTimeoutColumn()],
-                         self._data[i][self.alarmMessageColumn()],
-                         self._data[i][self.triggersActionColumn()],
-                         self._data[i][self.actionTimeoutColumn()],
-                         self._data[i][self.actionColumn()],
-                         self._data[i][self.logEntranceColumn()] ])
+        for pattern, row in self._patterns:
+            data.append([list(pattern)] + row[:])
+
+        for state in sorted(self._rows):
+            data.append([state] + self._rows[state][:])
 
         return data
 
@@ -206,16 +359,19 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
                 return str(section).format("%1")
 
     def flags(self, index):
-        if index.column() < len(self._truth_table[0]):
+        if index.column() < len(self._truth_states):
             return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
 
-        elif index.column() in [self.warningTimeoutColumn(), self.warningMessageColumn()] and self._data[index.row()][self.isWarningColumn()] == False:
+        row = self.dataRow(index.row())
+        col = index.column() - len(self._truth_states)
+
+        if col in [3, 4] and row[2] == False:
             return QtCore.Qt.ItemIsSelectable
 
-        elif index.column() in [self.alarmTimeoutColumn(), self.alarmMessageColumn()] and self._data[index.row()][self.isAlarmColumn()] == False:
+        elif col in [6, 7] and row[5] == False:
             return QtCore.Qt.ItemIsSelectable
 
-        elif index.column() in [self.actionTimeoutColumn()] and self._data[index.row()][self.triggersActionColumn()] == False:
+        elif col in [9] and row[8] == False:
             return QtCore.Qt.ItemIsSelectable
 
         else:
@@ -226,7 +382,12 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
         if role == QtCore.Qt.EditRole or role == QtCore.Qt.DisplayRole:
             row = index.row()
             col = index.column()
-            return self._data[row][col]
+
+            if col < len(self._truth_states):
+                states = self._truth_states[col]
+                return states[(row // self._strides[col]) % len(states)]
+
+            return self.dataRow(row)[col - len(self._truth_states)]
 
         elif role == QtCore.Qt.ToolTipRole:
             return 'Need to add a tooltip'
@@ -243,41 +404,35 @@ class DeviceStateTableModel(QtCore.QAbstractTableModel):
             row = index.row()
             col = index.column()
 
-
             if col == self.statusColumn():
                 value = str(value)
-                self._data[row][col] = value
-                self.dataChanged.emit(index, index)
-                return True
 
             elif col in [self.iconLayerColumn(), self.warningMessageColumn(), self.alarmMessageColumn()]:
                 value = str(value)
-                self._data[row][col] = value
-                self.dataChanged.emit(index, index)
-                return True
 
             elif col in [self.warningTimeoutColumn(), self.alarmTimeoutColumn(), self.actionTimeoutColumn()]:
-                if value == None:
-                    self._data[row][col] = None
-                else:
-                    self._data[row][col] = float(value)
-
-                self.dataChanged.emit(index, index)
-                return True
+                if value != None:
+                    value = float(value)
 
             #FIXME
             elif col == self.actionColumn():
                 value = str(value)
-                self._data[row][col] = value
-                self.dataChanged.emit(index, index)
-                return True
 
             elif col in [self.isWarningColumn(), self.isAlarmColumn(), self.triggersActionColumn(), self.logEntranceColumn()]:
-                if value == True:
-                    self._data[row][col] = True
-                else:
-                    self._data[row][col] = False
-                self.dataChanged.emit(index, index)
-                return True
+                value = value == True
+
+            else:
+                return False
+
+            #Only rows that differ from what they'd get anyway are kept
+            data_row = self.dataRow(row)[:]
+            data_row[col - len(self._truth_states)] = value
+            if data_row == self.fallbackRow(row):
+                self._rows.pop(row, None)
+            else:
+                self._rows[row] = data_row
+
+            self.dataChanged.emit(index, index)
+            return True
 
         return False
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import subprocess
+import threading
+import time
+import os
+
+import numpy as np
+from collections import deque
+
+
+
+def halScript(commands):
+    '''Formats a list of halcmd commands, i.e. [['loadrt', 'sampler', 'cfg=bb'], ...], as a .hal file'''
+    return ''.join(' '.join(command) + '\n' for command in commands)
+
+
+
+class HalTransport():
+    '''Everything HalReader needs from HAL:
+            - run          : Runs a list of halcmd commands, i.e. [['loadrt', 'sampler', 'cfg=bb'], ['show', 'pin']], returns stdout
+            - openSampler  : Returns a binary file with halsampler -t lines
+            - openStreamer : Returns a binary file that takes halstreamer lines
+            - stop         : Stops HAL and unloads everything
+
+       Transports that are 'direct' skip the sampler/streamer programs and their text, HalReader calls
+       readPins()/writePins() each tick instead of opening the sampler and streamer.
+    '''
+    direct = False
+
+    def exportPins(self, sampler_cfg, streamer_cfg):
+        '''Called before the sampler and streamer commands run, cfg is a sampler style type string i.e. 'bbf' '''
+        pass
+
+    def samplerCommands(self, cfg, pins):
+        '''Commands loading a sampler and netting pins, [(signal_name, hal_pin)], to its slots'''
+        commands = [['loadrt', 'sampler', 'depth=100', 'cfg=' + cfg]]
+
+        for slot, (signal_name, hal_pin) in enumerate(pins):
+            commands.append(['net', signal_name, hal_pin, '=>', 'sampler.0.pin.'+str(slot)])
+
+        commands.append(['setp', 'sampler.0.enable', 'True'])
+        commands.append(['addf', 'sampler.0', 'gui'])
+        return commands
+
+    def streamerCommands(self, cfg, pins):
+        commands = [['loadrt', 'streamer', 'depth=100', 'cfg=' + cfg]]
+
+        for slot, (signal_name, hal_pin) in enumerate(pins):
+            commands.append(['net', signal_name, hal_pin, '=>', 'streamer.0.pin.'+str(slot)])
+
+        commands.append(['setp', 'streamer.0.enable', 'True'])
+        commands.append(['addf', 'streamer.0', 'gui'])
+        return commands
+
+    def run(self, commands):
+        raise NotImplementedError("HalTransports must implement run")
+
+    def openSampler(self):
+        raise NotImplementedError("HalTransports must implement openSampler")
+
+    def openStreamer(self):
+        raise NotImplementedError("HalTransports must implement openStreamer")
+
+    def stop(self):
+        raise NotImplementedError("HalTransports must implement stop")
+
+
+
+class HalcmdTransport(HalTransport):
+    '''Talks to a real HAL through the halcmd, halsampler and halstreamer programs that ship with LinuxCNC'''
+    def __init__(self):
+        super().__init__()
+        self._mode = 'script'
+        self.p_sampler = None
+        self.p_streamer = None
+
+    def mode(self):
+        return self._mode
+
+    def setMode(self, value):
+        '''script'   : All of the commands are piped through a single halcmd -f
+           'commands' : One halcmd process per command, kept to benchmark against'''
+        if value not in ['script', 'commands']:
+            raise ValueError("Bring up mode must be 'script' or 'commands'")
+        self._mode = value
+
+    def run(self, commands):
+        if self._mode == 'script':
+            # -k keeps going past a failed command just like the separate calls, -f with no file reads stdin
+            result = subprocess.run(self.halcmdArgs() + ['-k', '-f'], input=halScript(commands).encode(), stdout=subprocess.PIPE)
+            return result.stdout
+
+        output = b''
+        for command in commands:
+            output += subprocess.run(self.halcmdArgs() + command, stdout=subprocess.PIPE).stdout
+        return output
+
+
+    def halcmdArgs(self):
+        return ['halcmd']
+
+    def samplerArgs(self):
+        # stdbuf fixes bufering issue
+        return ['stdbuf', '-oL', 'halcmd', 'loadusr', 'halsampler', '-c', '0', '-t']
+
+    def streamerArgs(self):
+        return ['halcmd', 'loadusr', 'halstreamer', '-c', '0']
+
+    def openSampler(self):
+        self.p_sampler = subprocess.Popen(self.samplerArgs(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+        return self.p_sampler.stdout
+
+    def openStreamer(self):
+        self.p_streamer = subprocess.Popen(self.streamerArgs(), stdin=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return self.p_streamer.stdin
+
+    def stop(self):
+        subprocess.call(self.halcmdArgs() + ['stop'])
+        subprocess.call(self.halcmdArgs() + ['unload', 'all'])
+
+
+
+class FakeHalTransport(HalTransport):
+    '''A pure python stand in for HAL so the reader's hot path can be tested and benchmarked without LinuxCNC
+
+        - pins     : {'name': ('bit', 'OUT')} the pins the hardware components export, seen by 'show pin'
+        - rate     : Samples per second the sampler takes, None to only sample when sample() is called
+        - stimulus : Called with the sample number before each sample, returns {'pin_name': value} for inputs that change
+
+       Understands loadrt sampler/streamer, net, setp, show pin, start/stop/unload.  Everything else is accepted and ignored.
+       The sampler keeps a FIFO of 'depth' samples, samples taken while it's full are lost like the real sampler's overruns.
+    '''
+    def __init__(self, pins=None, rate=None, stimulus=None):
+        super().__init__()
+        self._hardware_pins = dict(pins) if pins else {}
+        self._rate = rate
+        self._stimulus = stimulus
+
+        self._lock = threading.Lock()
+        self._running = False
+        self._threads = []
+        self._sampler_fd = None
+
+        self.commands = []
+        self.overruns = 0
+        self.reset()
+
+    def reset(self):
+        self._pins = {name: [pin_type, pin_dir, self.defaultValue(pin_type)] for name, (pin_type, pin_dir) in self._hardware_pins.items()}
+        self._nets = {}         #{signal: [pin_names]}
+        self._pin_signal = {}   #{pin_name: signal}
+        self._sampler_cfg = ''
+        self._sampler_depth = 100
+        self._streamer_cfg = ''
+        self._sample_number = 0
+        self._fifo = deque()
+
+    def defaultValue(self, pin_type):
+        return 0.0 if pin_type == 'float' else 0
+
+
+    def addPins(self, prefix, count, pin_type='bit', pin_dir='OUT'):
+        '''Adds count pins named prefix-0, prefix-1, ... to the hardware pins, returns the names'''
+        names = [prefix + '-' + str(i) for i in range(count)]
+        for name in names:
+            self.addPin(name, pin_type, pin_dir)
+        return names
+
+    def addPin(self, name, pin_type='bit', pin_dir='OUT'):
+        with self._lock:
+            self._hardware_pins[name] = (pin_type, pin_dir)
+            self._pins[name] = [pin_type, pin_dir, self.defaultValue(pin_type)]
+
+    def setPin(self, name, value):
+        with self._lock:
+            self._pins[name][2] = value
+
+    def pin(self, name):
+        '''Value of the pin, a connected IN pin reads what's on its signal'''
+        with self._lock:
+            return self._pinValue(name)
+
+    def _pinValue(self, name):
+        signal = self._pin_signal.get(name)
+        if signal is not None:
+            for pin_name in self._nets[signal]:
+                if self._pins[pin_name][1] == 'OUT':
+                    return self._pins[pin_name][2]
+        return self._pins[name][2]
+
+
+    def run(self, commands):
+        output = b''
+        with self._lock:
+            for command in commands:
+                self.commands.append(command)
+                output += self._runCommand(command)
+        return output
+
+    def _runCommand(self, command):
+        name, args = command[0], command[1:]
+
+        if name == 'loadrt' and args[0] in ['sampler', 'streamer']:
+            options = dict(arg.split('=', 1) for arg in args[1:])
+            cfg = options.get('cfg', '')
+            pin_dir = 'IN' if args[0] == 'sampler' else 'OUT'
+
+            for i, char in enumerate(cfg):
+                pin_type = {'b':'bit', 'f':'float', 's':'s32', 'u':'u32'}[char.lower()]
+                self._pins[args[0] + '.0.pin.' + str(i)] = [pin_type, pin_dir, self.defaultValue(pin_type)]
+
+            if args[0] == 'sampler':
+                self._sampler_cfg = cfg
+                self._sampler_depth = int(options.get('depth', 100))
+            else:
+                self._streamer_cfg = cfg
+
+        elif name == 'net':
+            signal = args[0]
+            for pin_name in args[1:]:
+                if pin_name in ['=>', '<=', '<=>']:
+                    continue
+                if pin_name not in self._pins:
+                    return ("Pin '" + pin_name + "' does not exist\n").encode()
+
+                self._nets.setdefault(signal, []).append(pin_name)
+                self._pin_signal[pin_name] = signal
+
+        elif name == 'setp':
+            if args[0] in self._pins:
+                self._pins[args[0]][2] = self.parseValue(self._pins[args[0]][0], args[1])
+
+        elif name == 'show' and args and args[0] == 'pin':
+            return self.showPin()
+
+        elif name == 'unload':
+            self.reset()
+
+        elif name == 'start':
+            self._running = True
+
+        elif name == 'stop':
+            self._running = False
+
+        return b''
+
+
+    def parseValue(self, pin_type, text):
+        if pin_type == 'bit':
+            return 1 if text.upper() in ['1', 'TRUE'] else 0
+        elif pin_type == 'float':
+            return float(text)
+        return int(text)
+
+    def formatValue(self, pin_type, value):
+        if pin_type == 'float':
+            return '{:f}'.format(value)
+        return str(int(value))
+
+    def showPin(self):
+        lines = ['Component Pins:', 'Owner   Type  Dir         Value  Name']
+        for name, (pin_type, pin_dir, value) in sorted(self._pins.items()):
+            lines.append('    10  {:<5} {:<5} {:>12}  {}'.format(pin_type, pin_dir, self.formatValue(pin_type, self._pinValue(name)), name))
+        return ('\n'.join(lines) + '\n\n').encode()
+
+
+    def sample(self, count=1):
+        '''Takes count samples into the sampler FIFO, samples that don't fit are lost'''
+        with self._lock:
+            self._sample(count)
+        self._flushSampler()
+
+    def _sample(self, count):
+        names = ['sampler.0.pin.' + str(i) for i in range(len(self._sampler_cfg))]
+        types = [self._pins[name][0] for name in names]
+
+        for i in range(count):
+            if self._stimulus is not None:
+                for pin_name, value in self._stimulus(self._sample_number).items():
+                    self._pins[pin_name][2] = value
+
+            if len(self._fifo) >= self._sampler_depth:
+                self.overruns += 1
+            else:
+                values = ' '.join(self.formatValue(t, self._pinValue(n)) for n, t in zip(names, types))
+                self._fifo.append(str(self._sample_number) + ' ' + values + ' \n')
+
+            self._sample_number += 1
+
+    def _flushSampler(self):
+        '''The halsampler side, empties the FIFO into the pipe'''
+        with self._lock:
+            data = ''.join(self._fifo).encode()
+            self._fifo.clear()
+
+        while data and self._sampler_fd is not None:
+            written = os.write(self._sampler_fd, data)
+            data = data[written:]
+
+
+    def openSampler(self):
+        read_fd, self._sampler_fd = os.pipe()
+
+        if self._rate is not None:
+            t = threading.Thread(target=self._samplerThread)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+        return os.fdopen(read_fd, 'rb', buffering=0)
+
+    def _samplerThread(self):
+        taken = 0
+        start = time.monotonic()
+
+        while self._sampler_fd is not None:
+            due = int((time.monotonic() - start)*self._rate) - taken
+            if due > 0 and self._running:
+                with self._lock:
+                    self._sample(due)
+            taken += max(due, 0)
+
+            try:
+                self._flushSampler()
+            except OSError:
+                break
+            time.sleep(0.001)
+
+
+    def openStreamer(self):
+        read_fd, write_fd = os.pipe()
+
+        t = threading.Thread(target=self._streamerThread, args=(os.fdopen(read_fd, 'rb'),))
+        t.daemon = True
+        t.start()
+        self._threads.append(t)
+
+        return os.fdopen(write_fd, 'wb')
+
+    def _streamerThread(self, stream):
+        for line in iter(stream.readline, b''):
+            values = line.split()
+            with self._lock:
+                for i, (char, value) in enumerate(zip(self._streamer_cfg, values)):
+                    name = 'streamer.0.pin.' + str(i)
+                    self._pins[name][2] = self.parseValue(self._pins[name][0], value.decode())
+        stream.close()
+
+
+    def stop(self):
+        self.run([['stop'], ['unload', 'all']])
+
+        fd, self._sampler_fd = self._sampler_fd, None
+        if fd is not None:
+            os.close(fd)
+
+
+
+class HalComponentTransport(HalTransport):
+    '''Registers LinuxNano as a HAL userspace component and reads/writes its pins directly, no halsampler,
+       halstreamer or text in the IO path.  Nets and setup still go through the command transport.
+
+        - commands   : Transport that runs the halcmd commands, HalcmdTransport by default
+        - hal_module : LinuxCNC's hal python module, or FakeHalModule to run without LinuxCNC
+        - name       : Component name, pins are name.in-00, name.in-01 ... and name.out-00 ...
+    '''
+    direct = True
+    dtypes = {'b': np.uint8, 's': np.int32, 'u': np.uint32, 'f': np.float64}
+
+    def __init__(self, commands=None, hal_module=None, name='linuxnano'):
+        super().__init__()
+        if hal_module is None:
+            import hal as hal_module #Only ships with LinuxCNC
+
+        self._commands = commands if commands is not None else HalcmdTransport()
+        self._hal = hal_module
+        self._name = name
+        self._component = None
+
+        self._in_names = []
+        self._out_names = []
+        self._in_dtype = np.uint8
+        self._written = []
+
+    def component(self):
+        return self._component
+
+    def samplerPin(self, slot):
+        return self._name + '.in-{:02d}'.format(slot)
+
+    def streamerPin(self, slot):
+        return self._name + '.out-{:02d}'.format(slot)
+
+
+    def exportPins(self, sampler_cfg, streamer_cfg):
+        hal = self._hal
+        types = {'b': hal.HAL_BIT, 's': hal.HAL_S32, 'u': hal.HAL_U32, 'f': hal.HAL_FLOAT}
+
+        if self._component is not None:
+            self._component.exit()
+        self._component = hal.component(self._name)
+
+        self._in_names = ['in-{:02d}'.format(i) for i in range(len(sampler_cfg))]
+        self._out_names = ['out-{:02d}'.format(i) for i in range(len(streamer_cfg))]
+
+        for name, char in zip(self._in_names, sampler_cfg):
+            self._component.newpin(name, types[char], hal.HAL_IN)
+        for name, char in zip(self._out_names, streamer_cfg):
+            self._component.newpin(name, types[char], hal.HAL_OUT)
+
+        #One array type for the whole row, bits stay uint8 unless there's a wider channel
+        in_types = set(sampler_cfg)
+        if in_types <= {'b'}:
+            self._in_dtype = np.uint8
+        elif 'f' in in_types:
+            self._in_dtype = np.float64
+        else:
+            self._in_dtype = np.int64
+
+        self._written = [None]*len(self._out_names)
+        self._component.ready()
+
+
+    def samplerCommands(self, cfg, pins):
+        return [['net', signal_name, hal_pin, '=>', self.samplerPin(slot)] for slot, (signal_name, hal_pin) in enumerate(pins)]
+
+    def streamerCommands(self, cfg, pins):
+        return [['net', signal_name, self.streamerPin(slot), '=>', hal_pin] for slot, (signal_name, hal_pin) in enumerate(pins)]
+
+
+    def readPins(self):
+        '''The sampler slots' current values as one array'''
+        component = self._component
+        return np.fromiter((component[name] for name in self._in_names), dtype=self._in_dtype, count=len(self._in_names))
+
+    def writePins(self, values):
+        '''Sets the streamer slots, only pins that changed since the last write are touched'''
+        component = self._component
+        for slot, value in enumerate(values):
+            if value != self._written[slot]:
+                component[self._out_names[slot]] = value
+                self._written[slot] = value
+
+
+    def run(self, commands):
+        return self._commands.run(commands)
+
+    def openSampler(self):
+        raise NotImplementedError("HalComponentTransport is direct, use readPins")
+
+    def openStreamer(self):
+        raise NotImplementedError("HalComponentTransport is direct, use writePins")
+
+    def stop(self):
+        if self._component is not None:
+            self._component.exit()
+            self._component = None
+        self._commands.stop()
+
+
+
+class FakeHalModule():
+    '''Stand in for LinuxCNC's hal module, components export their pins into a FakeHalTransport'''
+    HAL_BIT, HAL_FLOAT, HAL_S32, HAL_U32 = 'bit', 'float', 's32', 'u32'
+    HAL_IN, HAL_OUT, HAL_IO = 'IN', 'OUT', 'IO'
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def component(self, name):
+        return FakeHalComponent(self.transport, name)
+
+
+class FakeHalComponent():
+    def __init__(self, transport, name):
+        self._transport = transport
+        self._name = name
+        self._pins = []
+        self.is_ready = False
+
+    def newpin(self, name, pin_type, pin_dir):
+        full_name = self._name + '.' + name
+        self._transport.addPin(full_name, pin_type, pin_dir)
+        self._pins.append(full_name)
+
+    def ready(self):
+        self.is_ready = True
+
+    def exit(self):
+        self.is_ready = False
+
+    def __getitem__(self, name):
+        return self._transport.pin(self._name + '.' + name)
+
+    def __setitem__(self, name, value):
+        self._transport.setPin(self._name + '.' + name, value)
@@ -1,345 +1,1086 @@
 
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import subprocess
 import time
+import os
+import io
 import select
 
-from threading import Thread
-from queue import Queue, Empty
+from threading import Thread, Lock
+from collections import deque
+from queue import Queue
+
+import numpy as np
 
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 from linuxnano.strings import strings
-from linuxnano.data import HalNode, DigitalInputNode, DigitalOutputNode #, AnalogInputNode, AnalogOutputNode
+from linuxnano.data import HalNode, DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode
+from linuxnano.calibration_table_model import CalibrationBank
+from linuxnano.analog_state_table_model import AnalogStateClassifier
+from linuxnano.signal_filters import Debouncer, Hysteresis, Reduction
+from linuxnano.hal_transport import HalcmdTransport, halScript
 
 
-class HalReader():
+class HalRoutes():
+    '''Compiled routing between the sampler/streamer pin slots and the nodes of the tool
+
+       assignSlots() hands out the slots once when HAL is loaded, each HAL pin gets one sampler and/or one
+       streamer slot.  build() maps those slots back onto the nodes, it's re-run only after the tool tree
+       or a device's HAL nodes change so a tick never has to walk the tree.
+    '''
+    cfg_types = {'bit': 'b', 'float': 'f', 's32': 's', 'u32': 'u'}
+
     def __init__(self):
+        self.sampler_pins = []  #[(signal_name, hal_pin)] in sampler slot order, bits first then analog
+        self.streamer_pins = [] #[(signal_name, hal_pin)] in streamer slot order, bits first then analog
+        self.sampler_types = [] #sampler cfg character for each slot
+        self.streamer_types = []
+        self.sampler_bit_count = 0
+        self.streamer_bit_count = 0
+
+        self._sampler_slots = {}  #{hal_pin: slot}
+        self._streamer_slots = {}
+        self._watched_models = []
+        self.clear()
+
+    def clear(self):
+        for model in self._watched_models:
+            try:
+                model.modelReset.disconnect(self.invalidate)
+            except TypeError:
+                pass
+
+        self._watched_models = []
+
+        self.sampler_indexes = []
+        self.sampler_nodes = []
+        self.sampler_value_indexes = []
+        self.sampler_weights = np.zeros((self.sampler_bit_count, 0), dtype=np.int64)
+        self.sampler_masks = self.packImage(self.sampler_weights.T != 0) #Each node's sampler bits in the packed image
+
+        self.analog_indexes = []
+        self.analog_value_indexes = []
+        self.analog_slots = np.zeros(0, dtype=np.int64) #Sampler slot for each analog channel
+        self.calibrations = CalibrationBank([])
+        self.analog_state_indexes = []
+        self.analog_classifier = AnalogStateClassifier([])
+
+        self.streamer_indexes = []
+        self.streamer_shifts = [] #For each streamer node [(shift, slot), ...]
+        self.streamer_node_shifts = {} #{node: [(shift, slot), ...]}
+        self.streamer_analog = {} #{node: (slot, output calibration channel)}
+        self.output_calibrations = CalibrationBank([])
+
+        self.device_indexes = []
+        self.icon_indexes = []
+        self.device_icons = [] #Icon indexes of each device
+        self.sampler_devices = np.zeros(0, dtype=np.int64) #Device of each sampler node, -1 if it isn't in one
+        self.analog_devices = np.zeros(0, dtype=np.int64)  #Device of each analog channel
+        self.device_state_columns = np.zeros((0, 0), dtype=np.int64) #Each device's HAL nodes in HalReader.deviceStates' state vector
+        self.device_state_weights = np.zeros((0, 0), dtype=np.int64) #and their radix weights, padded with 0
+        self.fixed_state_nodes = [] #HAL nodes of a device that aren't sampled, their state is read from the node
+
+        self._dirty = True
+
+    @staticmethod
+    def packImage(bits):
+        '''Packs a samples x bit slots block into samples x 64 bit words, slot n is bit n of the image'''
+        packed = np.packbits(np.asarray(bits, dtype=np.uint8), axis=1, bitorder='little')
+        padding = -packed.shape[1] % 8
+        if padding:
+            packed = np.hstack((packed, np.zeros((len(packed), padding), dtype=np.uint8)))
+        return np.ascontiguousarray(packed).view(np.uint64)
+
+    def invalidate(self, *args):
+        self._dirty = True
+
+    def isDirty(self):
+        return self._dirty
+
+
+    def assignSlots(self, tool_model, sampler_hal_pins, streamer_hal_pins, pin_types=None):
+        '''pin_types is {hal_pin: 'float'} from halcmd show pin, analog pins without one are floats'''
+        pin_types = pin_types if pin_types is not None else {}
+        self.sampler_pins = []
+        self.streamer_pins = []
+        self.sampler_types = []
+        self.streamer_types = []
+        self._sampler_slots = {}
+        self._streamer_slots = {}
+
+        sampler_nodes  = tool_model.nodesOfType(strings.D_IN_NODE)
+        sampler_nodes += tool_model.nodesOfType(strings.D_OUT_NODE)
+        streamer_nodes = tool_model.nodesOfType(strings.D_OUT_NODE)
+        analog_nodes   = tool_model.nodesOfType(strings.A_IN_NODE)
+        analog_nodes  += tool_model.nodesOfType(strings.A_OUT_NODE)
+        analog_out_nodes = tool_model.nodesOfType(strings.A_OUT_NODE)
+
+        #Each halpin is only connected once, the signal name comes from the first node using it
+        for node in sampler_nodes:
+            for signal, hal_pin in zip(node.signals(), node.halPins):
+                if hal_pin in sampler_hal_pins and hal_pin != 'None' and hal_pin not in self._sampler_slots:
+                    self._sampler_slots[hal_pin] = len(self.sampler_pins)
+                    self.sampler_pins.append((signal, hal_pin))
+                    self.sampler_types.append('b')
+
+        self.sampler_bit_count = len(self.sampler_pins)
+
+        for node in analog_nodes:
+            hal_pin = node.halPin
+            if hal_pin in sampler_hal_pins and hal_pin != 'None' and hal_pin not in self._sampler_slots:
+                self._sampler_slots[hal_pin] = len(self.sampler_pins)
+                self.sampler_pins.append((node.signals()[0], hal_pin))
+                self.sampler_types.append(self.cfg_types.get(pin_types.get(hal_pin), 'f'))
+
+        for node in streamer_nodes:
+            for signal, hal_pin in zip(node.signals(), node.halPins):
+                if hal_pin in streamer_hal_pins and hal_pin != 'None':
+                    if hal_pin in self._streamer_slots:
+                        raise ValueError("Cannot have halpin connected from multiple output nodes")
+
+                    self._streamer_slots[hal_pin] = len(self.streamer_pins)
+                    self.streamer_pins.append((signal, hal_pin))
+                    self.streamer_types.append('b')
+
+        self.streamer_bit_count = len(self.streamer_pins)
+
+        for node in analog_out_nodes:
+            hal_pin = node.halPin
+            if hal_pin in streamer_hal_pins and hal_pin != 'None':
+                if hal_pin in self._streamer_slots:
+                    raise ValueError("Cannot have halpin connected from multiple output nodes")
+
+                self._streamer_slots[hal_pin] = len(self.streamer_pins)
+                self.streamer_pins.append((node.signals()[0], hal_pin))
+                self.streamer_types.append(self.cfg_types.get(pin_types.get(hal_pin), 'f'))
+
+        self.clear()
+
+
+    def build(self, tool_model):
+        self.clear()
+
+        tool_index = tool_model.index(0, 0, QtCore.QModelIndex())
+        d_in_indexes   = tool_model.indexesOfType(strings.D_IN_NODE,  tool_index)
+        d_out_indexes  = tool_model.indexesOfType(strings.D_OUT_NODE, tool_index)
+        self.device_indexes = tool_model.indexesOfType(strings.DEVICE_NODE, tool_index)
+        self.icon_indexes   = tool_model.indexesOfType(strings.DEVICE_ICON_NODE, tool_index)
+
+        #Which device each node belongs to, so a tick only recomputes the devices whose children changed
+        device_rows = {index.internalPointer(): row for row, index in enumerate(self.device_indexes)}
+        self.device_icons = [[] for index in self.device_indexes]
+        for index in self.icon_indexes:
+            row = device_rows.get(index.parent().internalPointer())
+            if row is not None:
+                self.device_icons[row].append(index)
+
+        #Column n of the weights holds 1<<shift at each sampler slot that feeds bit 'shift' of node n
+        self.sampler_indexes = d_in_indexes + d_out_indexes
+        self.sampler_nodes = [index.internalPointer() for index in self.sampler_indexes]
+        self.sampler_value_indexes = [index.siblingAtColumn(20) for index in self.sampler_indexes]
+        self.sampler_weights = np.zeros((self.sampler_bit_count, len(self.sampler_indexes)), dtype=np.int64)
+        self.sampler_devices = np.array([device_rows.get(node.parent(), -1) for node in self.sampler_nodes], dtype=np.int64)
+
+        for col, index in enumerate(self.sampler_indexes):
+            node = index.internalPointer()
+            node_sampler_pins = []
+
+            for shift, hal_pin in enumerate(node.halPins):
+                slot = self._sampler_slots.get(hal_pin)
+                if slot is not None:
+                    self.sampler_weights[slot, col] += 1<<shift
+                    node_sampler_pins.append(slot)
+
+            node.setSamplerPins(node_sampler_pins)
+
+        self.sampler_masks = self.packImage(self.sampler_weights.T != 0)
+        self.streamer_indexes = d_out_indexes
+        for index in self.streamer_indexes:
+            node = index.internalPointer()
+            shifts = [(shift, self._streamer_slots[hal_pin]) for shift, hal_pin in enumerate(node.halPins) if hal_pin in self._streamer_slots]
+
+            self.streamer_shifts.append(shifts)
+            self.streamer_node_shifts[node] = shifts
+            node.setStreamerPins([slot for shift, slot in shifts])
+
+        #Analog channels, every sampled analog node gets one column of the calibration bank
+        a_in_indexes  = tool_model.indexesOfType(strings.A_IN_NODE,  tool_index)
+        a_out_indexes = tool_model.indexesOfType(strings.A_OUT_NODE, tool_index)
+        analog_slots = []
+
+        for index in a_in_indexes + a_out_indexes:
+            node = index.internalPointer()
+            slot = self._sampler_slots.get(node.halPin)
+            node.setSamplerPins([slot] if slot is not None else [])
+
+            if slot is not None:
+                self.analog_indexes.append(index)
+                analog_slots.append(slot)
+
+        self.analog_slots = np.array(analog_slots, dtype=np.int64)
+        self.analog_value_indexes = [index.siblingAtColumn(30) for index in self.analog_indexes]
+        analog_nodes = [index.internalPointer() for index in self.analog_indexes]
+        self.analog_devices = np.array([device_rows.get(node.parent(), -1) for node in analog_nodes], dtype=np.int64)
+        self.calibrations = CalibrationBank([node.calibrationTableModel() for node in analog_nodes], [node.scaleType for node in analog_nodes])
+        self.analog_state_indexes = [index.siblingAtColumn(31) for index in self.analog_indexes]
+        self.analog_classifier = AnalogStateClassifier([node.stateTableModel() for node in analog_nodes])
+
+        output_nodes = []
+        for index in a_out_indexes:
+            node = index.internalPointer()
+            slot = self._streamer_slots.get(node.halPin)
+            node.setStreamerPins([slot] if slot is not None else [])
+
+            if slot is not None:
+                self.streamer_analog[node] = (slot, len(output_nodes))
+                output_nodes.append(node)
+
+        self.output_calibrations = CalibrationBank([node.calibrationTableModel() for node in output_nodes], [node.scaleType for node in output_nodes])
+
+        #The state vector is every sampler node's value, then every analog channel's state, then the rest
+        state_columns = {node: col for col, node in enumerate(self.sampler_nodes + analog_nodes)}
+        columns = [[] for index in self.device_indexes]
+        weights = [[] for index in self.device_indexes]
+
+        for row, index in enumerate(self.device_indexes):
+            for child, weight in index.internalPointer().stateWeights():
+                if child not in state_columns:
+                    state_columns[child] = len(state_columns)
+                    self.fixed_state_nodes.append(child)
+
+                columns[row].append(state_columns[child])
+                weights[row].append(weight)
+
+        width = max([len(row) for row in columns] + [0])
+        self.device_state_columns = np.zeros((len(columns), width), dtype=np.int64)
+        self.device_state_weights = np.zeros((len(columns), width), dtype=np.int64)
+        for row in range(len(columns)):
+            self.device_state_columns[row, :len(columns[row])] = columns[row]
+            self.device_state_weights[row, :len(weights[row])] = weights[row]
+
+        #Changing a HAL node's pins, name or states always ends up resetting its device's state table,
+        #the reading settings (debounce, hysteresis, etc) come through the tool model's nodeSettings() instead
+        for index in self.device_indexes:
+            model = index.internalPointer().deviceStateTableModel()
+            model.modelReset.connect(self.invalidate)
+            self._watched_models.append(model)
+
+        self._dirty = False
+
+
+
+class SamplerRing():
+    '''Bounded buffer between the sampler and the model, memory stays fixed if the GUI stalls.  In 'thread' mode
+       the reader thread fills it and the tick drains it, in 'notifier' mode each wake up's lines pass through it
+
+        - capacity : Most lines held before the policy kicks in
+        - policy   : 'drop_oldest' : Oldest line is thrown away for the new one
+                     'drop_newest' : New line is thrown away
+                     'merge'       : New line replaces the newest one, the oldest history and the latest state are kept
+
+       Also keeps the sampler's counters, sample number gaps that weren't dropped here are HAL FIFO overruns.
+    '''
+    policies = ['drop_oldest', 'drop_newest', 'merge']
+
+    def __init__(self, capacity=10000, policy='drop_oldest'):
+        if policy not in self.policies:
+            raise ValueError("Sampler policy must be one of " + str(self.policies))
+        if capacity < 1:
+            raise ValueError("Sampler capacity must be at least 1")
+
+        self._capacity = capacity
+        self._policy = policy
+        self._lines = deque()
+        self._lock = Lock()
+
+        self.resetStats()
+
+    def capacity(self):
+        return self._capacity
+
+    def policy(self):
+        return self._policy
+
+    def resetStats(self):
+        self.lines = 0          #Lines counted by countSamples
+        self.dropped = 0        #Lines the policy threw away
+        self.max_backlog = 0    #Most lines waiting at once
+        self.missing = 0        #Gaps in the sample numbers, dropped lines included
+        self._last_sample = None
+        self._first_line = None #Lines dropped before the first count still leave a gap behind it
+        self._rate_lines = 0
+        self._rate_time = time.monotonic()
+
+
+    def put(self, line):
+        with self._lock:
+            if self._first_line is None:
+                self._first_line = line
+
+            if len(self._lines) >= self._capacity:
+                self.dropped += 1
+                if self._policy == 'drop_oldest':
+                    self._lines.popleft()
+                elif self._policy == 'drop_newest':
+                    return
+                else:
+                    self._lines.pop()
+
+            self._lines.append(line)
+            self.max_backlog = max(self.max_backlog, len(self._lines))
+
+    def putLines(self, lines):
+        for line in lines:
+            self.put(line)
+
+    def drain(self):
+        '''Returns and removes every line waiting'''
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+        return lines
+
+    def empty(self):
+        return not self._lines
+
+    def __len__(self):
+        return len(self._lines)
+
+
+    def countSamples(self, sample_numbers):
+        '''Counts a decoded block of sample numbers and the gaps since the last block'''
+        if len(sample_numbers) == 0:
+            return
+
+        previous = self._last_sample
+        if previous is None and self._first_line is not None:
+            try:
+                previous = int(self._first_line.split()[0]) - 1
+            except (ValueError, IndexError):
+                pass
+
+        if previous is not None:
+            steps = np.diff(sample_numbers, prepend=previous)
+        else:
+            steps = np.diff(sample_numbers)
+
+        #Steps back are the sampler restarting, not gaps
+        self.missing += int(np.sum(steps[steps > 1] - 1))
+        self.lines += len(sample_numbers)
+        self._rate_lines += len(sample_numbers)
+        self._last_sample = int(sample_numbers[-1])
+
+    def overruns(self):
+        '''Samples HAL lost before they got here'''
+        return max(0, self.missing - self.dropped)
+
+    def stats(self):
+        '''Returns the counters, lines_per_sec is the rate since the last call'''
+        now = time.monotonic()
+        rate = self._rate_lines / (now - self._rate_time) if now > self._rate_time else 0.0
+        self._rate_lines = 0
+        self._rate_time = now
+
+        return {'lines'         : self.lines,
+                'lines_per_sec' : rate,
+                'dropped'       : self.dropped,
+                'max_backlog'   : self.max_backlog,
+                'overruns'      : self.overruns()}
+
+
+
+class HalReader():
+    def __init__(self, transport=None):
         super().__init__()
 
-        self.sampler_queue = Queue()
+        self._transport = transport if transport is not None else HalcmdTransport()
+
+        self.sampler_queue = SamplerRing()
         self.streamer_queue = Queue()
 
         self.timer = QtCore.QTimer()
         self.timer.timeout.connect(self.processData)
 
         self._tool_model = None
+        self._routes = HalRoutes()
+        self._sampler_values = np.zeros(0, dtype=np.int64)
+        self._analog_values = np.zeros(0)
+        self._analog_states = np.zeros(0, dtype=np.int64)
+        self._sample_period = 0.1 #Seconds, the gui thread's period1
+        self._debouncer = Debouncer([], [])
+        self._analog_debouncer = Debouncer([], [])
+        self._analog_hysteresis = Hysteresis(AnalogStateClassifier([]), [], [])
+        self._analog_reduction = Reduction([], [])
+        self._analog_pending = [] #Analog blocks read since the last tick in 'notifier' mode, see flushAnalog
+        self._sampler_image = None #Packed bits of the last sample, see HalRoutes.packImage
+        self._changed_devices = set() #Rows in routes.device_indexes to recompute on the next updateDevices
+        self._pin_types = {} #{hal_pin: 'bit'/'float'/'s32'/'u32'} from show pin
+        self.resetStreamer()
+
+        self._catch_up_threshold = 100
+        self._edge_log = deque(maxlen=10000)
+
+        self._sampler_mode = 'thread'
+        self._sampler = None
+        self._sampler_notifier = None
+        self._sampler_holdoff = 5 #ms the notifier sleeps after a wake-up, so bursts from halsampler are read together
+        self._bring_up_time = 0.0
+        self._hal_script_path = strings.DEFAULT_HAL_SCRIPT_PATH
 
 
 
     def setModel(self, value):
+        if self._tool_model is not None:
+            self._tool_model.rowsInserted.disconnect(self._routes.invalidate)
+            self._tool_model.rowsRemoved.disconnect(self._routes.invalidate)
+            self._tool_model.modelReset.disconnect(self._routes.invalidate)
+            self._tool_model.nodeSettings().changed.disconnect(self._routes.invalidate)
+
         self._tool_model = value
+        self._tool_model.rowsInserted.connect(self._routes.invalidate)
+        self._tool_model.rowsRemoved.connect(self._routes.invalidate)
+        self._tool_model.modelReset.connect(self._routes.invalidate)
+        self._tool_model.nodeSettings().changed.connect(self._routes.invalidate)
+        self._routes.invalidate()
 
     def model(self):
         return self._tool_model
 
 
+    def routes(self):
+        '''Returns the routing table, rebuilding it first if the tool changed since the last tick'''
+        if self._routes.isDirty():
+            self._routes.build(self._tool_model)
+            self._sampler_values = np.array([self._tool_model.data(index, QtCore.Qt.DisplayRole) for index in self._routes.sampler_value_indexes], dtype=np.int64)
+            self._analog_values = np.full(len(self._routes.analog_indexes), np.nan)
+            self._analog_states = np.array([self._tool_model.data(index, QtCore.Qt.DisplayRole) for index in self._routes.analog_state_indexes], dtype=np.int64)
+
+            #The filters start from what the model shows, so nothing jumps when the routes are rebuilt
+            analog_nodes = [index.internalPointer() for index in self._routes.analog_indexes]
+            self._debouncer = Debouncer([node.debounceSamples(self._sample_period) for node in self._routes.sampler_nodes], self._sampler_values)
+            self._analog_debouncer = Debouncer([node.debounceSamples(self._sample_period) for node in analog_nodes], self._analog_states)
+            self._analog_hysteresis = Hysteresis(self._routes.analog_classifier, [node.hysteresis for node in analog_nodes], self._analog_states)
+            self._analog_reduction = Reduction([node.reduction for node in analog_nodes], [node.emaAlpha for node in analog_nodes])
+            self._analog_pending = []
+            self._changed_devices = set(range(len(self._routes.device_indexes)))
+            self._sampler_image = None
+
+        return self._routes
+
+
+    def samplerMode(self):
+        return self._sampler_mode
+
+    def setSamplerMode(self, value):
+        ''''notifier' : halsampler's stdout is read from the Qt event loop as soon as data arrives
+           'thread'   : A reader thread queues each line and the timer polls the queue'''
+        if value not in ['notifier', 'thread']:
+            raise ValueError("Sampler mode must be 'notifier' or 'thread'")
+        self._sampler_mode = value
+
+    def samplerHoldoff(self):
+        return self._sampler_holdoff
+
+    def setSamplerHoldoff(self, value):
+        ''''notifier' mode, ms to wait after a wake-up before reading again. Bounds the latency, 0 reads every write'''
+        self._sampler_holdoff = value
+
+
+    def setSamplerBuffer(self, capacity, policy='drop_oldest'):
+        '''Replaces the sampler's ring, see SamplerRing for the policies'''
+        self.sampler_queue = SamplerRing(capacity, policy)
+
+    def samplerStats(self):
+        '''{'lines', 'lines_per_sec', 'dropped', 'max_backlog', 'overruns'} for sizing the sampler depth and HAL thread period'''
+        return self.sampler_queue.stats()
+
+
+    def catchUpThreshold(self):
+        return self._catch_up_threshold
+
+    def setCatchUpThreshold(self, value):
+        '''Blocks of more then value samples only set each changed node's final value, None applies every transition'''
+        self._catch_up_threshold = value
+
+    def samplePeriod(self):
+        return self._sample_period
+
+    def setSamplePeriod(self, value):
+        '''Seconds between samples, used to turn a node's debounce in ms into a number of samples'''
+        self._sample_period = float(value)
+        self._routes.invalidate()
+
+    def edgeLog(self):
+        '''Every transition the sampler saw, [(sample_number, node, old_value, new_value)], oldest first'''
+        return self._edge_log
+
+    def takeEdges(self):
+        edges = list(self._edge_log)
+        self._edge_log.clear()
+        return edges
+
+
+    def transport(self):
+        return self._transport
+
+    def setTransport(self, value):
+        '''HalcmdTransport or HalComponentTransport for a real HAL, FakeHalTransport to run without LinuxCNC'''
+        self._transport = value
+
+    def bringUpTime(self):
+        '''Seconds spent in halcmd during the last start()'''
+        return self._bring_up_time
+
+    def halScriptPath(self):
+        return self._hal_script_path
+
+    def setHalScriptPath(self, value):
+        self._hal_script_path = value
+
+
     def start(self):
-        self._previous_stream = []
-        self.setup()
-        self.findPins()
+        self._bring_up_time = 0.0
+
+        setup_commands = self.setupCommands()
+        output = self.runHalCommands(setup_commands + [['show', 'pin']])
+        self.findPins(output)
+
+        self._routes.assignSlots(self.model(), self.samplerHalPins(), self.streamerHalPins(), self._pin_types)
+        self.routes()
+        self.resetStreamer()
 
+        self._transport.exportPins(self.samplerCfg(), self.streamerCfg())
 
-        self.loadSampler()
-        self.connectSamplerSignals()
+        io_commands  = self.samplerCommands()
+        io_commands += self.streamerCommands()
+        io_commands += [['start'], ['loadusr', 'halmeter']]
+        self.runHalCommands(io_commands)
 
-        self.loadStreamer()
-        self.connectStreamerSignals()
+        self.saveHalScript(setup_commands + io_commands)
+        print("\nHAL bring up: {:.3f} sec".format(self._bring_up_time))
 
-        subprocess.call(['halcmd', 'start'])
-        subprocess.call(['halcmd', 'loadusr', 'halmeter'])
+        self.startSampler()
+        self.startStreamer()
 
         self.timer.start(100)
 
 
     def stop(self):
         self.timer.stop()
-        subprocess.call(['halcmd', 'stop'])
-        subprocess.call(['halcmd', 'unload', 'all'])
+
+        if self._sampler_notifier is not None:
+            self._sampler_notifier.setEnabled(False)
+            self._sampler_notifier = None
+        self._transport.stop()
+
+        print("Sampler stats: ", self.samplerStats())
+
+
+    def saveHalScript(self, commands):
+        '''Keeps the last bring up on disk so start ups can be diffed'''
+        try:
+            os.makedirs(os.path.dirname(self._hal_script_path), exist_ok=True)
+            with open(self._hal_script_path, 'w') as f:
+                f.write('# Generated by LinuxNano, HAL bring up for the loaded tool\n')
+                f.write(halScript(commands))
+
+        except OSError as e:
+            print("Failed saving HAL script {}: {}".format(self._hal_script_path, e))
+
+
+    def runHalCommands(self, commands):
+        '''Runs the commands in halcmd and returns their combined stdout'''
+        t0 = time.perf_counter()
+        output = self._transport.run(commands)
+        self._bring_up_time += time.perf_counter() - t0
+
+        return output
 
 
 
     def setupEthercat(self):
-        subprocess.call(['halcmd', 'loadusr', '-W', 'lcec_conf', 'ethercat_config.xml'])
-        subprocess.call(['halcmd', 'loadrt', 'lcec'])
-        subprocess.call(['halcmd', 'addf', 'lcec.read-all', 'servo'])
-        subprocess.call(['halcmd', 'addf', 'lcec.write-all', 'servo'])
+        self._transport.run([['loadusr', '-W', 'lcec_conf', 'ethercat_config.xml'],
+                             ['loadrt', 'lcec'],
+                             ['addf', 'lcec.read-all', 'servo'],
+                             ['addf', 'lcec.write-all', 'servo']])
 
 
-    def setup(self):
-        subprocess.call(['halcmd', 'stop'])
-        subprocess.call(['halcmd', 'unload', 'all'])
+    def setupCommands(self):
+        commands = []
+        commands.append(['stop'])
+        commands.append(['unload', 'all'])
 
-        subprocess.call(['halcmd', 'loadrt', 'threads', 'name1=gui', 'period1=100000000']) #updates every 0.5 sec, or 500,000,000 ns
+        commands.append(['loadrt', 'threads', 'name1=gui', 'period1=100000000']) #updates every 0.5 sec, or 500,000,000 ns
 
         #sudo halcompile --install linuxnano/HAL/hardware_sim.comp
-        subprocess.call(['halcmd', 'loadrt', 'hardware_sim'])
+        commands.append(['loadrt', 'hardware_sim'])
 
-        #subprocess.call(['halcmd', 'loadusr', 'halscope'])
+        #commands.append(['loadusr', 'halscope'])
 
         #Simulating a digital input with siggen.0.square in tool_model_1
-        #subprocess.call(['halcmd', 'loadrt', 'siggen'])
-        #subprocess.call(['halcmd', 'addf', 'siggen.0.update', 'gui'])
-        #subprocess.call(['halcmd', 'setp', 'siggen.0.amplitude', '0.5'])
-        #subprocess.call(['halcmd', 'setp', 'siggen.0.offset', '0.5'])
-        #subprocess.call(['halcmd', 'setp', 'siggen.0.frequency', '0.5'])
+        #commands.append(['loadrt', 'siggen'])
+        #commands.append(['addf', 'siggen.0.update', 'gui'])
+        #commands.append(['setp', 'siggen.0.amplitude', '0.5'])
+        #commands.append(['setp', 'siggen.0.offset', '0.5'])
+        #commands.append(['setp', 'siggen.0.frequency', '0.5'])
 
-        subprocess.call(['halcmd', 'loadrt', 'sim_encoder', 'num_chan=1'])
-        subprocess.call(['halcmd', 'setp', 'sim-encoder.0.speed', '0.005'])
+        commands.append(['loadrt', 'sim_encoder', 'num_chan=1'])
+        commands.append(['setp', 'sim-encoder.0.speed', '0.005'])
 
-        subprocess.call(['halcmd', 'addf', 'sim-encoder.make-pulses', 'gui'])
-        subprocess.call(['halcmd', 'addf', 'sim-encoder.update-speed', 'gui'])
+        commands.append(['addf', 'sim-encoder.make-pulses', 'gui'])
+        commands.append(['addf', 'sim-encoder.update-speed', 'gui'])
 
+        return commands
 
 
 
-    def findPins(self):
-        pins = subprocess.check_output(['halcmd', 'show', 'pin']).splitlines()
-        pins.pop(0) # "Component Pins:""
-        pins.pop(-1) # Empty line
+
+    def findPins(self, output=None):
+        '''Catalogs the pins from the output of halcmd show pin'''
+        if output is None:
+            output = self._transport.run([['show', 'pin']])
 
         d_in_pins = ['None']
         d_out_pins = ['None']
+        a_in_pins = ['None']
+        a_out_pins = ['None']
+        self._pin_types = {}
+
+        for pin in output.splitlines():
+            items = pin.decode('utf-8').split()
+
+            #Skips the "Component Pins:" header and anything else that isn't a pin
+            if len(items) < 5 or not items[0].isdigit():
+                continue
+
+            pin_type, pin_dir, name = items[1], items[2], items[4]
+            self._pin_types[name] = pin_type
 
-        for pin in pins:
-            line = pin.decode('utf-8')
-            items = line.split()
+            if pin_type == 'bit' and pin_dir == 'IN':
+                d_out_pins.append(name)
 
-            if items[1] == 'bit' and items[2] == 'IN':
-                d_out_pins.append(items[4])
+            elif pin_type == 'bit' and pin_dir == 'OUT':
+                d_in_pins.append(name)
 
-            if items[1] == 'bit' and items[2] == 'OUT':
-                d_in_pins.append(items[4])
+            elif pin_type in ['float', 's32', 'u32'] and pin_dir == 'IN':
+                a_out_pins.append(name)
+
+            elif pin_type in ['float', 's32', 'u32'] and pin_dir == 'OUT':
+                a_in_pins.append(name)
 
         DigitalInputNode.hal_pins = d_in_pins
         DigitalOutputNode.hal_pins = d_out_pins
+        AnalogInputNode.hal_pins = a_in_pins
+        AnalogOutputNode.hal_pins = a_out_pins
 
 
     def samplerHalPins(self):
-        return DigitalInputNode.hal_pins + DigitalOutputNode.hal_pins
+        return DigitalInputNode.hal_pins + DigitalOutputNode.hal_pins + AnalogInputNode.hal_pins + AnalogOutputNode.hal_pins
+
+    def streamerHalPins(self):
+        return DigitalOutputNode.hal_pins + AnalogOutputNode.hal_pins
 
     def samplerIndexes(self):
-        tool_model = self.model()
-        tool_index = tool_model.index(0, 0, QtCore.QModelIndex())
-        indexes = tool_model.indexesOfType(strings.D_IN_NODE, tool_index)
-        indexes += tool_model.indexesOfType(strings.D_OUT_NODE, tool_index)
+        return self.routes().sampler_indexes
 
-        return indexes
+    def streamerIndexes(self):
+        return self.routes().streamer_indexes
 
 
-    def streamerIndexes(self):
-        tool_model = self.model()
-        tool_index = tool_model.index(0, 0, QtCore.QModelIndex())
-        indexes = tool_model.indexesOfType(strings.D_OUT_NODE, tool_index)
 
-        return indexes
+    def samplerCfg(self):
+        return ''.join(self._routes.sampler_types)
 
+    def streamerCfg(self):
+        return ''.join(self._routes.streamer_types)
 
+    def analogIndexes(self):
+        return self.routes().analog_indexes
 
+    def samplerCommands(self):
+        print("\nSampler CFG is: ", self.samplerCfg())
+        return self._transport.samplerCommands(self.samplerCfg(), self._routes.sampler_pins)
 
+    def streamerCommands(self):
+        print("\nStreamer CFG is: ", self.streamerCfg())
+        return self._transport.streamerCommands(self.streamerCfg(), self._routes.streamer_pins)
 
 
+    def startSampler(self):
+        if self._transport.direct:
+            return #Pins are read each tick
 
-    def loadSampler(self):
-        cfg = 'cfg='
-        connected_pins = []
+        #Held on to, the fd closes if the file is garbage collected
+        self._sampler = self._transport.openSampler()
 
-        #Each halpin is only loaded once
-        for index in self.samplerIndexes():
-            for hal_pin in index.internalPointer().halPins:
-                if hal_pin in self.samplerHalPins() and hal_pin is not None:
-                    if hal_pin not in connected_pins:
-                        cfg += 'b'
-                    connected_pins.append(hal_pin)
+        if self._sampler_mode == 'notifier':
+            self._sampler_fd = self._sampler.fileno()
+            self._sampler_partial = b''
+            os.set_blocking(self._sampler_fd, False)
 
-        subprocess.call(['halcmd', 'loadrt', 'sampler', 'depth=100', cfg])
-        print("\nSampler CFG is: ", cfg)
+            self._sampler_notifier = QtCore.QSocketNotifier(self._sampler_fd, QtCore.QSocketNotifier.Read)
+            self._sampler_notifier.activated.connect(self.onSamplerReadable)
 
+        else:
+            t = Thread(target=self.enqueue_sampler, args=(io.BufferedReader(self._sampler), self.sampler_queue))
+            t.daemon = True
+            t.start()
 
-    def loadStreamer(self):
-        cfg = 'cfg='
-        connected_pins = []
 
-        #Each halpin is only loaded once
-        for index in self.streamerIndexes():
-            for hal_pin in index.internalPointer().halPins:
-                if hal_pin in DigitalOutputNode.hal_pins and hal_pin is not None:
-                    if hal_pin not in connected_pins:
-                        cfg += 'b'
-                        self._previous_stream.append(0)
-                    connected_pins.append(hal_pin)
+    def startStreamer(self):
+        if self._transport.direct:
+            return
 
-        subprocess.call(['halcmd', 'loadrt', 'streamer', 'depth=100', cfg])
-        print("\nStreamer CFG is: ", cfg)
+        self._streamer = self._transport.openStreamer()
 
 
-    def connectSamplerSignals(self):
-        sampler_pin = 0
-        connected_pins = [] #['pin_a','pin_b'], ordered by how its connected to the sampler
 
-        for index in self.samplerIndexes():
-            signal_names = index.internalPointer().signals()
-            node_sampler_pins = []
+    def processData(self):
+        if self._transport.direct:
+            self.applySamples(self._transport.readPins()[np.newaxis])
+        else:
+            self.readSampler()
+            self.flushAnalog()
+        self.writeStreamer()
+        self.updateDevices()
+
+
+    def updateDevices(self):
+        '''Recomputes the state, status and icon layers of the devices whose HAL nodes changed since the last call'''
+        routes = self.routes()
+        if not self._changed_devices:
+            return
+
+        changed_devices = self._changed_devices
+        self._changed_devices = set()
+        changed_devices.discard(-1)
+
+        #set the device states
+        tool_model = self.model()
+        rows = sorted(changed_devices)
+
+        for row, device_state in zip(rows, self.deviceStates(rows).tolist()):
+            index = routes.device_indexes[row]
 
-            for i, hal_pin in enumerate(index.internalPointer().halPins):
-                if hal_pin in self.samplerHalPins() and hal_pin is not None:
-                    if hal_pin not in connected_pins:
-                        subprocess.call(['halcmd', 'net', signal_names[i], hal_pin, '=>','sampler.0.pin.'+str(sampler_pin)])
-                        print(         '\nhalcmd', 'net', signal_names[i], hal_pin, '=>','sampler.0.pin.'+str(sampler_pin))
+            if device_state != tool_model.data(index.siblingAtColumn(16), QtCore.Qt.DisplayRole):
+                self._tool_model.setData(index.siblingAtColumn(16), device_state)
+                device_status = index.internalPointer().status()
+                self._tool_model.setData(index.siblingAtColumn(11), device_status)
+                print("Device State: ", device_state)
 
-                        connected_pins.append(hal_pin)
-                        node_sampler_pins.append(sampler_pin)
-                        sampler_pin += 1
+            #set the device's icon layers
+            for icon_index in routes.device_icons[row]:
+                icon_layer = index.internalPointer().iconLayer()
 
-                    else:
-                        node_sampler_pins.append(connected_pins.index(hal_pin))
+                if icon_layer != icon_index.internalPointer().layer():
+                    tool_model.setData(icon_index.siblingAtColumn(11), icon_layer)
 
-            index.internalPointer().setSamplerPins(node_sampler_pins) # This is a list of indexes
 
 
-        subprocess.call(['halcmd', 'setp', 'sampler.0.enable', 'True'])
-        subprocess.call(['halcmd', 'addf', 'sampler.0', 'gui'])
+    def deviceStates(self, rows=None):
+        '''State of every device, or the devices in rows, from the states the reader last applied.  One dot
+           product of the devices x HAL nodes state matrix with the devices' radix weights'''
+        routes = self.routes()
+        fixed_states = np.array([node.state() for node in routes.fixed_state_nodes], dtype=np.int64)
+        states = np.concatenate((self._sampler_values, self._analog_states, fixed_states))
 
+        columns, weights = routes.device_state_columns, routes.device_state_weights
+        if rows is not None:
+            columns, weights = columns[rows], weights[rows]
 
-        # Sampler userspace component, stdbuf fixes bufering issue
-        self.p_sampler = subprocess.Popen(['stdbuf', '-oL', 'halcmd', 'loadusr', 'halsampler', '-c', '0', '-t'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1)
+        return np.einsum('ij,ij->i', states[columns], weights)
 
-        t = Thread(target=self.enqueue_sampler, args=(self.p_sampler.stdout, self.sampler_queue))
-        t.daemon = True
-        t.start()
 
+    def resetStreamer(self):
+        '''All streamer slots back to 0, the frame is allocated once here and updated in place after'''
+        bit_count = self._routes.streamer_bit_count
+        analog_count = len(self._routes.streamer_pins) - bit_count
+        self._previous_stream = [0]*bit_count + [0.0]*analog_count
 
+        #halstreamer line 'b0 b1 ... bn a0 a1 ...\n', bit slot n's character is at 2n.  Analog text
+        #is variable width so it follows the bits and is only re-encoded when an analog slot changes
+        self._stream_frame = bytearray(b'0 '*bit_count)
+        self._stream_analog = b''
+        if analog_count:
+            self.encodeStreamerAnalog()
+        elif bit_count:
+            self._stream_frame[-1] = ord('\n')
+        self._stream_pending = bytearray()
 
 
-    def connectStreamerSignals(self):
-        streamer_pin = 0
-        connected_pins = [] #['pin_a','pin_b'], ordered by how its connected to the streamer
+    def encodeStreamerAnalog(self):
+        '''Formats the analog slots by their cfg type, halstreamer only takes whole numbers for s32/u32 pins'''
+        bit_count = self._routes.streamer_bit_count
+        fields = []
+        for value, cfg_type in zip(self._previous_stream[bit_count:], self._routes.streamer_types[bit_count:]):
+            if cfg_type == 's':
+                fields.append(str(int(round(value))))
+            elif cfg_type == 'u':
+                fields.append(str(max(0, int(round(value)))))
+            else:
+                fields.append('{:f}'.format(value))
 
-        for index in self.streamerIndexes():
-            signal_names = index.internalPointer().signals()
-            node_streamer_pins = []
+        self._stream_analog = ' '.join(fields).encode() + b'\n'
 
-            for i, hal_pin in enumerate(index.internalPointer().halPins):
-                if hal_pin is not None and hal_pin in DigitalOutputNode.hal_pins:
-                    if hal_pin not in connected_pins:
-                        subprocess.call(['halcmd', 'net', signal_names[i], hal_pin, '=>','streamer.0.pin.'+str(streamer_pin)])
-                        print(         '\nhalcmd', 'net', signal_names[i], hal_pin, '=>','streamer.0.pin.'+str(streamer_pin))
 
-                        connected_pins.append(hal_pin)
-                        node_streamer_pins.append(streamer_pin)
-                        streamer_pin += 1
+    def applyOutputCommands(self, pending):
+        '''Sets the streamer slots from {node: value}, returns True if any slot changed'''
+        routes = self.routes()
+        stream = self._previous_stream
+        frame = self._stream_frame
+        changed = False
 
-                    else:
-                        raise ValueError("Cannot have halpin connected from multiple output nodes")
-                        #node_streamer_pins.append(connected_pins.index(hal_pin))
+        analog_changed = False
 
-            index.internalPointer().setStreamerPins(node_streamer_pins) # This is a list of indexes
+        for node, new_val in pending.items():
+            if new_val is None:
+                continue
 
+            shifts = routes.streamer_node_shifts.get(node)
+            if shifts is not None:
+                for shift, slot in shifts:
+                    bit = (new_val>>shift)&1
+                    if stream[slot] != bit:
+                        stream[slot] = bit
+                        frame[2*slot] = 48 + bit #b'0' or b'1'
+                        changed = True
 
-        subprocess.call(['halcmd', 'setp', 'streamer.0.enable', 'True'])
-        subprocess.call(['halcmd', 'addf', 'streamer.0', 'gui'])
+            elif node in routes.streamer_analog:
+                slot, channel = routes.streamer_analog[node]
+                hal_value = routes.output_calibrations.guiToHal(channel, new_val)
+                if stream[slot] != hal_value:
+                    stream[slot] = hal_value
+                    analog_changed = True
 
+        if analog_changed:
+            self.encodeStreamerAnalog()
 
-        # Streamer userspace component, stdbuf fixes bufering issue
-        self.p_streamer = subprocess.Popen(['halcmd', 'loadusr', 'halstreamer', '-c', '0'], stdin=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return changed or analog_changed
 
 
+    def writeStreamer(self):
+        pending = self._tool_model.outputCommands().take()
+        if not pending or not self.applyOutputCommands(pending):
+            return
 
-    def processData(self):
-        self.readSampler()
-        self.writeStreamer()
+        print("new_stream: ", self._previous_stream)
 
+        if self._transport.direct:
+            self._transport.writePins(self._previous_stream)
+            return
 
-        #set all the device states
-        tool_model = self.model()
-        tool_index = tool_model.index(0, 0, QtCore.QModelIndex())
-        indexes = tool_model.indexesOfType(strings.DEVICE_NODE, tool_index)
+        self.queueStreamerFrame()
+        self.flushStreamer()
 
-        for index in indexes:
-            device_state = index.internalPointer().stateFromChildren()
 
-            if device_state != tool_model.data(index.siblingAtColumn(16), QtCore.Qt.DisplayRole):
-                self._tool_model.setData(index.siblingAtColumn(16), device_state)
-                device_status = index.internalPointer().status()
-                self._tool_model.setData(index.siblingAtColumn(11), device_status)
-                print("Device State: ", device_state)
+    def writeStreamerSequence(self, steps):
+        '''Streams [{node: value}, ...] as one frame per step, halstreamer applies one per thread period.
+           Every frame goes out in a single write'''
+        for pending in steps:
+            if self.applyOutputCommands(pending):
+                if self._transport.direct:
+                    self._transport.writePins(self._previous_stream)
+                else:
+                    self.queueStreamerFrame()
 
+        self.flushStreamer()
 
 
-        #set all the device icon layers
-        indexes = tool_model.indexesOfType(strings.DEVICE_ICON_NODE, tool_index)
-        for index in indexes:
-            icon_layer = index.parent().internalPointer().iconLayer()
+    def queueStreamerFrame(self):
+        self._stream_pending += self._stream_frame
+        self._stream_pending += self._stream_analog
 
-            if icon_layer != index.internalPointer().layer():
-                tool_model.setData(index.siblingAtColumn(11), icon_layer)
 
+    def flushStreamer(self):
+        if not self._stream_pending:
+            return
 
+        self._streamer.write(self._stream_pending)
+        self._streamer.flush()
+        del self._stream_pending[:]
 
-    def writeStreamer(self):
-        new_stream = self._previous_stream[:]
 
-        for index in self.streamerIndexes():
-            try:
-                new_val = index.internalPointer().manualQueueGet()
+    def drainSampler(self):
+        return self.sampler_queue.drain()
 
-                if new_val is not None:
-                    streamer_pins = index.internalPointer().streamerPins()
 
-                    for shift, pin in enumerate(streamer_pins):
-                        if (new_val>>shift)&1 == 1:
-                            new_stream[pin] = 1
-                        else:
-                            new_stream[pin] = 0
+    def decodeSamplerLines(self, lines):
+        '''Converts halsampler -t lines (b'sample_number pin_0 pin_1 ...\\n') into a block of samples
+           returns: (sample_numbers, block) where block is a samples x sampler slots matrix, uint8 when
+                    every slot is a bit and float64 once there's an analog channel'''
+        width = 1 + len(self._routes.sampler_pins)
+        tokens = b' '.join(lines).split()
+
+        if len(tokens) != width*len(lines):
+            #Something other then samples made it into stdout, only keep the well formed lines
+            rows = [line.split() for line in lines]
+            tokens = [token for row in rows if len(row) == width for token in row]
+
+        block = np.array(tokens).reshape(-1, width)
+        sample_numbers = block[:,0].astype(np.int64)
+
+        if self._routes.sampler_bit_count == width - 1:
+            return sample_numbers, block[:,1:].astype(np.uint8)
+        return sample_numbers, block[:,1:].astype(np.float64)
 
-            except Empty:
-                pass
 
-        if new_stream != self._previous_stream:
-            print("new_stream: ", new_stream)
+    def readSampler(self, lines=None, defer_analog=False):
+        '''Applies a block of sampler lines to the tool model, by default everything queued in the sampler ring.
+           defer_analog holds the analog channels for flushAnalog so they're reduced over the whole tick'''
+        routes = self.routes()
+        if lines is None:
+            lines = self.drainSampler()
 
-            tmp = ''
-            for item in new_stream:
-                tmp += str(item)
-                tmp += ' '
+        if not lines or not routes.sampler_pins:
+            return
 
-            tmp = tmp[:-1]+'\n'
+        sample_numbers, bits = self.decodeSamplerLines(lines)
+        self.sampler_queue.countSamples(sample_numbers)
+        self.applySamples(bits, sample_numbers, defer_analog)
 
-            self.p_streamer.stdin.write( tmp.encode() )#hstrip brackets, add \n and convert to bytes
-            self.p_streamer.stdin.flush()
 
-            self._previous_stream = new_stream
+    def applySamples(self, block, sample_numbers=None, defer_analog=False):
+        '''Applies a samples x sampler slots block to the tool model, every transition goes in the edge log'''
+        routes = self.routes()
+        if len(block) == 0:
+            return
 
+        if routes.analog_indexes and defer_analog:
+            self._analog_pending.append(block[:, routes.analog_slots])
+        elif routes.analog_indexes:
+            self.applyAnalog(block[:, routes.analog_slots])
 
-    def readSampler(self):
-        while not self.sampler_queue.empty():
-            data = self.sampler_queue.get_nowait()
-            #print('sampler:', data)
+        if not routes.sampler_indexes:
+            return
 
-            data = data.split(b' ')
-            data.pop(-1) #remove trailing b'\n'
-            current_sample = int(data[0])
-            data.pop(0)
+        bits = block[:, :routes.sampler_bit_count]
+        if bits.dtype != np.uint8:
+            bits = bits.astype(np.uint8)
 
+        if self._debouncer.active():
+            #Debouncing counts every sample of a node, not only the ones where its bits changed
+            rows = np.arange(len(bits))
+            columns = np.arange(len(routes.sampler_nodes))
+            node_values = self._debouncer.filter(bits @ routes.sampler_weights)
+            self._sampler_image = None
 
-            for index in self.samplerIndexes():
-                #List of indexes for what each bits sampler position is
-                sampler_pins = index.internalPointer().samplerPins()
-                val = 0
+        else:
+            #XOR each packed sample with the one before it, only the changed samples and the nodes whose
+            #masks overlap a changed bit get their values computed
+            image = routes.packImage(bits)
+            previous = self._sampler_image if self._sampler_image is not None else ~image[0]
+            changes = image ^ np.vstack((previous, image[:-1]))
+            self._sampler_image = image[-1]
 
-                for shift, pin in enumerate(sampler_pins):
-                    bit = bool(int(data[pin])) #b'0' to False, b'1' to True
-                    val += bit<<shift
+            rows = np.flatnonzero(changes.any(axis=1))
+            if len(rows) == 0:
+                return
 
-                if val != self._tool_model.data(index.siblingAtColumn(20), QtCore.Qt.DisplayRole):
-                    self._tool_model.setData(index.siblingAtColumn(20), val)
-                    name = index.internalPointer().parent().name
-                    #print("setting index:", name,  ': ', val)
+            changed_bits = np.bitwise_or.reduce(changes[rows], axis=0)
+            columns = np.flatnonzero((routes.sampler_masks & changed_bits).any(axis=1))
+            node_values = bits[rows] @ routes.sampler_weights[:, columns]
 
+        #The changed nodes' values, with the last applied values on top to find the transitions
+        values = np.vstack((self._sampler_values[columns], node_values))
+        samples, nodes = np.nonzero(values[1:] != values[:-1])
+        self._sampler_values[columns] = values[-1]
+        if len(samples) == 0:
+            return
+
+        old_values = values[samples, nodes].tolist()
+        new_values = values[samples+1, nodes].tolist()
+        final_values = values[-1]
+        samples, nodes, changed_nodes = rows[samples], columns[nodes], np.unique(nodes)
+
+        numbers = sample_numbers[samples].tolist() if sample_numbers is not None else [None]*len(samples)
+        node_list = routes.sampler_nodes
+        self._edge_log.extend(zip(numbers, [node_list[node] for node in nodes.tolist()], old_values, new_values))
+        self._changed_devices.update(routes.sampler_devices[nodes].tolist())
+
+        if self._catch_up_threshold is not None and len(bits) > self._catch_up_threshold:
+            #Catching up, the model only needs where each changed node ended up
+            for node in changed_nodes.tolist():
+                self._tool_model.setData(routes.sampler_value_indexes[columns[node]], int(final_values[node]))
+
+        else:
+            for node, value in zip(nodes.tolist(), new_values):
+                self._tool_model.setData(routes.sampler_value_indexes[node], value)
+
+
+
+    def flushAnalog(self):
+        '''Applies the analog blocks held back since the last tick as one block'''
+        self.routes()
+        if not self._analog_pending:
+            return
+
+        pending, self._analog_pending = self._analog_pending, []
+        self.applyAnalog(np.vstack(pending))
+
+    def applyAnalog(self, raw):
+        '''Calibrates a samples x analog channels block from HAL to GUI units and classifies every sample into
+           its state with each node's hysteresis and debounce.  The model gets each node's reduction of the
+           block's values and the newest state'''
+        routes = self.routes()
+        values = routes.calibrations.halToGui(raw)
+        latest = self._analog_reduction.reduce(values)
+
+        for channel in np.flatnonzero(latest != self._analog_values).tolist():
+            self._tool_model.setData(routes.analog_value_indexes[channel], float(latest[channel]))
+
+        states = self._analog_debouncer.filter(self._analog_hysteresis.filter(values))[-1]
+        changed = np.flatnonzero(states != self._analog_states)
+        for channel in changed.tolist():
+            self._tool_model.setData(routes.analog_state_indexes[channel], int(states[channel]))
+        self._changed_devices.update(routes.analog_devices[changed].tolist())
+
+        self._analog_values = latest
+        self._analog_states = states
+        return values
 
 
     def enqueue_sampler(self, out, queue):
         for line in iter(out.readline, b''):
             queue.put(line)
         out.close()
+
+
+    def resumeSampler(self, notifier):
+        '''End of the holdoff, notifier is skipped if the sampler was stopped or restarted since'''
+        if notifier is self._sampler_notifier:
+            notifier.setEnabled(True)
+
+    def onSamplerReadable(self):
+        ''''notifier' mode, reads everything halsampler has written so far and applies the digital nodes right away.
+           The devices and analog nodes update on the tick'''
+        chunks = [self._sampler_partial]
+        eof = False
+
+        while True:
+            try:
+                chunk = os.read(self._sampler_fd, 65536)
+            except BlockingIOError:
+                break
+
+            if not chunk:
+                eof = True
+                break
+            chunks.append(chunk)
+
+        data = b''.join(chunks)
+        end = data.rfind(b'\n') + 1
+        self._sampler_partial = data[end:]
+
+        if eof:
+            self._sampler_notifier.setEnabled(False)
+        elif self._sampler_holdoff:
+            self._sampler_notifier.setEnabled(False)
+            notifier = self._sampler_notifier
+            QtCore.QTimer.singleShot(self._sampler_holdoff, lambda: self.resumeSampler(notifier))
+
+        if end:
+            #Through the ring like the thread's lines, so the policy and stats hold in both modes
+            #Digital nodes update now, the analog ones wait for the tick so their reduction covers all of it
+            self.sampler_queue.putLines(data[:end].splitlines(True))
+            self.readSampler(defer_analog=True)
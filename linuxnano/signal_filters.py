@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+class Debouncer():
+    '''Per channel debounce over a samples x channels block, a channel only takes a new value once it
+       has read the same thing for its count of samples in a row.  Runs carry over from one block to the
+       next, so a value that settles across two ticks is still accepted.
+    '''
+    def __init__(self, counts, values):
+        self._counts = np.asarray(counts, dtype=np.int64)
+        self._accepted = np.array(values, dtype=np.int64)
+        self._candidate = self._accepted.copy()  #Value of the run at the end of the last block
+        self._run = self._counts.copy()           #Its length, the starting values are already accepted
+
+    def active(self):
+        return bool(np.any(self._counts > 1))
+
+    def filter(self, values):
+        '''Returns values with every channel held at its last accepted value until a new one is stable'''
+        values = np.asarray(values)
+        if not self.active() or len(values) == 0:
+            return values
+
+        index = np.arange(1, len(values) + 1)[:, np.newaxis]
+        changed = values != np.vstack((self._candidate, values[:-1]))
+
+        #Sample each channel's current run started on, 0 if it's still the run from the last block
+        start = np.maximum.accumulate(np.where(changed, index, 0), axis=0)
+        run = np.where(start == 0, index + self._run, index - start + 1)
+
+        #Forward fill the last stable sample of each channel
+        last_stable = np.maximum.accumulate(np.where(run >= self._counts, index, 0), axis=0)
+        stable_values = np.take_along_axis(values, np.maximum(last_stable - 1, 0), axis=0)
+        filtered = np.where(last_stable == 0, self._accepted, stable_values)
+
+        self._accepted = filtered[-1].astype(np.int64)
+        self._candidate = values[-1].astype(np.int64)
+        self._run = np.minimum(run[-1], self._counts)
+        return filtered
+
+
+
+class Hysteresis():
+    '''Classifies a samples x channels block of analog values into states with a band around every
+       threshold.  A channel moves up a state once it's band/2 above the threshold and back down once it's
+       band/2 below it, inside the band it keeps the state it had.
+    '''
+    def __init__(self, classifier, bands, states):
+        self._classifier = classifier
+        self._half_bands = np.asarray(bands, dtype=np.float64)/2
+        self._states = np.array(states, dtype=np.int64)
+
+    def active(self):
+        return bool(np.any(self._half_bands > 0))
+
+    def filter(self, values):
+        '''Returns the state of every channel for every sample'''
+        lowest  = self._classifier.classify(values - self._half_bands)
+        if not self.active():
+            self._states = lowest[-1]
+            return lowest
+
+        highest = self._classifier.classify(values + self._half_bands)
+        states = lowest.copy()
+        state = self._states
+
+        #Only the samples where some channel is inside a band depend on the previous state
+        in_band = np.flatnonzero(np.any(lowest != highest, axis=1))
+        previous = 0
+        for sample in in_band.tolist():
+            if sample > previous:
+                state = lowest[sample - 1]
+            state = np.minimum(np.maximum(state, lowest[sample]), highest[sample])
+            states[sample] = state
+            previous = sample + 1
+
+        self._states = states[-1]
+        return states
+
+
+
+class Reduction():
+    '''Reduces a samples x channels block to one value per channel, each channel with its own reduction
+            - last   : The newest sample
+            - mean, median, min, max : Over every sample in the block
+            - ema    : Exponential moving average carried across blocks, y += alpha*(x - y) for each sample
+    '''
+    reducers = {'mean'  : lambda values: values.mean(axis=0),
+                'median': lambda values: np.median(values, axis=0),
+                'min'   : lambda values: values.min(axis=0),
+                'max'   : lambda values: values.max(axis=0)}
+
+    def __init__(self, types, alphas):
+        types = np.asarray(types, dtype=object)
+        self._groups = [(np.flatnonzero(types == name), reducer) for name, reducer in self.reducers.items() if np.any(types == name)]
+        self._ema = np.flatnonzero(types == 'ema')
+        self._alphas = np.asarray(alphas, dtype=np.float64)[self._ema]
+        self._averages = np.full(len(self._ema), np.nan)
+
+    def reduce(self, values):
+        '''Returns the reduced value of each channel'''
+        reduced = values[-1].copy()
+        for channels, reducer in self._groups:
+            reduced[channels] = reducer(values[:, channels])
+
+        if len(self._ema):
+            reduced[self._ema] = self.ema(values[:, self._ema])
+
+        return reduced
+
+    def ema(self, values):
+        '''Whole block at once, the average after n samples is (1-a)^n*y + sum(a*(1-a)^(n-1-k)*x[k])'''
+        start = np.where(np.isnan(self._averages), values[0], self._averages)
+        decay = 1.0 - self._alphas
+        ages = np.arange(len(values) - 1, -1, -1)[:, np.newaxis]
+
+        weights = self._alphas*decay**ages
+        self._averages = decay**len(values)*start + (weights*values).sum(axis=0)
+        return self._averages
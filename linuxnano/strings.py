@@ -43,6 +43,7 @@ class strings():
 
 
     DEFAULT_CONFIGN_PATH = '/usr/local/LinuxNano/config/setup.xml'
+    DEFAULT_HAL_SCRIPT_PATH = '/usr/local/LinuxNano/config/linuxnano.hal'
 
 
     def enum(*enumerated):
@@ -58,6 +59,8 @@ class strings():
 
     ANALOG_MANUAL_DISPLAY_TYPES = enum('number_box','slider','dial')
     ANALOG_SCALE_TYPES = enum('linear','cubic_spline')
+    ANALOG_REDUCTION_TYPES = enum('last','mean','median','min','max','ema')
+    DEBOUNCE_UNITS = enum('samples','ms')
 
 
 
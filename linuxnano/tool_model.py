@@ -1,7 +1,8 @@
+import bisect
 from PyQt5 import QtCore, QtGui
 
 from linuxnano.strings import strings
-from linuxnano.data import Node, ToolNode, SystemNode, DeviceNode, DeviceIconNode, DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode
+from linuxnano.data import NodeSettings, OutputCommands, HalNode, Node, ToolNode, SystemNode, DeviceNode, DeviceIconNode, DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode
 from linuxnano.message_box import MessageBox
 
 
@@ -12,55 +13,64 @@ class ToolModel(QtCore.QAbstractItemModel):
         super().__init__(parent)
         self._root_node = Node()
 
+        self._registry = {}       #{type_info: {node: None}} every node inserted through the model, by type
+        self._registry_order = {} #{type_info: [node, ...]} in tree order, nodes are bisected in/out by treePath
+        self._node_settings = NodeSettings() #Handed to every HalNode in the model, see HalNode.settingsChanged
+        self._output_commands = OutputCommands() #Manual output commands of every HalNode in the model, taken by the HalReader
+
     def asXml(self):
         return self._root_node.asXml()
 
     #TODO: Do we clear the current tree if there's one?
     def loadTool(self, tool_tree):
+        '''Builds the whole tree off the model then adds it with one reset, views only see the finished tool'''
         try:
-            root_index = self.createIndex(0,0,self._root_node)
-
-            tool_item = tool_tree.getroot()
-            tool_index = self.insertChild(root_index, strings.TOOL_NODE)
-            tool_index.internalPointer().loadAttribFromXML(tool_item)
-
-            for system_item in tool_item.findall(strings.SYSTEM_NODE):
-                system_index = self.insertChild(tool_index, strings.SYSTEM_NODE)
+            tool_node = self.buildTool(tool_tree.getroot())
 
-                for device_item in system_item.findall(strings.DEVICE_NODE):
-                    device_index = self.insertChild(system_index, strings.DEVICE_NODE)
+        except Exception as e:
+            MessageBox("Failed to load tool from element tree", e)
+            return False
 
-                    device_icon_xml = device_item.find(strings.DEVICE_ICON_NODE)
-                    device_icon_index = self.insertChild(device_index, strings.DEVICE_ICON_NODE)
+        self.beginResetModel()
+        self._root_node.insertChild(0, tool_node)
+        self.register(tool_node)
+        self.endResetModel()
+        return True
 
-                    for xml_item in device_item.findall(strings.D_IN_NODE):
-                        d_in_index = self.insertChild(device_index, strings.D_IN_NODE)
-                        d_in_index.internalPointer().loadAttribFromXML(xml_item)
+    def buildTool(self, tool_item):
+        '''Returns a ToolNode with everything in tool_item, children are added in the same rows insertChild uses'''
+        tool_node = ToolNode()
+        tool_node.loadAttribFromXML(tool_item)
 
-                    for xml_item in device_item.findall(strings.D_OUT_NODE):
-                        d_out_index = self.insertChild(device_index, strings.D_OUT_NODE)
-                        d_out_index.internalPointer().loadAttribFromXML(xml_item)
+        for system_item in tool_item.findall(strings.SYSTEM_NODE):
+            system_node = SystemNode()
+            tool_node.addChild(system_node)
 
-                    for xml_item in device_item.findall(strings.A_IN_NODE):
-                        a_in_index = self.insertChild(device_index, strings.A_IN_NODE)
-                        a_in_index.internalPointer().loadAttribFromXML(xml_item)
+            for device_item in system_item.findall(strings.DEVICE_NODE):
+                device_node = DeviceNode()
+                system_node.addChild(device_node)
 
-                    for xml_item in device_item.findall(strings.A_OUT_NODE):
-                        a_out_index = self.insertChild(device_index, strings.A_OUT_NODE)
-                        a_out_index.internalPointer().loadAttribFromXML(xml_item)
+                device_icon_node = DeviceIconNode()
+                device_node.addChild(device_icon_node)
 
-                    #Must load after analog nodes since we have an analog node name
-                    if device_icon_xml is not None:
-                       device_icon_index.internalPointer().loadAttribFromXML(device_icon_xml)
+                for node_type, node_class in [(strings.D_IN_NODE,  DigitalInputNode),
+                                              (strings.D_OUT_NODE, DigitalOutputNode),
+                                              (strings.A_IN_NODE,  AnalogInputNode),
+                                              (strings.A_OUT_NODE, AnalogOutputNode)]:
+                    for xml_item in device_item.findall(node_type):
+                        node = node_class()
+                        device_node.addChild(node)
+                        node.loadAttribFromXML(xml_item)
 
-                    device_index.internalPointer().loadAttribFromXML(device_item)
-                system_index.internalPointer().loadAttribFromXML(system_item)
+                #Must load after analog nodes since we have an analog node name
+                device_icon_xml = device_item.find(strings.DEVICE_ICON_NODE)
+                if device_icon_xml is not None:
+                    device_icon_node.loadAttribFromXML(device_icon_xml)
 
-            return True
+                device_node.loadAttribFromXML(device_item)
+            system_node.loadAttribFromXML(system_item)
 
-        except Exception as e:
-            MessageBox("Failed to load tool from element tree", e)
-            return False
+        return tool_node
 
 
     def rowCount(self, parent):
@@ -157,6 +167,7 @@ class ToolModel(QtCore.QAbstractItemModel):
 
             else: MessageBox('Attempting to insert unknown node of type', child_type)
 
+            self.register(parent_node.child(insert_row))
             self.endInsertRows()
 
             new_child_index = self.index(insert_row, 0, parent_index)
@@ -186,6 +197,8 @@ class ToolModel(QtCore.QAbstractItemModel):
         self.beginRemoveRows(parent_index, row, row+count-1)
 
         for i in list(range(count)):
+            if row < parent_node.childCount():
+                self.unregister(parent_node.child(row))
             parent_node.removeChild(row)
 
         self.endRemoveRows()
@@ -273,24 +286,70 @@ class ToolModel(QtCore.QAbstractItemModel):
 
 
 
-    def indexesOfType(self, index_type, parent_index=None):
-        try:
-            parent_node = parent_index.internalPointer() if parent_index.isValid() else self._root_node
-        except:
-            parent_index = self.index(0, 0, QtCore.QModelIndex())
-            parent_node = self._root_node
-
-        indexes = []
+    def nodeSettings(self):
+        return self._node_settings
+
+    def outputCommands(self):
+        return self._output_commands
+
+    def register(self, node):
+        '''Adds node and its children to the type registry'''
+        nodes = self._registry.setdefault(node.typeInfo(), {})
+        if node not in nodes:
+            nodes[node] = None
+            order = self._registry_order.setdefault(node.typeInfo(), [])
+            order.insert(bisect.bisect_right(order, self.treePath(node), key=self.treePath), node)
+
+        if isinstance(node, HalNode):
+            node.setNodeSettings(self._node_settings)
+            node.setOutputCommands(self._output_commands)
+
+        for child in node.children():
+            self.register(child)
+
+    def unregister(self, node):
+        '''Removes node and its children from the type registry, called before they're taken out of the tree'''
+        nodes = self._registry.get(node.typeInfo(), {})
+        if node in nodes:
+            del nodes[node]
+            order = self._registry_order[node.typeInfo()]
+            del order[bisect.bisect_left(order, self.treePath(node), key=self.treePath)]
+
+        if isinstance(node, HalNode):
+            node.setNodeSettings(None)
+            node.setOutputCommands(None)
+            try:
+                self._output_commands.pop(node)
+            except KeyError:
+                pass
+
+        for child in node.children():
+            self.unregister(child)
+
+    def treePath(self, node):
+        '''Rows from the root down to node, sorting by these puts nodes in tree order'''
+        path = []
+        while node.parent() is not None:
+            path.append(node.row())
+            node = node.parent()
+        return path[::-1]
+
+    def nodesOfType(self, node_type, parent_index=None):
+        '''Every node of node_type below parent_index (default everything) in tree order, from the registry'''
+        nodes = self._registry_order.get(node_type, [])
+
+        parent_node = parent_index.internalPointer() if parent_index is not None and parent_index.isValid() else None
+        if parent_node is None or parent_node is self._root_node:
+            return nodes[:]
+
+        #parent_node's descendants sort between its own path and its next sibling's
+        path = self.treePath(parent_node)
+        start = bisect.bisect_right(nodes, path, key=self.treePath)
+        end = bisect.bisect_left(nodes, path[:-1] + [path[-1] + 1], key=self.treePath)
+        return nodes[start:end]
 
-        for row in range(self.rowCount(parent_index)):
-            index = parent_index.child(row, 0)
-
-            if index.internalPointer().typeInfo() == index_type:
-                indexes.append(index)
-
-            indexes += self.indexesOfType(index_type, index)
-
-        return indexes
+    def indexesOfType(self, index_type, parent_index=None):
+        return [self.createIndex(node.row(), 0, node) for node in self.nodesOfType(index_type, parent_index)]
 
 
 
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''Benchmarks for the HAL reader hot path, these don't need LinuxCNC installed.
+   Run from the repo root: python3 tests/bench_hardware.py
+'''
+import os
+import sys
+import time
+import copy
+import shutil
+import tempfile
+from queue import Queue, Empty
+
+from PyQt5 import QtCore, QtWidgets
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from linuxnano.tool_model import ToolModel
+from linuxnano.hardware import HalReader, HalRoutes
+from linuxnano.hal_transport import HalcmdTransport, FakeHalTransport, HalComponentTransport, FakeHalModule
+from linuxnano.strings import strings
+from linuxnano.data import OutputCommands
+from linuxnano.calibration_table_model import CalibrationTableModel, CalibrationBank
+
+
+# halsampler stand in, the sample number is the time the line was written so the reader can measure latency
+FAKE_HALSAMPLER = '''
+import sys, time
+rate, seconds, pins = float(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3])
+start = time.monotonic()
+i = 0
+while time.monotonic() - start < seconds:
+    now = time.monotonic()
+    while i < (now - start)*rate:
+        sys.stdout.write(str(time.monotonic_ns()//1000) + ' ' + ' '.join(str((i>>b)&1) for b in range(pins)) + ' \\n')
+        i += 1
+    sys.stdout.flush()
+    time.sleep(0.0005)
+'''
+
+# halcmd stand in for machines without LinuxCNC, reads a -f script from stdin so each mode pays for its processes
+FAKE_HALCMD = '''
+import sys
+if '-f' in sys.argv:
+    sys.stdin.read()
+'''
+
+
+def loadReader(tool_file='tests/tools/tool_model_1.xml', transport=None):
+    tool_model = ToolModel()
+    tool_model.loadTool(ET.parse(tool_file))
+
+    reader = HalReader(transport)
+    reader.setModel(tool_model)
+
+    hal_pins = []
+    for type_info in [strings.D_IN_NODE, strings.D_OUT_NODE]:
+        for index in tool_model.indexesOfType(type_info):
+            hal_pins += index.internalPointer().halPins
+
+    reader.routes().assignSlots(tool_model, hal_pins, [])
+    return reader
+
+
+def bigTool(devices=500, tool_file='tests/tools/tool_model_1.xml'):
+    '''tool_model_1 with its first device copied until the tool has this many'''
+    tree = ET.parse(tool_file)
+    system = tree.getroot().find(strings.SYSTEM_NODE)
+    device = system.find(strings.DEVICE_NODE)
+
+    for i in range(devices - len(tree.getroot().findall('.//' + strings.DEVICE_NODE))):
+        new_device = copy.deepcopy(device)
+        new_device.set('name', 'device_' + str(i))
+        system.append(new_device)
+
+    tool_model = ToolModel()
+    tool_model.loadTool(tree)
+    return tool_model
+
+
+def benchSamplerMode(mode, rate=1000, seconds=2.0):
+    '''Returns (mean latency, max latency, cpu seconds) from halsampler writing a line to it reaching the model'''
+    reader = loadReader()
+    pins = len(reader.routes().sampler_pins)
+    latencies = []
+
+    decode = reader.decodeSamplerLines
+    def timedDecode(lines):
+        sample_numbers, bits = decode(lines)
+        latencies.extend((time.monotonic_ns()//1000 - sample_numbers).tolist())
+        return sample_numbers, bits
+    reader.decodeSamplerLines = timedDecode
+
+    transport = reader.transport()
+    transport.samplerArgs = lambda: [sys.executable, '-c', FAKE_HALSAMPLER, str(rate), str(seconds), str(pins)]
+    reader.setSamplerMode(mode)
+    reader.timer.start(100)
+
+    cpu = time.process_time()
+    reader.startSampler()
+
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(int(seconds*1000) + 300, loop.quit)
+    loop.exec_()
+
+    reader.timer.stop()
+    reader.processData()
+    cpu = time.process_time() - cpu
+    transport.p_sampler.wait()
+
+    latencies = np.array(latencies) / 1e3
+    return latencies.mean(), latencies.max(), cpu
+
+
+def fakePins():
+    pins = {'sim-encoder.0.phase-A' : ('bit', 'OUT'),
+            'sim-encoder.0.phase-B' : ('bit', 'OUT'),
+            'hardware-sim.0.d-in-0' : ('bit', 'OUT')}
+    for i in range(4):
+        pins['hardware-sim.0.d-out-' + str(i)] = ('bit', 'IN')
+    return pins
+
+
+def benchFakeHal(rate=10000, seconds=2.0):
+    '''Returns (lines/sec reaching the model, overruns, cpu seconds) with the in-process fake HAL sampling at rate'''
+    pins = fakePins()
+    stimulus = lambda n: {'sim-encoder.0.phase-A': n&1, 'sim-encoder.0.phase-B': (n>>1)&1}
+    transport = FakeHalTransport(pins, rate=rate, stimulus=stimulus)
+    reader = loadReader(transport=transport)
+
+    lines = []
+    decode = reader.decodeSamplerLines
+    def countedDecode(lines_in):
+        lines.append(len(lines_in))
+        return decode(lines_in)
+    reader.decodeSamplerLines = countedDecode
+
+    reader.setHalScriptPath(os.path.join(tempfile.mkdtemp(), 'linuxnano.hal'))
+
+    cpu = time.process_time()
+    reader.start()
+
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(int(seconds*1000), loop.quit)
+    loop.exec_()
+
+    reader.stop()
+    cpu = time.process_time() - cpu
+    return sum(lines)/seconds, transport.overruns, cpu
+
+
+def benchHalComponent(ticks=2000):
+    '''Returns the mean µs per tick reading and writing the pins through a HAL component'''
+    fake = FakeHalTransport(fakePins())
+    reader = loadReader(transport=HalComponentTransport(fake, FakeHalModule(fake)))
+    reader.setHalScriptPath(os.path.join(tempfile.mkdtemp(), 'linuxnano.hal'))
+    reader.start()
+    reader.timer.stop()
+
+    t0 = time.perf_counter()
+    for i in range(ticks):
+        fake.setPin('sim-encoder.0.phase-A', i&1)
+        reader.processData()
+    elapsed = time.perf_counter() - t0
+
+    reader.stop()
+    return elapsed/ticks*1e6
+
+
+def benchOutputCommands(nodes=500, ticks=2000):
+    '''Returns µs per tick polling a Queue per output node vs one shared OutputCommands, idle and with one command'''
+    queues = [Queue() for i in range(nodes)]
+    def pollQueues():
+        for q in queues:
+            try:
+                q.get_nowait()
+            except Empty:
+                pass
+
+    channel = OutputCommands()
+    keys = [object() for i in range(nodes)]
+
+    results = []
+    for name, put, poll in [('queue per node', lambda i: queues[i%nodes].put_nowait(1), pollQueues),
+                            ('OutputCommands', lambda i: channel.put(keys[i%nodes], 1), channel.take)]:
+        t0 = time.perf_counter()
+        for i in range(ticks):
+            poll()
+        idle = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for i in range(ticks):
+            put(i)
+            poll()
+        busy = time.perf_counter() - t0
+
+        results.append((name, idle/ticks*1e6, busy/ticks*1e6))
+    return results
+
+
+def benchStreamerFrame(slots=500, ticks=2000):
+    '''Returns µs per frame building the halstreamer line by string concatenation vs updating a preallocated frame'''
+    stream = [0]*slots
+    t0 = time.perf_counter()
+    for i in range(ticks):
+        new_stream = stream[:]
+        new_stream[i%slots] = i&1
+        tmp = ''
+        for item in new_stream:
+            tmp += str(item)
+            tmp += ' '
+        data = (tmp[:-1]+'\n').encode()
+        stream = new_stream
+    concat = time.perf_counter() - t0
+
+    frame = bytearray(b'0 '*slots)
+    frame[-1] = ord('\n')
+    t0 = time.perf_counter()
+    for i in range(ticks):
+        frame[2*(i%slots)] = 48 + (i&1)
+        data = frame
+    in_place = time.perf_counter() - t0
+
+    return concat/ticks*1e6, in_place/ticks*1e6
+
+
+def benchUpdateDevices(devices=500, ticks=200):
+    '''Returns µs per tick recomputing every device vs only the ones with changed HAL nodes, on an idle tool'''
+    tool_model = bigTool(devices)
+    reader = HalReader()
+    reader.setModel(tool_model)
+    reader.routes()
+    reader.updateDevices()
+
+    t0 = time.perf_counter()
+    for i in range(ticks):
+        reader._changed_devices = set(range(devices))
+        reader.updateDevices()
+    every_device = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(ticks):
+        reader.updateDevices()
+    changed_only = time.perf_counter() - t0
+
+    return every_device/ticks*1e6, changed_only/ticks*1e6
+
+
+def benchChangeDetection(slots=1024, samples=100, repeat=20):
+    '''Returns µs per block finding the changed nodes (one per slot) with the full node value matrix vs
+       XORing the packed IO image, when one bit toggles in the block'''
+    weights = np.eye(slots, dtype=np.int64)
+    masks = HalRoutes.packImage(weights.T != 0)
+    bits = np.zeros((samples, slots), dtype=np.uint8)
+    bits[samples//2:, slots//2] = 1
+    previous_values = np.zeros(slots, dtype=np.int64)
+    previous_image = HalRoutes.packImage(bits[:1])[0]
+
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        values = np.vstack((previous_values, bits @ weights))
+        np.nonzero(values[1:] != values[:-1])
+    matrix = (time.perf_counter() - t0)/repeat
+
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        image = HalRoutes.packImage(bits)
+        changes = image ^ np.vstack((previous_image, image[:-1]))
+        rows = np.flatnonzero(changes.any(axis=1))
+        columns = np.flatnonzero((masks & np.bitwise_or.reduce(changes[rows], axis=0)).any(axis=1))
+        bits[rows] @ weights[:, columns]
+    packed = (time.perf_counter() - t0)/repeat
+
+    return matrix*1e6, packed*1e6
+
+
+def benchCalibration(channels=32, samples=100, repeat=200):
+    '''Returns µs per call converting a samples x channels block through a CalibrationBank, and through one
+       cubic spline transform for the same number of readings'''
+    models = []
+    for i in range(channels):
+        model = CalibrationTableModel()
+        model.setDataArray([['hal_value', 'gui_value'], [0.0, 0.0], [2.0, 10.0*i + 1], [5.0, 20.0*i + 5], [10.0, 50.0*i + 10]])
+        models.append(model)
+
+    bank = CalibrationBank(models)
+    raw = np.random.uniform(0, 10, (samples, channels))
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        bank.halToGui(raw)
+    linear = (time.perf_counter() - t0)/repeat
+
+    spline = models[1].transform('cubic_spline')
+    raw = raw.reshape(-1)
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        spline(raw)
+    cubic = (time.perf_counter() - t0)/repeat
+
+    return linear*1e6, cubic*1e6
+
+
+def benchBringUp(mode):
+    '''Returns (commands, seconds) to run the tool's HAL bring up through HalcmdTransport in mode, the real
+       halcmd is used when it's installed
+    '''
+    transport = HalcmdTransport()
+    transport.setMode(mode)
+    if shutil.which('halcmd') is None:
+        transport.halcmdArgs = lambda: [sys.executable, '-c', FAKE_HALCMD]
+
+    reader = loadReader(transport=transport)
+    commands  = reader.setupCommands() + [['show', 'pin']]
+    commands += reader.samplerCommands() + reader.streamerCommands() + [['start']]
+
+    reader.runHalCommands(commands)
+    if shutil.which('halcmd') is not None:
+        transport.stop()
+
+    return len(commands), reader.bringUpTime()
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+
+    print("Sampler ingestion, 1 kHz fake halsampler for 2 sec (latency in ms)")
+    for mode in ['thread', 'notifier']:
+        mean, worst, cpu = benchSamplerMode(mode)
+        print("  {:<10} mean: {:7.2f}   max: {:7.2f}   cpu: {:.3f} sec".format(mode, mean, worst, cpu))
+
+    print("Fake HAL, 10 kHz sampler for 2 sec")
+    rate, overruns, cpu = benchFakeHal()
+    print("  lines/sec: {:9.0f}   overruns: {:6d}   cpu: {:.3f} sec".format(rate, overruns, cpu))
+
+    print("Output commands, 500 output nodes (µs per tick)")
+    for name, idle, busy in benchOutputCommands():
+        print("  {:<15} idle: {:8.2f}   one command: {:8.2f}".format(name, idle, busy))
+
+    print("Streamer frame, 500 slots (µs per frame)")
+    concat, in_place = benchStreamerFrame()
+    print("  string concat: {:8.2f}   preallocated frame: {:8.2f}".format(concat, in_place))
+
+    print("Change detection, 100 samples x 1024 digital points (µs per block)")
+    matrix, packed = benchChangeDetection()
+    print("  value matrix: {:10.1f}   packed image XOR: {:8.1f}".format(matrix, packed))
+
+    print("Calibration, 100 samples x 32 channels (µs per block)")
+    linear, cubic = benchCalibration()
+    print("  linear bank: {:8.1f}   cubic spline: {:8.1f}".format(linear, cubic))
+
+    print("Device updates, idle 500 device tool (µs per tick)")
+    every_device, changed_only = benchUpdateDevices()
+    print("  every device: {:10.1f}   changed only: {:8.1f}".format(every_device, changed_only))
+
+    bring_ups = [(mode,) + benchBringUp(mode) for mode in ['script', 'commands']] #samplerCommands prints the cfg
+    print("HAL bring up through halcmd" + ("" if shutil.which('halcmd') else ", stand in halcmd (LinuxCNC isn't installed)") + " (sec)")
+    for mode, commands, seconds in bring_ups:
+        print("  {:<10} {:4d} commands: {:7.3f}".format(mode, commands, seconds))
+
+    print("HAL component, read + apply + write per tick")
+    print("  {:.1f} µs".format(benchHalComponent()))
+
+
+if __name__ == '__main__':
+    main()
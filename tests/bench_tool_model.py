@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''Benchmarks for the tool model on wide systems, these don't need LinuxCNC installed.
+   Run from the repo root: python3 tests/bench_tool_model.py
+'''
+import sys
+import copy
+import time
+import xml.etree.ElementTree as ET
+
+from PyQt5 import QtCore, QtWidgets
+
+from linuxnano.tool_model import ToolModel
+from linuxnano.strings import strings
+from linuxnano.data import DeviceNode, DeviceIconNode
+
+
+def wideTool(devices):
+    '''A tool with one system holding devices devices, each with an icon'''
+    tool_model = ToolModel()
+    root_index = tool_model.createIndex(0, 0, tool_model._root_node)
+    tool_index = tool_model.insertChild(root_index, strings.TOOL_NODE)
+    system_index = tool_model.insertChild(tool_index, strings.SYSTEM_NODE)
+
+    system = system_index.internalPointer()
+    for i in range(devices):
+        device = DeviceNode()
+        device.name = 'device_' + str(i)
+        system.addChild(device)
+        DeviceIconNode(device)
+
+    return tool_model, system_index
+
+
+def benchParent(devices):
+    '''Returns µs per ToolModel.parent() call for a device's icon, with the cached row and with a linear scan'''
+    tool_model, system_index = wideTool(devices)
+    icon_indexes = [tool_model.index(0, 0, tool_model.index(row, 0, system_index)) for row in range(devices)]
+
+    t0 = time.perf_counter()
+    for index in icon_indexes:
+        tool_model.parent(index)
+    cached = time.perf_counter() - t0
+
+    siblings = system_index.internalPointer().children()
+    t0 = time.perf_counter()
+    for index in icon_indexes:
+        device = index.internalPointer().parent()
+        tool_model.createIndex(siblings.index(device), 0, device)
+    scan = time.perf_counter() - t0
+
+    return cached/devices*1e6, scan/devices*1e6
+
+
+def benchNames(devices):
+    '''Returns µs per device to add devices devices all named the same, so every one needs a suffix'''
+    tool_model, system_index = wideTool(0)
+    system = system_index.internalPointer()
+
+    t0 = time.perf_counter()
+    for i in range(devices):
+        device = DeviceNode()
+        device.name = 'device'
+        system.addChild(device)
+
+    return (time.perf_counter() - t0)/devices*1e6
+
+
+def walkAttrs(node):
+    '''attrs() as it was, walking every class dict in the mro for every call'''
+    kv = {}
+    for cls in node.__class__.__mro__:
+        for k, v in sorted(cls.__dict__.items()):
+            if isinstance(v, property):
+                kv[k] = v.fget(node)
+    return kv
+
+
+def benchAttrs(devices):
+    '''Returns µs per node for attrs() from the class schema and from walking the mro, and ms for asXml()'''
+    tool_model, system_index = wideTool(devices)
+    nodes = []
+    for device in system_index.internalPointer().children():
+        nodes += [device] + device.children()
+
+    t0 = time.perf_counter()
+    for node in nodes:
+        node.attrs()
+    schema = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for node in nodes:
+        walkAttrs(node)
+    walk = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    tool_model.asXml()
+    save = time.perf_counter() - t0
+
+    return schema/len(nodes)*1e6, walk/len(nodes)*1e6, save*1e3
+
+
+def toolTree(devices, tool_file='tests/tools/tool_model_1.xml'):
+    '''Element tree of tool_file with its first system's devices repeated until there are devices devices'''
+    tool_tree = ET.parse(tool_file)
+    system_item = tool_tree.getroot().find(strings.SYSTEM_NODE)
+    device_items = system_item.findall(strings.DEVICE_NODE)
+
+    for i in range(len(device_items), devices):
+        device_item = copy.deepcopy(device_items[i % len(device_items)])
+        device_item.set('name', 'device_' + str(i))
+        system_item.append(device_item)
+
+    return tool_tree
+
+
+def insertTool(tool_model, tool_tree):
+    '''loadTool as it was, every node goes through insertChild and its own beginInsertRows/endInsertRows'''
+    tool_item = tool_tree.getroot()
+    tool_index = tool_model.insertChild(tool_model.createIndex(0, 0, tool_model._root_node), strings.TOOL_NODE)
+    tool_index.internalPointer().loadAttribFromXML(tool_item)
+
+    for system_item in tool_item.findall(strings.SYSTEM_NODE):
+        system_index = tool_model.insertChild(tool_index, strings.SYSTEM_NODE)
+        for device_item in system_item.findall(strings.DEVICE_NODE):
+            device_index = tool_model.insertChild(system_index, strings.DEVICE_NODE)
+            device_icon_index = tool_model.insertChild(device_index, strings.DEVICE_ICON_NODE)
+            for node_type in [strings.D_IN_NODE, strings.D_OUT_NODE, strings.A_IN_NODE, strings.A_OUT_NODE]:
+                for xml_item in device_item.findall(node_type):
+                    tool_model.insertChild(device_index, node_type).internalPointer().loadAttribFromXML(xml_item)
+
+            device_icon_xml = device_item.find(strings.DEVICE_ICON_NODE)
+            if device_icon_xml is not None:
+                device_icon_index.internalPointer().loadAttribFromXML(device_icon_xml)
+            device_index.internalPointer().loadAttribFromXML(device_item)
+        system_index.internalPointer().loadAttribFromXML(system_item)
+
+
+def viewedModel():
+    '''A tool model with two tree views on it, one expanded'''
+    tool_model = ToolModel()
+
+    views = [QtWidgets.QTreeView(), QtWidgets.QTreeView()]
+    for view in views:
+        view.setModel(tool_model)
+        view.show()
+    views[0].expandAll()
+
+    return tool_model, views
+
+
+def benchLoad(devices):
+    '''Returns the node count and ms to load it with the bulk loader and node by node'''
+    tool_tree = toolTree(devices)
+    nodes = len(list(tool_tree.getroot().iter()))
+
+    tool_model, keep = viewedModel()
+    t0 = time.perf_counter()
+    tool_model.loadTool(tool_tree)
+    QtWidgets.QApplication.processEvents()
+    bulk = time.perf_counter() - t0
+
+    tool_model, keep = viewedModel()
+    t0 = time.perf_counter()
+    insertTool(tool_model, tool_tree)
+    QtWidgets.QApplication.processEvents()
+    inserts = time.perf_counter() - t0
+
+    return nodes, bulk*1e3, inserts*1e3
+
+
+def ancestorScan(tool_model, node_type, parent_node):
+    '''nodesOfType's subtree path as it was, walking the ancestors of every node of node_type'''
+    subtree = []
+    for node in tool_model.nodesOfType(node_type):
+        ancestor = node.parent()
+        while ancestor is not None and ancestor is not parent_node:
+            ancestor = ancestor.parent()
+        if ancestor is parent_node:
+            subtree.append(node)
+    return subtree
+
+
+def benchNodesOfType(devices):
+    '''Returns µs per device subtree query from the ordered registry and from an ancestor scan, and per insert + query'''
+    tool_model = ToolModel()
+    tool_model.loadTool(toolTree(devices))
+    device_indexes = tool_model.indexesOfType(strings.DEVICE_NODE)
+
+    t0 = time.perf_counter()
+    for index in device_indexes:
+        tool_model.nodesOfType(strings.D_IN_NODE, index)
+    bisected = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for index in device_indexes:
+        ancestorScan(tool_model, strings.D_IN_NODE, index.internalPointer())
+    scan = time.perf_counter() - t0
+
+    #Inserting no longer drops the order, the next query doesn't re-sort
+    system_index = tool_model.indexesOfType(strings.SYSTEM_NODE)[0]
+    t0 = time.perf_counter()
+    for i in range(100):
+        device_index = tool_model.insertChild(system_index, strings.DEVICE_NODE, 0)
+        tool_model.insertChild(device_index, strings.DEVICE_ICON_NODE)
+        tool_model.insertChild(device_index, strings.D_IN_NODE)
+        tool_model.nodesOfType(strings.D_IN_NODE, device_index)
+    insert = time.perf_counter() - t0
+
+    return bisected/devices*1e6, scan/devices*1e6, insert/100*1e6
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+
+    print("ToolModel.parent() on a system's device icons (µs per call)")
+    for devices in [100, 1000, 5000]:
+        cached, scan = benchParent(devices)
+        print("  {:5d} devices   cached row: {:6.2f}   linear scan: {:8.2f}".format(devices, cached, scan))
+
+    print("Adding devices with the same name (µs per device)")
+    for devices in [100, 1000, 5000]:
+        print("  {:5d} devices   {:8.2f}".format(devices, benchNames(devices)))
+
+    print("Node attributes for saving (µs per node) and asXml() (ms)")
+    for devices in [100, 1000, 5000]:
+        schema, walk, save = benchAttrs(devices)
+        print("  {:5d} devices   schema: {:6.2f}   mro walk: {:6.2f}   asXml: {:8.1f}".format(devices, schema, walk, save))
+
+    print("Loading a tool with two tree views attached (ms)")
+    for devices in [100, 500, 2000]:
+        nodes, bulk, inserts = benchLoad(devices)
+        print("  {:5d} nodes   one reset: {:8.1f}   insert per node: {:8.1f}".format(nodes, bulk, inserts))
+
+    print("Device subtree queries, nodesOfType(D_IN, device) (µs per call)")
+    for devices in [100, 1000, 5000]:
+        bisected, scan, insert = benchNodesOfType(devices)
+        print("  {:5d} devices   bisect: {:6.2f}   ancestor scan: {:9.2f}   insert + query: {:8.2f}".format(devices, bisected, scan, insert))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,12 @@
 
 import pytest
 import copy
+import numpy as np
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 from linuxnano.flags import TestingFlags
-from linuxnano.analog_state_table_model import AnalogStateTableModel
+from linuxnano.analog_state_table_model import AnalogStateTableModel, AnalogStateClassifier
 
 
 
@@ -297,3 +298,30 @@ def test_states(good_dataArray_data):
         assert states_2 == table_model.states()
 
 
+
+
+def test_stateFromValue(good_dataArray_data):
+    model = AnalogStateTableModel()
+    model.setDataArray(copy.deepcopy(good_dataArray_data[3]))
+
+    assert model.thresholds().tolist() == [2.0, 3.0, 4.0]
+    assert [model.stateFromValue(value) for value in [-1.0, 2.0, 2.5, 3.99, 100]] == [0, 1, 1, 2, 3]
+
+
+def test_AnalogStateClassifier(good_dataArray_data):
+    models = []
+    for data in good_dataArray_data:
+        model = AnalogStateTableModel()
+        model.setDataArray(copy.deepcopy(data))
+        models.append(model)
+
+    classifier = AnalogStateClassifier(models)
+    values = np.array([[9.0, 1.0, 3.0, 3.5],
+                       [0.0, 2.0, 2.0, 4.0]])
+
+    assert classifier.classify(values).tolist() == [[0, 0, 2, 2],
+                                                    [0, 1, 1, 3]]
+    assert classifier.classify(values[0]).tolist() == [0, 0, 2, 2]
+
+    for channel, model in enumerate(models):
+        assert [model.stateFromValue(v) for v in values[:, channel]] == classifier.classify(values)[:, channel].tolist()
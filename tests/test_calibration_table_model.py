@@ -3,11 +3,12 @@
 
 import pytest
 import copy
+import numpy as np
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 from linuxnano.flags import TestingFlags
-from linuxnano.calibration_table_model import CalibrationTableModel
+from linuxnano.calibration_table_model import CalibrationTableModel, CalibrationBank
 
 
 
@@ -371,3 +372,104 @@ def test_flags(good_data_arrays):
         
         
 
+
+
+def test_CalibrationBank_halToGui(good_data_arrays):
+    models = []
+    for data in good_data_arrays:
+        model = CalibrationTableModel()
+        model.setDataArray(copy.deepcopy(data))
+        models.append(model)
+
+    bank = CalibrationBank(models)
+    raw = np.array([[   5,  2000, 127.5],
+                    [ 100, 16000,   0  ],
+                    [ 300,    -1, 500  ]])
+
+    gui = bank.halToGui(raw)
+    assert gui[0] == pytest.approx([0.315, 0.315, -35.315])
+    assert gui[1] == pytest.approx([9.66, 24.00, 0.0])
+    assert gui[2] == pytest.approx([24.00, 0.0, -70.63]) #Held at the table ends
+
+
+def test_CalibrationBank_matches_interp(good_data_arrays):
+    models = []
+    for data in good_data_arrays:
+        model = CalibrationTableModel()
+        model.setDataArray(copy.deepcopy(data))
+        models.append(model)
+
+    bank = CalibrationBank(models)
+    raw = np.random.default_rng(0).uniform(-1000, 20000, (200, len(models)))
+    gui = bank.halToGui(raw)
+
+    for channel, data in enumerate(good_data_arrays):
+        hal_values, gui_values = zip(*data[1:])
+        assert gui[:, channel] == pytest.approx(np.interp(raw[:, channel], hal_values, gui_values), rel=1e-12, abs=1e-12)
+
+    #Past the last point every table holds its last value exactly
+    assert bank.halToGui(np.array([[1e9, 1e9, 1e9]]))[0].tolist() == [24.00, 24.00, -70.63]
+
+
+def test_CalibrationBank_guiToHal(good_data_arrays):
+    models = []
+    for data in good_data_arrays:
+        model = CalibrationTableModel()
+        model.setDataArray(copy.deepcopy(data))
+        models.append(model)
+
+    bank = CalibrationBank(models)
+    assert bank.guiToHal(0, 0.315) == pytest.approx(5)
+    assert bank.guiToHal(2, -35.315) == pytest.approx(127.5) #Decreasing gui values
+
+
+@pytest.mark.parametrize('scale_type', ['linear', 'cubic_spline'])
+def test_transform(good_data_arrays, scale_type):
+    model = CalibrationTableModel()
+    model.setDataArray(copy.deepcopy(good_data_arrays[0]))
+
+    transform = model.transform(scale_type)
+    assert model.transform(scale_type) is transform #Cached
+
+    hal = np.array([0, 10, 50, 100, 255])
+    assert transform(hal) == pytest.approx([0.00, 0.63, 3.10, 9.66, 24.00])
+    assert transform(np.array([-5, 300])) == pytest.approx([0.00, 24.00])
+    assert transform.inverse(transform(hal)) == pytest.approx(hal)
+
+
+def test_transform_linear_between_points(good_data_arrays):
+    model = CalibrationTableModel()
+    model.setDataArray(copy.deepcopy(good_data_arrays[2]))
+
+    assert model.transform()(127.5) == pytest.approx(-35.315)
+    assert model.transform().inverse(-35.315) == pytest.approx(127.5)
+
+
+def test_transform_cleared_on_change(good_data_arrays):
+    model = CalibrationTableModel()
+    model.setDataArray(copy.deepcopy(good_data_arrays[1]))
+    transform = model.transform()
+
+    model.setData(model.index(2, 1), 48.0)
+    assert model.transform() is not transform
+    assert model.transform()(16000) == pytest.approx(48.0)
+
+    transform = model.transform()
+    model.insertRows(1)
+    assert model.transform() is not transform
+
+
+def test_CalibrationBank_cubic_spline(good_data_arrays):
+    models = []
+    for data in good_data_arrays:
+        model = CalibrationTableModel()
+        model.setDataArray(copy.deepcopy(data))
+        models.append(model)
+
+    bank = CalibrationBank(models, ['cubic_spline', 'linear', 'cubic_spline'])
+    raw = np.array([[30, 2000, 127.5], [200, 4000, 255]])
+    gui = bank.halToGui(raw)
+
+    assert gui[:,0] == pytest.approx(models[0].transform('cubic_spline')(raw[:,0]))
+    assert gui[:,1] == pytest.approx([0.315, 0.63])
+    assert bank.guiToHal(0, gui[0,0]) == pytest.approx(30)
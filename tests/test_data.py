@@ -3,13 +3,14 @@
 
 import pytest
 import ast
+import queue
 import xml.etree.ElementTree as ET
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 from linuxnano.flags import TestingFlags
 from linuxnano.strings import strings
 
-from linuxnano.data import Node, ToolNode, SystemNode, DeviceNode, DeviceIconNode, HalNode, DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode
+from linuxnano.data import OutputCommands, Node, ToolNode, SystemNode, DeviceNode, DeviceIconNode, HalNode, DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode
 from linuxnano.digital_state_table_model import DigitalStateTableModel
 from linuxnano.analog_state_table_model import AnalogStateTableModel
 from linuxnano.calibration_table_model import CalibrationTableModel
@@ -33,6 +34,16 @@ def test_node_attrs():
     assert node.attrs() == {'description': '', 'name': 'unknown'}
 
 
+def test_node_schema():
+    assert [key for key, prop in Node.schema()] == ['description', 'name']
+    assert Node.schema() is Node.schema()
+
+    keys = [key for key, prop in DigitalInputNode.schema()]
+    assert len(keys) == len(set(keys))
+    assert set(keys) == set(DigitalInputNode().attrs())
+    assert DigitalInputNode.schema() is not Node.schema()
+
+
 def test_node_asXml():
     root = Node()
     child_1 = Node()
@@ -148,6 +159,59 @@ def test_node_row():
     assert child_3.row() == 2
 
 
+def test_node_row_after_insert_remove():
+    root = Node()
+    children = [Node() for i in range(4)]
+    for child in children[:3]:
+        root.addChild(child)
+
+    root.insertChild(1, children[3])
+    assert [child.row() for child in root.children()] == [0, 1, 2, 3]
+    assert children[3].row() == 1
+    assert children[2].row() == 3
+
+    root.removeChild(0)
+    assert [child.row() for child in root.children()] == [0, 1, 2]
+    assert children[3].row() == 0
+    assert children[0].row() == None
+
+def test_node_unique_names_after_remove_and_rename():
+    root = Node()
+    nodes = [Node() for i in range(4)]
+    for node in nodes:
+        node.name = "node"
+        root.addChild(node)
+
+    assert [node.name for node in nodes] == ["node", "node_new", "node_new_new", "node_new_new_new"]
+
+    root.removeChild(0)
+    nodes[1].name = "node"
+    assert nodes[1].name == "node"
+
+    nodes[2].name = "other"
+    nodes[3].name = "node_new_new"
+    assert nodes[3].name == "node_new_new"
+
+    nodes[2].name = "node"
+    assert nodes[2].name == "node_new"
+
+
+def test_node_rename_to_taken_name():
+    root = Node()
+    nodes = [Node() for i in range(3)]
+    for node in nodes:
+        node.name = "a"
+        root.addChild(node)
+    assert [node.name for node in nodes] == ["a", "a_new", "a_new_new"]
+
+    #a is taken and a_new is the node's own name, so it keeps it
+    nodes[1].name = "a"
+    assert nodes[1].name == "a_new"
+
+    nodes[2].name = "a"
+    assert nodes[2].name == "a_new_new"
+
+
 def test_node_setData():
     root = Node()
     root.setData(0, "my_nam e") #It should remove the space
@@ -419,6 +483,24 @@ def test_HalNode_typeInfo():
         node.typeInfo()
 
 
+def test_HalNode_manualQueue():
+    node_1 = HalNode()
+    node_2 = HalNode()
+    output_commands = OutputCommands()
+    node_1.setOutputCommands(output_commands)
+    node_2.setOutputCommands(output_commands)
+    node_1.manualQueuePut(1)
+    node_1.manualQueuePut(3)
+    node_2.manualQueuePut(0)
+
+    assert node_1.manualQueueGet() == 3 #Commands to one output coalesce, newest wins
+    with pytest.raises(queue.Empty):
+        node_1.manualQueueGet()
+
+    assert output_commands.take() == {node_2: 0}
+    assert output_commands.take() == {}
+
+
 ########## DigitalInputNode ##########
 #Cant add generic HalNode to a device so must test name function like this
 def test_DigitalInputNode_name():
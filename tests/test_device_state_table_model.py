@@ -7,7 +7,7 @@ import copy
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 from linuxnano.flags import TestingFlags
-from linuxnano.device_state_table_model import DeviceStateTableModel
+from linuxnano.device_state_table_model import DeviceStateTableModel, CompiledDeviceStates, SparseDeviceStates
 
 
 def array_print(array):
@@ -142,6 +142,25 @@ def test_setDeviceStates(good_node_states, good_device_states):
         table_model.setDeviceStates(states)
 
 
+def test_compiled(good_node_states, good_device_states):
+    table_model = DeviceStateTableModel()
+    table_model.setNodeStates(good_node_states[1])
+    table_model.setDeviceStates(good_device_states[1])
+
+    compiled = table_model.compiled()
+    assert compiled is table_model.compiled()
+    assert [compiled.status(state) for state in range(4)] == ['off', 'low', 'med', 'high']
+    assert compiled.strings()[compiled.icon_layer_ids[3]] == 'layer_1'
+    assert compiled.warning_timeouts.tolist() == [0.0, 0.0, 15.0, 0.0]
+    assert compiled.triggers_action.tolist() == [False, False, True, False]
+    assert compiled.strings()[compiled.alarm_message_ids[2]] == 'my alarm'
+
+    table_model.setData(table_model.index(1, table_model.statusColumn()), 'medium low')
+    assert table_model.compiled() is not compiled
+    assert table_model.statusFromState(1) == 'medium low'
+    assert table_model.iconLayerFromState(3) == 'layer_1'
+
+
 def test_rowCount(good_node_states, good_device_states):
     table_model = DeviceStateTableModel()
 
@@ -206,3 +225,74 @@ def test_flags(good_node_states, good_device_states, good_truth_tables):
         assert table_model.flags(table_model.index(0, table_model.logEntranceColumn()    , QtCore.QModelIndex())) == flags
 
         #TODO add test to check for only allow editing of timeout and message if is_warning is true
+
+
+def test_sparse_rows(good_node_states, good_device_states):
+    table_model = DeviceStateTableModel()
+    table_model.setNodeStates([('node_' + str(i), ['s' + str(j) for j in range(16)]) for i in range(4)])
+    assert table_model.rowCount() == 65536
+
+    default = table_model.deviceStates()
+    assert len(default) == 1
+    assert table_model.dataRow(65535) == table_model.dataRow(0)
+
+    #Headers are reversed, node_3 is the slowest changing column
+    assert table_model.truthStates(1) == ['s0', 's0', 's0', 's1']
+    assert table_model.data(table_model.index(16, 2), QtCore.Qt.DisplayRole) == 's1'
+
+    table_model.setData(table_model.index(70, table_model.statusColumn()), 'fault')
+    assert table_model.statusFromState(70) == 'fault'
+    assert len(table_model.deviceStates()) == 2
+
+    table_model.setData(table_model.index(70, table_model.statusColumn()), 'unknown status')
+    assert table_model.deviceStates() == default
+
+
+def test_wildcard_rows():
+    table_model = DeviceStateTableModel()
+    table_model.setNodeStates([('output', ['close', 'open']),
+                               ('closed_limit', ['is_not_closed','is_closed']),
+                               ('open_limit', ['is_not_open','is_open'])])
+
+    states = [ ['state', 'status', 'icon_layer', 'is_warning', 'warning_timeout', 'warning_message', 'is_alarm', 'alarm_timeout', 'alarm_message', 'triggers_action', 'action_timeout', 'action', 'log_entrance'],
+               [['*', '*', 'open'], 'opening', 'layer_0', False, 0.0, '', False, 0.0, '', False, 0.0, None, True],
+               [['is_open', '*', 'open'], 'open', 'layer_1', False, 0.0, '', False, 0.0, '', False, 0.0, None, True],
+               [6, 'fault', 'layer_2', False, 0.0, '', False, 0.0, '', False, 0.0, None, True]]
+
+    table_model.setDeviceStates(states)
+    assert table_model.deviceStates() == states
+    assert table_model.statesMatching(['*', '*', 'open']).tolist() == [1, 3, 5, 7]
+
+    statuses = ['unknown status', 'opening', 'unknown status', 'opening', 'unknown status', 'open', 'fault', 'open']
+    assert [table_model.data(table_model.index(row, table_model.statusColumn()), QtCore.Qt.DisplayRole) for row in range(8)] == statuses
+    assert [table_model.statusFromState(row) for row in range(8)] == statuses
+
+    with pytest.raises(ValueError):
+        table_model.setDeviceStates(states[:1] + [[['*', 'open'], 'bad', 'layer_0', False, 0.0, '', False, 0.0, '', False, 0.0, None, True]])
+
+    with pytest.raises(ValueError):
+        table_model.setDeviceStates(states[:1] + [[['*', '*', 'ajar'], 'bad', 'layer_0', False, 0.0, '', False, 0.0, '', False, 0.0, None, True]])
+
+
+def test_compiled_sparse():
+    table_model = DeviceStateTableModel()
+    table_model.setNodeStates([('node_' + str(i), ['s' + str(j) for j in range(16)]) for i in range(4)])
+
+    states = [ ['state', 'status', 'icon_layer', 'is_warning', 'warning_timeout', 'warning_message', 'is_alarm', 'alarm_timeout', 'alarm_message', 'triggers_action', 'action_timeout', 'action', 'log_entrance'],
+               [['*', 's1', '*', '*'], 'running', 'layer_0', False, 0.0, '', False, 0.0, '', False, 0.0, None, True],
+               [['s2', 's1', '*', 's3'], 'stuck', 'layer_1', False, 0.0, '', True, 0.0, 'stuck', False, 0.0, None, True],
+               [70, 'fault', 'layer_2', False, 0.0, '', False, 0.0, '', False, 0.0, None, True]]
+    table_model.setDeviceStates(states)
+
+    #65536 rows is past dense_limit, the compiled view only holds the configured rows
+    compiled = table_model.compiled()
+    assert isinstance(compiled, SparseDeviceStates)
+    for state in [0, 16, 70, 2*4096 + 256 + 3, 65535] + list(range(0, 65536, 997)):
+        assert compiled.status(state) == table_model.dataRow(state)[0]
+        assert compiled.iconLayer(state) == table_model.dataRow(state)[1]
+
+    assert table_model.statusFromState(2*4096 + 256 + 3) == 'stuck'
+    assert table_model.statusFromState(70) == 'fault'
+
+    table_model.setNodeStates([('output', ['off', 'on'])])
+    assert isinstance(table_model.compiled(), CompiledDeviceStates)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+import subprocess
+
+from linuxnano.hal_transport import HalcmdTransport, HalComponentTransport, FakeHalTransport, FakeHalModule, halScript
+
+
+def test_halScript():
+    assert halScript([['loadrt', 'sampler', 'cfg=bb'], ['start']]) == 'loadrt sampler cfg=bb\nstart\n'
+
+
+@pytest.mark.parametrize('mode, calls', [('script', 1), ('commands', 3)])
+def test_HalcmdTransport_run(monkeypatch, mode, calls):
+    runs = []
+    monkeypatch.setattr(subprocess, 'run', lambda args, **kwargs: runs.append((args, kwargs)) or subprocess.CompletedProcess(args, 0, b'out\n'))
+
+    transport = HalcmdTransport()
+    transport.setMode(mode)
+    output = transport.run([['stop'], ['unload', 'all'], ['show', 'pin']])
+
+    assert len(runs) == calls
+    assert output == b'out\n'*calls
+
+    if mode == 'script':
+        assert runs[0][0] == ['halcmd', '-k', '-f']
+        assert runs[0][1]['input'] == b'stop\nunload all\nshow pin\n'
+
+
+def test_HalcmdTransport_setMode():
+    transport = HalcmdTransport()
+    with pytest.raises(ValueError):
+        transport.setMode('telnet')
+
+
+@pytest.fixture()
+def transport():
+    transport = FakeHalTransport()
+    transport.addPins('d-in', 3, 'bit', 'OUT')
+    transport.addPins('d-out', 2, 'bit', 'IN')
+    transport.run([['loadrt', 'sampler', 'depth=4', 'cfg=bbb'],
+                   ['loadrt', 'streamer', 'depth=4', 'cfg=b'],
+                   ['net', 'sig_a', 'd-in-0', '=>', 'sampler.0.pin.0'],
+                   ['net', 'sig_b', 'd-out-1', '=>', 'sampler.0.pin.1'],
+                   ['net', 'sig_b', 'd-out-1', '=>', 'streamer.0.pin.0'],
+                   ['net', 'sig_c', 'd-in-2', '=>', 'sampler.0.pin.2']])
+    yield transport
+    transport.stop()
+
+
+def test_FakeHalTransport_showPin(transport):
+    lines = transport.run([['show', 'pin']]).decode().splitlines()
+
+    assert lines[0] == 'Component Pins:'
+    assert lines[2].split() == ['10', 'bit', 'OUT', '0', 'd-in-0']
+    assert len(lines) == 2 + 5 + 3 + 1 + 1
+
+
+def test_FakeHalTransport_net_missing_pin(transport):
+    assert transport.run([['net', 'sig_x', 'nope', '=>', 'sampler.0.pin.0']]) == b"Pin 'nope' does not exist\n"
+
+
+def test_FakeHalTransport_sampler(transport):
+    sampler = transport.openSampler()
+    transport.setPin('d-in-2', 1)
+    transport.sample(2)
+
+    assert sampler.read(1000) == b'0 0 0 1 \n1 0 0 1 \n'
+
+
+def test_FakeHalTransport_sampler_overrun(transport):
+    sampler = transport.openSampler()
+    transport.run([['loadrt', 'sampler', 'depth=4', 'cfg=bbb']])
+
+    with transport._lock:
+        transport._sample(6)
+    transport._flushSampler()
+
+    assert sampler.read(1000).splitlines()[-1].startswith(b'3 ')
+    assert transport.overruns == 2
+
+
+def test_FakeHalTransport_stimulus():
+    transport = FakeHalTransport(stimulus=lambda n: {'d-in-0': n%2})
+    transport.addPins('d-in', 1)
+    transport.run([['loadrt', 'sampler', 'cfg=b'], ['net', 'sig', 'd-in-0', 'sampler.0.pin.0']])
+
+    sampler = transport.openSampler()
+    transport.sample(3)
+    assert sampler.read(1000) == b'0 0 \n1 1 \n2 0 \n'
+    transport.stop()
+
+
+def test_FakeHalTransport_streamer(qtbot, transport):
+    streamer = transport.openStreamer()
+    streamer.write(b'1\n')
+    streamer.flush()
+
+    qtbot.waitUntil(lambda: transport.pin('d-out-1') == 1, timeout=1000)
+    assert transport.pin('sampler.0.pin.1') == 1
+    streamer.close()
+
+
+def test_FakeHalTransport_rate():
+    transport = FakeHalTransport(rate=10000)
+    transport.addPins('d-in', 1)
+    transport.run([['loadrt', 'sampler', 'depth=1000', 'cfg=b'], ['net', 'sig', 'd-in-0', 'sampler.0.pin.0'], ['start']])
+
+    sampler = transport.openSampler()
+    data = b''
+    while data.count(b'\n') < 100:
+        data += sampler.read(65536)
+
+    transport.stop()
+    assert data.splitlines()[99] == b'99 0 '
+
+
+@pytest.fixture()
+def component(transport):
+    component = HalComponentTransport(transport, FakeHalModule(transport))
+    component.exportPins('bb', 'b')
+    component.run(component.samplerCommands('bb', [('sig_a', 'd-in-0'), ('sig_c', 'd-in-2')]))
+    component.run(component.streamerCommands('b', [('sig_d', 'd-out-0')]))
+    return component
+
+
+def test_HalComponentTransport_exportPins(component, transport):
+    assert component.component().is_ready
+    assert component.samplerPin(1) == 'linuxnano.in-01'
+
+    lines = transport.run([['show', 'pin']]).decode().splitlines()
+    assert '    10  bit   IN               0  linuxnano.in-01' in lines
+    assert '    10  bit   OUT              0  linuxnano.out-00' in lines
+
+
+def test_HalComponentTransport_readPins(component, transport):
+    transport.setPin('d-in-2', 1)
+    values = component.readPins()
+
+    assert values.dtype.name == 'uint8'
+    assert values.tolist() == [0, 1]
+
+
+def test_HalComponentTransport_writePins(component, transport, monkeypatch):
+    component.writePins([1])
+    assert transport.pin('d-out-0') == 1
+
+    #Unchanged values aren't written again
+    monkeypatch.setattr(transport, 'setPin', lambda *args: pytest.fail("wrote an unchanged pin"))
+    component.writePins([1])
+
+
+def test_HalComponentTransport_direct(component):
+    assert component.direct
+    assert not HalcmdTransport.direct
+
+    with pytest.raises(NotImplementedError):
+        component.openSampler()
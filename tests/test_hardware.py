@@ -0,0 +1,824 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+import sys
+import os
+import numpy as np
+from collections import deque
+from PyQt5 import QtCore
+
+import xml.etree.ElementTree as ET
+from linuxnano.tool_model import ToolModel
+from linuxnano.hardware import HalReader, HalRoutes, SamplerRing
+from linuxnano.hal_transport import FakeHalTransport, HalComponentTransport, FakeHalModule
+from linuxnano.strings import strings
+from linuxnano.data import DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode
+
+
+@pytest.fixture()
+def tool_model():
+    tree = ET.parse('tests/tools/tool_model_1.xml')
+    tool_model = ToolModel()
+    tool_model.loadTool(tree)
+    return tool_model
+
+
+@pytest.fixture()
+def reader(qapp, tool_model):
+    '''HalReader with the sampler slots handed out like start() does, without needing HAL'''
+    reader = HalReader()
+    reader.setModel(tool_model)
+
+    hal_pins = []
+    for type_info in [strings.D_IN_NODE, strings.D_OUT_NODE]:
+        for index in tool_model.indexesOfType(type_info):
+            hal_pins += index.internalPointer().halPins
+
+    out_pins = [pin for pin in hal_pins if 'd-out' in pin]
+    reader.routes().assignSlots(tool_model, hal_pins, out_pins)
+    return reader
+
+
+def sampler_line(sample_number, bits):
+    return (str(sample_number) + ' ' + ' '.join(str(b) for b in bits) + ' \n').encode()
+
+
+def values(reader):
+    return [reader.model().data(index.siblingAtColumn(20), QtCore.Qt.DisplayRole) for index in reader.samplerIndexes()]
+
+
+def test_HalReader_decodeSamplerLines(reader):
+    lines = [sampler_line(7, [1,0,1,0,1,0,0]), sampler_line(8, [0,1,0,1,0,1,1])]
+    sample_numbers, bits = reader.decodeSamplerLines(lines)
+
+    assert sample_numbers.tolist() == [7, 8]
+    assert bits.dtype.name == 'uint8'
+    assert bits.tolist() == [[1,0,1,0,1,0,0], [0,1,0,1,0,1,1]]
+
+
+def test_HalReader_decodeSamplerLines_skips_garbage(reader):
+    lines = [b'halsampler: some message\n', sampler_line(3, [1,1,1,1,1,1,1])]
+    sample_numbers, bits = reader.decodeSamplerLines(lines)
+
+    assert sample_numbers.tolist() == [3]
+    assert bits.tolist() == [[1,1,1,1,1,1,1]]
+
+
+def test_HalReader_readSampler(reader):
+    #Sampler pins: phase-A, phase-B, d-in-0, d-out-0, d-out-1, d-out-2, d-out-3
+    reader.sampler_queue.put(sampler_line(0, [1,0,1,0,1,1,0]))
+    reader.readSampler()
+
+    assert values(reader) == [1, 0, 1, 1, 2, 1]
+
+
+def test_HalReader_readSampler_batch(reader):
+    reader.setCatchUpThreshold(None)
+    changes = []
+    reader.model().dataChanged.connect(lambda index, _: changes.append(index.internalPointer()))
+
+    for i in range(500):
+        reader.sampler_queue.put(sampler_line(i, [i%2,0,0,0,0,0,0]))
+    reader.readSampler()
+
+    assert reader.sampler_queue.empty()
+    assert values(reader) == [1, 0, 1, 0, 0, 0]
+    assert len(changes) == 499 + 499 #Both devices share phase-A, every transition is still applied
+
+
+def test_HalReader_readSampler_catch_up(reader):
+    changes = []
+    reader.model().dataChanged.connect(lambda index, _: changes.append(index.internalPointer()))
+
+    #phase-A toggles every sample and d-in-0 goes high once
+    for i in range(500):
+        reader.sampler_queue.put(sampler_line(i, [i%2,0,int(i>=250),0,0,0,0]))
+    reader.readSampler()
+
+    assert values(reader) == [1, 0, 1, 1, 0, 0]
+    assert len(changes) == 3 #Only the final values of the changed nodes
+
+    edges = reader.takeEdges()
+    assert len(edges) == 499 + 499 + 1
+    assert edges[0] == (1, reader.samplerIndexes()[0].internalPointer(), 0, 1)
+    assert (250, reader.samplerIndexes()[3].internalPointer(), 0, 1) in edges
+    assert reader.edgeLog() == deque()
+
+
+def test_HalReader_readSampler_small_block_applies_all(reader):
+    reader.setCatchUpThreshold(10)
+    changes = []
+    reader.model().dataChanged.connect(lambda index, _: changes.append(index.internalPointer()))
+
+    for i in range(5):
+        reader.sampler_queue.put(sampler_line(i, [i%2,0,0,0,0,0,0]))
+    reader.readSampler()
+
+    assert len(changes) == 2*4
+    assert len(reader.takeEdges()) == 2*4
+
+
+@pytest.mark.parametrize('policy, expected', [('drop_oldest', [b'2', b'3', b'4']),
+                                              ('drop_newest', [b'0', b'1', b'2']),
+                                              ('merge',       [b'0', b'1', b'4'])])
+def test_SamplerRing_policy(policy, expected):
+    ring = SamplerRing(3, policy)
+    for i in range(5):
+        ring.put(str(i).encode())
+
+    assert ring.drain() == expected
+    assert ring.dropped == 2
+    assert ring.max_backlog == 3
+    assert ring.empty()
+
+
+def test_SamplerRing_bad_policy():
+    with pytest.raises(ValueError):
+        SamplerRing(10, 'block')
+
+
+def test_SamplerRing_countSamples():
+    ring = SamplerRing()
+    ring.countSamples(np.array([5, 6, 7]))
+    ring.countSamples(np.array([9, 10, 14]))
+    ring.countSamples(np.array([0, 1])) #Sampler restarted
+
+    stats = ring.stats()
+    assert stats['lines'] == 8
+    assert stats['overruns'] == 4
+    assert stats['lines_per_sec'] > 0
+
+
+def test_HalReader_sampler_overruns(reader):
+    reader.setSamplerBuffer(4, 'drop_oldest')
+
+    for i in list(range(10)) + list(range(20, 22)):
+        reader.sampler_queue.put(sampler_line(i, [i%2,0,0,0,0,0,0]))
+    reader.readSampler()
+
+    stats = reader.samplerStats()
+    assert stats['dropped'] == 8
+    assert stats['max_backlog'] == 4
+    assert stats['overruns'] == 10 #20 - 10, the 8 dropped in the ring aren't HAL's
+    assert values(reader)[0] == 1
+
+
+def test_HalReader_sampler_overruns_notifier(reader):
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    reader._sampler_fd = read_fd
+    reader._sampler_partial = b''
+    reader._sampler_notifier = QtCore.QSocketNotifier(read_fd, QtCore.QSocketNotifier.Read)
+    reader.setSamplerBuffer(2, 'drop_oldest')
+
+    os.write(write_fd, b''.join(sampler_line(i, [i%2,0,0,0,0,0,0]) for i in range(5)))
+    reader.onSamplerReadable()
+
+    stats = reader.samplerStats()
+    assert stats['lines'] == 2
+    assert stats['dropped'] == 3
+    assert stats['max_backlog'] == 2
+    assert values(reader)[0] == 0
+    os.close(write_fd)
+    os.close(read_fd)
+
+
+def test_HalRoutes_assignSlots(reader):
+    routes = reader.routes()
+    assert [hal_pin for signal, hal_pin in routes.sampler_pins] == ['sim-encoder.0.phase-A',
+                                                                    'sim-encoder.0.phase-B',
+                                                                    'hardware-sim.0.d-in-0',
+                                                                    'hardware-sim.0.d-out-0',
+                                                                    'hardware-sim.0.d-out-1',
+                                                                    'hardware-sim.0.d-out-2',
+                                                                    'hardware-sim.0.d-out-3']
+
+    assert routes.sampler_pins[0][0] == 'Chamber_A.ForelineValve.closed_limit.0'
+    assert [hal_pin for signal, hal_pin in routes.streamer_pins] == ['hardware-sim.0.d-out-0',
+                                                                     'hardware-sim.0.d-out-1',
+                                                                     'hardware-sim.0.d-out-2',
+                                                                     'hardware-sim.0.d-out-3']
+    assert routes.streamer_shifts == [[(0,0), (1,1)], [(0,2), (1,3)]]
+
+
+def test_HalRoutes_not_rebuilt_per_tick(reader, monkeypatch):
+    reader.routes()
+    calls = []
+    original = reader.model().indexesOfType
+    monkeypatch.setattr(reader.model(), 'indexesOfType', lambda *args: calls.append(args) or original(*args))
+
+    for i in range(10):
+        reader.sampler_queue.put(sampler_line(i, [i%2,0,0,0,0,0,0]))
+        reader.readSampler()
+
+    assert calls == []
+
+
+def test_HalRoutes_rebuilt_on_change(reader):
+    tool_model = reader.model()
+    assert len(reader.routes().device_indexes) == 2
+
+    system_index = tool_model.index(0, 0, tool_model.index(0, 0, QtCore.QModelIndex()))
+    tool_model.removeRows(0, 1, system_index)
+
+    assert reader.routes().isDirty() == False
+    assert len(reader.routes().device_indexes) == 1
+    assert len(reader.samplerIndexes()) == 3
+
+    #Changing a node's hal pins invalidates the routes
+    node = reader.samplerIndexes()[0].internalPointer()
+    node.halPins = "['hardware-sim.0.d-in-0']"
+    assert reader._routes.isDirty()
+    assert reader.samplerIndexes()[0].internalPointer().samplerPins() == [2]
+
+
+def test_HalReader_findPins(reader, monkeypatch):
+    monkeypatch.setattr(DigitalInputNode, 'hal_pins', DigitalInputNode.hal_pins)
+    monkeypatch.setattr(DigitalOutputNode, 'hal_pins', DigitalOutputNode.hal_pins)
+
+    output = (b'Component Pins:\n'
+              b'Owner   Type  Dir         Value  Name\n'
+              b'    10  bit   IN          FALSE  hardware-sim.0.d-out-0\n'
+              b'    10  bit   OUT         FALSE  hardware-sim.0.d-in-0\n'
+              b'    12  float OUT             0  sim-encoder.0.rawcounts\n'
+              b'\n')
+    reader.findPins(output)
+
+    assert DigitalOutputNode.hal_pins == ['None', 'hardware-sim.0.d-out-0']
+    assert DigitalInputNode.hal_pins  == ['None', 'hardware-sim.0.d-in-0']
+
+
+def test_HalReader_writeStreamer(reader):
+    written = []
+    reader._streamer = type('Streamer', (), {'write': lambda self, data: written.append(bytes(data)), 'flush': lambda self: None})()
+    reader.resetStreamer()
+
+    reader.writeStreamer()
+    assert written == []
+
+    #Only the last command to an output in a tick goes out
+    node = reader.streamerIndexes()[1].internalPointer()
+    node.manualQueuePut(1)
+    node.manualQueuePut(2)
+    reader.writeStreamer()
+
+    assert written == [b'0 0 0 1\n']
+    assert len(reader.model().outputCommands()) == 0
+
+    #No change, nothing written
+    node.manualQueuePut(2)
+    reader.writeStreamer()
+    assert len(written) == 1
+
+
+def test_HalReader_output_commands_per_model(reader):
+    other_model = ToolModel()
+    other_model.loadTool(ET.parse('tests/tools/tool_model_1.xml'))
+
+    #A command queued in another tool isn't taken by this reader
+    other_node = other_model.indexesOfType(strings.D_OUT_NODE)[0].internalPointer()
+    other_node.manualQueuePut(1)
+    assert len(reader.model().outputCommands()) == 0
+    assert other_model.outputCommands().take() == {other_node: 1}
+
+    #Removing a node drops its waiting command
+    index = reader.streamerIndexes()[1]
+    node = index.internalPointer()
+    node.manualQueuePut(1)
+    reader.model().removeRows(index.row(), 1, index.parent())
+    assert len(reader.model().outputCommands()) == 0
+
+
+def test_HalReader_writeStreamerSequence(reader):
+    written = []
+    reader._streamer = type('Streamer', (), {'write': lambda self, data: written.append(bytes(data)), 'flush': lambda self: None})()
+    reader.resetStreamer()
+
+    node_0 = reader.streamerIndexes()[0].internalPointer()
+    node_1 = reader.streamerIndexes()[1].internalPointer()
+    reader.writeStreamerSequence([{node_0: 1}, {node_1: 3}, {node_0: 1}, {node_0: 0}])
+
+    assert written == [b'1 0 0 0\n1 0 1 1\n0 0 1 1\n']
+    assert reader._previous_stream == [0, 0, 1, 1]
+
+
+def test_HalReader_samplerCommands(reader):
+    reader.routes()
+    commands = reader.samplerCommands()
+
+    assert commands[0] == ['loadrt', 'sampler', 'depth=100', 'cfg=bbbbbbb']
+    assert commands[1] == ['net', 'Chamber_A.ForelineValve.closed_limit.0', 'sim-encoder.0.phase-A', '=>', 'sampler.0.pin.0']
+    assert commands[-1] == ['addf', 'sampler.0', 'gui']
+
+
+def test_HalReader_saveHalScript(reader, tmp_path):
+    reader.setHalScriptPath(str(tmp_path / 'config' / 'linuxnano.hal'))
+    reader.saveHalScript([['start']])
+
+    with open(reader.halScriptPath()) as f:
+        assert f.read().splitlines()[-1] == 'start'
+
+
+FAKE_HALSAMPLER = '''
+import sys, time
+for i in range(200):
+    sys.stdout.write('%d %d 0 0 0 0 0 0 \\n' % (i, i%2))
+    sys.stdout.flush()
+    time.sleep(0.001)
+'''
+
+@pytest.mark.parametrize('mode', ['notifier', 'thread'])
+def test_HalReader_startSampler(qtbot, reader, monkeypatch, mode):
+    transport = reader.transport()
+    monkeypatch.setattr(transport, 'samplerArgs', lambda: [sys.executable, '-c', FAKE_HALSAMPLER])
+    reader.setSamplerMode(mode)
+    reader.startSampler()
+
+    def done():
+        if mode == 'thread':
+            reader.readSampler()
+        assert transport.p_sampler.poll() is not None
+        assert values(reader)[0] == 1
+        assert reader._sampler_values.tolist()[0] == 1
+
+    qtbot.waitUntil(done, timeout=5000)
+    transport.p_sampler.wait()
+
+
+def test_HalReader_onSamplerReadable_partial_lines(reader):
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    reader._sampler_fd = read_fd
+    reader._sampler_partial = b''
+    reader._sampler_notifier = QtCore.QSocketNotifier(read_fd, QtCore.QSocketNotifier.Read)
+
+    os.write(write_fd, b'0 1 0 0 0 0 0 0 \n1 1 1 0 0')
+    reader.onSamplerReadable()
+    assert values(reader) == [1, 0, 1, 0, 0, 0]
+
+    os.write(write_fd, b' 0 0 0 \n')
+    reader.onSamplerReadable()
+    assert values(reader) == [1, 1, 1, 0, 0, 0]
+
+    os.close(write_fd)
+    reader.onSamplerReadable()
+    assert not reader._sampler_notifier.isEnabled()
+    os.close(read_fd)
+
+
+def test_HalReader_onSamplerReadable_holdoff(qtbot, reader):
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    reader._sampler_fd = read_fd
+    reader._sampler_partial = b''
+    reader._sampler_notifier = QtCore.QSocketNotifier(read_fd, QtCore.QSocketNotifier.Read)
+    assert reader.samplerMode() == 'thread'
+
+    #The notifier sleeps after a wake-up and the devices wait for the tick
+    os.write(write_fd, b'0 1 0 0 0 0 0 0 \n')
+    reader.onSamplerReadable()
+    assert values(reader) == [1, 0, 1, 0, 0, 0]
+    assert reader._changed_devices
+    assert not reader._sampler_notifier.isEnabled()
+    qtbot.waitUntil(reader._sampler_notifier.isEnabled, timeout=1000)
+
+    #A notifier replaced by a restart isn't woken by the old holdoff
+    old_notifier = reader._sampler_notifier
+    reader.onSamplerReadable()
+    reader._sampler_notifier = None
+    reader.resumeSampler(old_notifier)
+    assert not old_notifier.isEnabled()
+
+    os.close(write_fd)
+    os.close(read_fd)
+
+
+def fake_transport(tool_model):
+    '''Fake HAL exporting the pins used in tool_model_1'''
+    pins = {'sim-encoder.0.phase-A' : ('bit', 'OUT'),
+            'sim-encoder.0.phase-B' : ('bit', 'OUT'),
+            'hardware-sim.0.d-in-0' : ('bit', 'OUT')}
+
+    for i in range(4):
+        pins['hardware-sim.0.d-out-' + str(i)] = ('bit', 'IN')
+
+    return FakeHalTransport(pins)
+
+
+@pytest.mark.parametrize('mode', ['notifier', 'thread'])
+def test_HalReader_start_fake_hal(qtbot, tool_model, monkeypatch, tmp_path, mode):
+    monkeypatch.setattr(DigitalInputNode, 'hal_pins', DigitalInputNode.hal_pins)
+    monkeypatch.setattr(DigitalOutputNode, 'hal_pins', DigitalOutputNode.hal_pins)
+
+    transport = fake_transport(tool_model)
+    reader = HalReader(transport)
+    reader.setModel(tool_model)
+    reader.setSamplerMode(mode)
+    reader.setHalScriptPath(str(tmp_path / 'linuxnano.hal'))
+    reader.start()
+
+    assert len(reader.routes().sampler_pins) == 7
+    assert ['start'] in transport.commands
+
+    transport.setPin('sim-encoder.0.phase-B', 1)
+    transport.sample(1)
+    qtbot.waitUntil(lambda: values(reader) == [0, 1, 0, 0, 0, 0], timeout=2000)
+
+    #Manual output goes out the streamer, through the net and back in the sampler
+    reader.samplerIndexes()[5].internalPointer().manualQueuePut(2)
+    reader.processData()
+    qtbot.waitUntil(lambda: transport.pin('hardware-sim.0.d-out-3') == 1, timeout=2000)
+
+    transport.sample(1)
+    qtbot.waitUntil(lambda: values(reader) == [0, 1, 0, 0, 0, 2], timeout=2000)
+
+    reader.stop()
+
+
+def test_HalReader_start_hal_component(qtbot, tool_model, monkeypatch, tmp_path):
+    monkeypatch.setattr(DigitalInputNode, 'hal_pins', DigitalInputNode.hal_pins)
+    monkeypatch.setattr(DigitalOutputNode, 'hal_pins', DigitalOutputNode.hal_pins)
+
+    fake = fake_transport(tool_model)
+    reader = HalReader(HalComponentTransport(fake, FakeHalModule(fake)))
+    reader.setModel(tool_model)
+    reader.setHalScriptPath(str(tmp_path / 'linuxnano.hal'))
+    reader.start()
+    reader.timer.stop()
+
+    assert not any(command[:2] == ['loadrt', 'sampler'] for command in fake.commands)
+
+    fake.setPin('sim-encoder.0.phase-B', 1)
+    reader.processData()
+    assert values(reader) == [0, 1, 0, 0, 0, 0]
+
+    reader.samplerIndexes()[5].internalPointer().manualQueuePut(2)
+    reader.processData()
+    assert fake.pin('hardware-sim.0.d-out-3') == 1
+
+    reader.processData()
+    assert values(reader) == [0, 1, 0, 0, 0, 2]
+
+    reader.stop()
+
+
+@pytest.fixture()
+def analog_tool_model(tool_model):
+    '''tool_model_1 with a gauge and a setpoint added to the first device'''
+    device_index = tool_model.indexesOfType(strings.DEVICE_NODE)[0]
+
+    a_in = tool_model.insertChild(device_index, strings.A_IN_NODE).internalPointer()
+    a_in.name = 'gauge'
+    a_in.calibrationTableData = "[['hal_value', 'gui_value'], [0.0, 0.0], [5.0, 100.0], [10.0, 1000.0]]"
+    a_in.halPin = 'hardware-sim.0.a-in-0'
+
+    a_out = tool_model.insertChild(device_index, strings.A_OUT_NODE).internalPointer()
+    a_out.name = 'setpoint'
+    a_out.calibrationTableData = "[['hal_value', 'gui_value'], [0.0, 0.0], [10.0, 500.0]]"
+    a_out.halPin = 'hardware-sim.0.a-out-0'
+    return tool_model
+
+
+def test_HalReader_findPins_analog(reader, monkeypatch):
+    for cls in [DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode]:
+        monkeypatch.setattr(cls, 'hal_pins', cls.hal_pins)
+
+    output = (b'    10  bit   IN          FALSE  hardware-sim.0.d-out-0\n'
+              b'    12  float OUT      0.500000  hardware-sim.0.a-in-0\n'
+              b'    12  s32   OUT             0  hardware-sim.0.counts\n'
+              b'    12  float IN              0  hardware-sim.0.a-out-0\n')
+    reader.findPins(output)
+
+    assert AnalogInputNode.hal_pins  == ['None', 'hardware-sim.0.a-in-0', 'hardware-sim.0.counts']
+    assert AnalogOutputNode.hal_pins == ['None', 'hardware-sim.0.a-out-0']
+
+
+def test_HalReader_analog_fake_hal(qtbot, analog_tool_model, monkeypatch, tmp_path):
+    for cls in [DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode]:
+        monkeypatch.setattr(cls, 'hal_pins', cls.hal_pins)
+
+    transport = fake_transport(analog_tool_model)
+    transport.addPin('hardware-sim.0.a-in-0', 'float', 'OUT')
+    transport.addPin('hardware-sim.0.a-out-0', 'float', 'IN')
+
+    reader = HalReader(transport)
+    reader.setModel(analog_tool_model)
+    reader.setSamplerMode('thread')
+    reader.setHalScriptPath(str(tmp_path / 'linuxnano.hal'))
+    reader.start()
+    reader.timer.stop()
+
+    assert reader.samplerCfg() == 'bbbbbbbff'
+    assert reader.streamerCfg() == 'bbbbf'
+
+    def sampled(node, value):
+        reader.readSampler()
+        return node.value() == pytest.approx(value)
+
+    gauge, setpoint = [index.internalPointer() for index in reader.analogIndexes()]
+    transport.setPin('hardware-sim.0.a-in-0', 7.5)
+    transport.sample(1)
+    qtbot.waitUntil(lambda: sampled(gauge, 550.0), timeout=2000)
+
+    #GUI units go out as HAL units, then come back through the sampler calibrated
+    setpoint.manualQueuePut(250.0)
+    reader.writeStreamer()
+    qtbot.waitUntil(lambda: transport.pin('hardware-sim.0.a-out-0') == pytest.approx(5.0), timeout=2000)
+
+    transport.sample(1)
+    qtbot.waitUntil(lambda: sampled(setpoint, 250.0), timeout=2000)
+    reader.stop()
+
+
+def test_HalReader_analog_fake_hal_s32_output(qtbot, analog_tool_model, monkeypatch, tmp_path):
+    for cls in [DigitalInputNode, DigitalOutputNode, AnalogInputNode, AnalogOutputNode]:
+        monkeypatch.setattr(cls, 'hal_pins', cls.hal_pins)
+
+    transport = fake_transport(analog_tool_model)
+    transport.addPin('hardware-sim.0.a-in-0', 'float', 'OUT')
+    transport.addPin('hardware-sim.0.a-out-0', 's32', 'IN')
+
+    reader = HalReader(transport)
+    reader.setModel(analog_tool_model)
+    reader.setSamplerMode('thread')
+    reader.setHalScriptPath(str(tmp_path / 'linuxnano.hal'))
+    reader.start()
+    reader.timer.stop()
+    assert reader.streamerCfg() == 'bbbbs'
+
+    #420 is 42.0 in HAL units, an s32 slot has to go out as 42 not 42.000000
+    gauge, setpoint = [index.internalPointer() for index in reader.analogIndexes()]
+    setpoint.calibrationTableData = "[['hal_value', 'gui_value'], [0.0, 0.0], [100.0, 1000.0]]"
+    setpoint.manualQueuePut(420.0)
+    reader.writeStreamer()
+    qtbot.waitUntil(lambda: transport.pin('hardware-sim.0.a-out-0') == 42, timeout=2000)
+    reader.stop()
+
+
+def test_HalReader_analog_states(analog_tool_model):
+    reader = HalReader()
+    reader.setModel(analog_tool_model)
+
+    analog_pins = ['hardware-sim.0.a-in-0', 'hardware-sim.0.a-out-0']
+    reader.routes().assignSlots(analog_tool_model, analog_pins, [])
+    gauge, setpoint = [index.internalPointer() for index in reader.analogIndexes()]
+    gauge.stateTableData = "[['state', 'greater_than', 'gui_name'], [0, None, 'Vac'], [1, 100.0, 'Low'], [2, 700.0, 'Atmo']]"
+
+    device = gauge.parent()
+    device_state = device.stateFromChildren()
+
+    reader.applySamples(np.array([[7.5, 0.0]]))
+    assert gauge.value() == pytest.approx(550.0)
+    assert gauge.state() == 1
+
+    #The gauge feeds the device state, its bit weight is the product of the states before it
+    weight = 1
+    for child in device.children():
+        if child is gauge:
+            break
+        if child.typeInfo() != strings.DEVICE_ICON_NODE:
+            weight *= len(child.states)
+    assert device.stateFromChildren() == device_state + weight
+
+    reader.applySamples(np.array([[9.0, 0.0], [1.0, 0.0]]))
+    assert gauge.state() == 0
+    reader.updateDevices()
+
+
+def test_HalReader_debounce(reader):
+    #Sampler pins: phase-A, phase-B, d-in-0, d-out-0, d-out-1, d-out-2, d-out-3
+    node = reader.samplerIndexes()[3].internalPointer()
+    node.debounce = 3
+    changes = []
+    reader.model().dataChanged.connect(lambda index, _: changes.append(index.internalPointer()))
+
+    reader.readSampler([sampler_line(i, [0,0,bit,0,0,0,0]) for i, bit in enumerate([1,0,1,1])])
+    assert values(reader)[3] == 0
+    assert changes == []
+
+    reader.readSampler([sampler_line(4, [0,0,1,0,0,0,0])])
+    assert values(reader)[3] == 1
+    assert changes == [node]
+    assert reader.takeEdges() == [(4, node, 0, 1)]
+
+
+def test_HalReader_debounce_ms(reader):
+    node = reader.samplerIndexes()[3].internalPointer()
+    node.debounceUnit = 'ms'
+    node.debounce = 250
+    reader.setSamplePeriod(0.1)
+    assert node.debounceSamples(reader.samplePeriod()) == 3
+
+    reader.readSampler([sampler_line(i, [0,0,1,0,0,0,0]) for i in range(2)])
+    assert values(reader)[3] == 0
+    reader.readSampler([sampler_line(2, [0,0,1,0,0,0,0])])
+    assert values(reader)[3] == 1
+
+
+def test_HalReader_analog_hysteresis(analog_tool_model):
+    reader = HalReader()
+    reader.setModel(analog_tool_model)
+    reader.routes().assignSlots(analog_tool_model, ['hardware-sim.0.a-in-0'], [])
+
+    gauge = reader.analogIndexes()[0].internalPointer()
+    gauge.calibrationTableData = "[['hal_value', 'gui_value'], [0.0, 0.0], [10.0, 200.0]]"
+    gauge.stateTableData = "[['state', 'greater_than', 'gui_name'], [0, None, 'Vac'], [1, 100.0, 'Low']]"
+    gauge.hysteresis = 20.0
+
+    #5.0 is 100 in GUI units, the state only changes 10 past the threshold
+    reader.applySamples(np.array([[5.25], [4.75]]))
+    assert gauge.state() == 0
+    reader.applySamples(np.array([[5.75]]))
+    assert gauge.state() == 1
+    reader.applySamples(np.array([[4.75], [5.25]]))
+    assert gauge.state() == 1
+    reader.applySamples(np.array([[4.25]]))
+    assert gauge.state() == 0
+
+
+def test_HalReader_analog_reduction(analog_tool_model):
+    reader = HalReader()
+    reader.setModel(analog_tool_model)
+    reader.routes().assignSlots(analog_tool_model, ['hardware-sim.0.a-in-0'], [])
+
+    gauge = reader.analogIndexes()[0].internalPointer()
+    gauge.reduction = 'mean'
+    reader.applySamples(np.array([[1.0], [2.0], [3.0], [4.0]]))
+    assert gauge.value() == pytest.approx(50.0)
+
+    gauge.reduction = 'max'
+    reader.applySamples(np.array([[1.0], [4.0], [2.0]]))
+    assert gauge.value() == pytest.approx(80.0)
+
+    gauge.reduction = 'last'
+    reader.applySamples(np.array([[1.0], [4.0], [2.0]]))
+    assert gauge.value() == pytest.approx(40.0)
+
+
+def test_HalReader_analog_reduction_notifier(analog_tool_model):
+    reader = HalReader()
+    reader.setModel(analog_tool_model)
+    reader.routes().assignSlots(analog_tool_model, ['hardware-sim.0.a-in-0'], [])
+
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    reader._sampler_fd = read_fd
+    reader._sampler_partial = b''
+    reader._sampler_notifier = QtCore.QSocketNotifier(read_fd, QtCore.QSocketNotifier.Read)
+
+    #Two wake-ups in one tick are reduced together, not one chunk at a time
+    gauge = reader.analogIndexes()[0].internalPointer()
+    gauge.reduction = 'mean'
+    os.write(write_fd, b'0 1.0 \n1 2.0 \n')
+    reader.onSamplerReadable()
+    os.write(write_fd, b'2 3.0 \n3 4.0 \n')
+    reader.onSamplerReadable()
+    reader.processData()
+    assert gauge.value() == pytest.approx(50.0)
+
+    gauge.reduction = 'max'
+    os.write(write_fd, b'4 4.0 \n')
+    reader.onSamplerReadable()
+    os.write(write_fd, b'5 1.0 \n')
+    reader.onSamplerReadable()
+    reader.processData()
+    assert gauge.value() == pytest.approx(80.0)
+
+    os.close(write_fd)
+    os.close(read_fd)
+
+
+def test_HalReader_readSampler_analog_only(qapp):
+    tool_model = ToolModel()
+    tool_index = tool_model.insertChild(tool_model.createIndex(0, 0, tool_model._root_node), strings.TOOL_NODE)
+    system_index = tool_model.insertChild(tool_index, strings.SYSTEM_NODE)
+    device_index = tool_model.insertChild(system_index, strings.DEVICE_NODE)
+    tool_model.insertChild(device_index, strings.DEVICE_ICON_NODE)
+
+    gauge = tool_model.insertChild(device_index, strings.A_IN_NODE).internalPointer()
+    gauge.calibrationTableData = "[['hal_value', 'gui_value'], [0.0, 0.0], [10.0, 200.0]]"
+    gauge.halPin = 'hardware-sim.0.a-in-0'
+
+    reader = HalReader()
+    reader.setModel(tool_model)
+    reader.routes().assignSlots(tool_model, ['hardware-sim.0.a-in-0'], [])
+    assert reader.samplerIndexes() == []
+
+    #No digital nodes, the analog channel still has to be read
+    reader.readSampler([b'0 7.5 \n', b'1 7.5 \n'])
+    assert gauge.value() == pytest.approx(150.0)
+    assert reader.sampler_queue.lines == 2
+
+
+def test_HalReader_settings_keep_device_states(analog_tool_model):
+    reader = HalReader()
+    reader.setModel(analog_tool_model)
+    reader.routes().assignSlots(analog_tool_model, ['hardware-sim.0.a-in-0'], [])
+
+    gauge = reader.analogIndexes()[0].internalPointer()
+    table_model = gauge.parent().deviceStateTableModel()
+    table_model.setData(table_model.index(1, table_model.statusColumn()), 'fault')
+    device_states = table_model.deviceStates()
+    assert len(device_states) == 2
+
+    #Reading settings rebuild the routes but don't touch the device's truth table
+    for attr, value in [('debounce', 3), ('debounceUnit', 'ms'), ('hysteresis', 5.0), ('reduction', 'mean'),
+                        ('emaAlpha', 0.25), ('scaleType', 'cubic_spline'), ('halPin', 'hardware-sim.0.a-in-1')]:
+        setattr(gauge, attr, value)
+        assert reader._routes.isDirty()
+        assert table_model.deviceStates() == device_states
+        reader.routes()
+
+
+def test_HalReader_settings_scoped_to_model(reader):
+    reader.routes()
+    other_model = ToolModel()
+    other_model.loadTool(ET.parse('tests/tools/tool_model_1.xml'))
+    other = HalReader()
+    other.setModel(other_model)
+    other.routes()
+
+    #A setting changed in one tool only rebuilds the routes of readers on that tool
+    other_model.indexesOfType(strings.D_IN_NODE)[0].internalPointer().debounce = 2
+    assert other._routes.isDirty()
+    assert not reader._routes.isDirty()
+
+    #Nodes removed from the model stop signalling it
+    node = reader.samplerIndexes()[3].internalPointer()
+    reader.model().removeRows(node.row(), 1, reader.samplerIndexes()[3].parent())
+    reader.routes()
+    node.debounce = 4
+    assert not reader._routes.isDirty()
+
+
+def test_HalReader_updateDevices_only_changed(reader, monkeypatch):
+    reader.updateDevices() #Everything is recomputed once after the routes are built
+
+    recomputed = []
+    deviceStates = reader.deviceStates
+    def countedDeviceStates(rows=None):
+        recomputed.extend(rows)
+        return deviceStates(rows)
+    monkeypatch.setattr(reader, 'deviceStates', countedDeviceStates)
+
+    reader.processData()
+    assert recomputed == []
+
+    #d-in-0 only feeds the second device
+    reader.readSampler([sampler_line(0, [0,0,1,0,0,0,0])])
+    reader.updateDevices()
+    assert recomputed == [1]
+
+    reader.updateDevices()
+    assert recomputed == [1]
+
+
+def test_HalReader_deviceStates(analog_tool_model):
+    reader = HalReader()
+    reader.setModel(analog_tool_model)
+
+    hal_pins = ['hardware-sim.0.a-in-0']
+    for type_info in [strings.D_IN_NODE, strings.D_OUT_NODE]:
+        for index in analog_tool_model.indexesOfType(type_info):
+            hal_pins += index.internalPointer().halPins
+    reader.routes().assignSlots(analog_tool_model, hal_pins, [])
+
+    gauge = reader.analogIndexes()[0].internalPointer()
+    gauge.stateTableData = "[['state', 'greater_than', 'gui_name'], [0, None, 'Vac'], [1, 100.0, 'Low'], [2, 700.0, 'Atmo']]"
+
+    devices = [index.internalPointer() for index in reader.routes().device_indexes]
+    for block in [[1,0,1,0,1,1,0, 7.5], [0,1,0,1,1,0,1, 9.5], [1,1,1,1,0,1,1, 0.0]]:
+        reader.applySamples(np.array([block], dtype=np.float64))
+        assert reader.deviceStates().tolist() == [device.stateFromChildren() for device in devices]
+
+    assert reader.deviceStates([1]).tolist() == [devices[1].stateFromChildren()]
+
+
+def test_HalRoutes_packImage():
+    bits = np.zeros((2, 70), dtype=np.uint8)
+    bits[0, [0, 3, 64]] = 1
+    bits[1, 69] = 1
+
+    image = HalRoutes.packImage(bits)
+    assert image.shape == (2, 2)
+    assert image.tolist() == [[1 | 1<<3, 1], [0, 1<<5]]
+
+
+def test_HalRoutes_sampler_masks(reader):
+    routes = reader.routes()
+    assert routes.sampler_masks.shape == (len(routes.sampler_nodes), 1)
+
+    #Sampler pins: phase-A, phase-B, d-in-0, d-out-0, d-out-1, d-out-2, d-out-3
+    assert routes.sampler_masks[:, 0].tolist() == [0b1, 0b10, 0b1, 0b100, 0b11000, 0b1100000]
+
+
+def test_HalReader_readSampler_unchanged_image(reader, monkeypatch):
+    reader.readSampler([sampler_line(0, [1,0,1,0,1,1,0])])
+    edges = reader.takeEdges()
+
+    #Samples equal to the last one never reach the node values
+    monkeypatch.setattr(reader.routes(), 'sampler_weights', None)
+    reader.readSampler([sampler_line(i, [1,0,1,0,1,1,0]) for i in range(1, 50)])
+    assert reader.takeEdges() == []
+    assert values(reader) == [1, 0, 1, 1, 2, 1]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+import numpy as np
+
+from linuxnano.analog_state_table_model import AnalogStateTableModel, AnalogStateClassifier
+from linuxnano.signal_filters import Debouncer, Hysteresis, Reduction
+
+
+def test_Debouncer_inactive():
+    debouncer = Debouncer([0, 1], [0, 0])
+    values = np.array([[1, 0], [0, 1]])
+
+    assert not debouncer.active()
+    assert debouncer.filter(values) is values
+
+
+def test_Debouncer_filter():
+    debouncer = Debouncer([3, 1], [0, 0])
+    values = np.array([[1, 1], [0, 0], [1, 1], [1, 1], [1, 0], [0, 0]])
+
+    assert debouncer.filter(values).tolist() == [[0, 1], [0, 0], [0, 1], [0, 1], [1, 0], [1, 0]]
+
+
+def test_Debouncer_carries_runs_between_blocks():
+    debouncer = Debouncer([3], [0])
+
+    assert debouncer.filter(np.array([[0], [1], [1]])).tolist() == [[0], [0], [0]]
+    assert debouncer.filter(np.array([[1], [0]])).tolist() == [[1], [1]]
+    assert debouncer.filter(np.array([[0]])).tolist() == [[1]]
+    assert debouncer.filter(np.array([[0]])).tolist() == [[0]]
+
+
+@pytest.fixture
+def classifier():
+    model = AnalogStateTableModel()
+    model.setDataArray([['state', 'greater_than', 'gui_name'], [0, None, 'Low'], [1, 10.0, 'Mid'], [2, 20.0, 'High']])
+    return AnalogStateClassifier([model, model])
+
+
+def test_Hysteresis_without_band(classifier):
+    hysteresis = Hysteresis(classifier, [0.0, 0.0], [0, 0])
+    values = np.array([[9.9, 10.0], [20.5, 19.0]])
+
+    assert not hysteresis.active()
+    assert hysteresis.filter(values).tolist() == [[0, 1], [2, 1]]
+
+
+def test_Hysteresis_filter(classifier):
+    hysteresis = Hysteresis(classifier, [2.0, 0.0], [0, 0])
+    values = np.array([[10.5, 10.5], [11.5, 9.5], [9.5, 9.5], [8.5, 10.5], [10.5, 10.5], [25.0, 25.0], [19.5, 19.5]])
+
+    assert hysteresis.filter(values).tolist() == [[0, 1], [1, 0], [1, 0], [0, 1], [0, 1], [2, 2], [2, 1]]
+    assert hysteresis.filter(np.array([[18.5, 18.5]])).tolist() == [[1, 1]]
+
+
+def test_Reduction_reduce():
+    reduction = Reduction(['last', 'mean', 'median', 'min', 'max'], [0.5]*5)
+    values = np.array([[1.0, 1.0, 1.0, 1.0, 1.0],
+                       [9.0, 9.0, 9.0, 9.0, 9.0],
+                       [2.0, 2.0, 2.0, 2.0, 2.0]])
+
+    assert reduction.reduce(values).tolist() == [2.0, 4.0, 2.0, 1.0, 9.0]
+
+
+def test_Reduction_ema():
+    alphas = [0.5, 0.1]
+    reduction = Reduction(['ema', 'ema'], alphas)
+    blocks = [np.array([[4.0, 4.0], [8.0, 8.0]]), np.array([[0.0, 0.0]]), np.array([[2.0, 2.0], [6.0, 6.0], [1.0, 1.0]])]
+
+    #Same as averaging one sample at a time, starting from the first sample
+    expected = np.array([4.0, 4.0])
+    for block in blocks:
+        for row in block:
+            expected += np.array(alphas)*(row - expected)
+        assert reduction.reduce(block) == pytest.approx(expected)
@@ -287,3 +287,89 @@ def test_ToolModel_parent(tool_model_1):
 
 
 
+
+
+def walkIndexesOfType(tool_model, index_type, parent_index):
+    indexes = []
+    for row in range(tool_model.rowCount(parent_index)):
+        index = tool_model.index(row, 0, parent_index)
+        if index.internalPointer().typeInfo() == index_type:
+            indexes.append(index)
+        indexes += walkIndexesOfType(tool_model, index_type, index)
+    return indexes
+
+
+@pytest.fixture()
+def tool_model_file():
+    tool_model = ToolModel()
+    tool_model.loadTool(ET.parse('tests/tools/tool_model_1.xml'))
+    return tool_model
+
+
+def test_ToolModel_nodesOfType(tool_model_file):
+    tool_index = tool_model_file.index(0, 0, QtCore.QModelIndex())
+    types = [strings.SYSTEM_NODE, strings.DEVICE_NODE, strings.DEVICE_ICON_NODE, strings.D_IN_NODE, strings.D_OUT_NODE]
+
+    for node_type in types:
+        walked = walkIndexesOfType(tool_model_file, node_type, tool_index)
+        assert tool_model_file.indexesOfType(node_type, tool_index) == walked
+        assert tool_model_file.nodesOfType(node_type) == [index.internalPointer() for index in walked]
+
+    device_index = tool_model_file.indexesOfType(strings.DEVICE_NODE)[1]
+    children = device_index.internalPointer().children()
+    assert tool_model_file.nodesOfType(strings.D_IN_NODE, device_index) == [node for node in children if node.typeInfo() == strings.D_IN_NODE]
+
+
+def test_ToolModel_nodesOfType_insert_remove(tool_model_file):
+    system_index = tool_model_file.indexesOfType(strings.SYSTEM_NODE)[0]
+    first_device = tool_model_file.indexesOfType(strings.DEVICE_NODE)[0]
+
+    #Inserting ahead of the other devices keeps tree order
+    new_index = tool_model_file.insertChild(system_index, strings.DEVICE_NODE, 0)
+    tool_model_file.insertChild(new_index, strings.DEVICE_ICON_NODE)
+    d_in_index = tool_model_file.insertChild(new_index, strings.D_IN_NODE)
+    assert tool_model_file.nodesOfType(strings.DEVICE_NODE)[0] is new_index.internalPointer()
+    assert tool_model_file.nodesOfType(strings.D_IN_NODE)[0] is d_in_index.internalPointer()
+
+    tool_model_file.removeRows(0, 1, system_index)
+    assert new_index.internalPointer() not in tool_model_file.nodesOfType(strings.DEVICE_NODE)
+    assert d_in_index.internalPointer() not in tool_model_file.nodesOfType(strings.D_IN_NODE)
+    assert tool_model_file.nodesOfType(strings.DEVICE_NODE)[0] is first_device.internalPointer()
+
+
+def test_ToolModel_nodesOfType_subtrees(tool_model_file):
+    system_index = tool_model_file.indexesOfType(strings.SYSTEM_NODE)[0]
+    for row in [0, 2, 1]:
+        device_index = tool_model_file.insertChild(system_index, strings.DEVICE_NODE, row)
+        tool_model_file.insertChild(device_index, strings.DEVICE_ICON_NODE)
+        tool_model_file.insertChild(device_index, strings.D_IN_NODE)
+        tool_model_file.insertChild(device_index, strings.D_OUT_NODE)
+    tool_model_file.removeRows(2, 1, system_index)
+
+    #The registry stays in tree order through the inserts and removes, so every subtree is one slice of it
+    tool_index = tool_model_file.index(0, 0, QtCore.QModelIndex())
+    for parent_index in [tool_index, system_index] + tool_model_file.indexesOfType(strings.DEVICE_NODE):
+        for node_type in [strings.DEVICE_NODE, strings.D_IN_NODE, strings.D_OUT_NODE]:
+            walked = walkIndexesOfType(tool_model_file, node_type, parent_index)
+            assert tool_model_file.nodesOfType(node_type, parent_index) == [index.internalPointer() for index in walked]
+
+
+def test_ToolModel_loadTool_single_reset(qtbot):
+    tool_model = ToolModel()
+    view = QtWidgets.QTreeView()
+    qtbot.addWidget(view)
+    view.setModel(tool_model)
+
+    signals = []
+    tool_model.rowsInserted.connect(lambda *args: signals.append('rowsInserted'))
+    tool_model.modelReset.connect(lambda: signals.append('modelReset'))
+
+    assert tool_model.loadTool(ET.parse('tests/tools/tool_model_1.xml'))
+    assert signals == ['modelReset']
+
+    tool_index = tool_model.index(0, 0, QtCore.QModelIndex())
+    assert tool_model.rowCount(QtCore.QModelIndex()) == 1
+    assert view.model().rowCount(tool_index) == tool_index.internalPointer().childCount()
+
+    for node_type in [strings.SYSTEM_NODE, strings.DEVICE_NODE, strings.DEVICE_ICON_NODE, strings.D_IN_NODE]:
+        assert tool_model.indexesOfType(node_type) == walkIndexesOfType(tool_model, node_type, tool_index)